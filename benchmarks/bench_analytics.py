@@ -0,0 +1,258 @@
+"""
+Benchmark Logger and Analytics against synthetic play logs.
+
+For each history size a synthetic log is generated (see synthetic_log.py) in
+the old single-table layout and migrated to plays/tracks, reporting both sizes;
+the script then times `Logger.log_track` throughput, `Analytics.load_data` and
+every `get_*` / `create_*` method. Wall time is measured in a plain run; peak heap
+in a separate tracemalloc run so tracing overhead does not skew the timings.
+tracemalloc sees numpy/pandas buffers but not Arrow's memory pool, so the
+process-wide peak RSS is reported as well.
+
+With --backends, the SQL analytics backends are timed on the same log: the
+first open (for sqlite, importing the whole log into its mirror), later opens
+(only syncing new plays), the `get_*` methods, and one requester's stats over
+the last 30 days.
+
+With --approximate, the streaming sketches are built from the log and timed
+(backfill, live update per play, opening and querying SketchAnalytics), and
+their answers are compared with the exact ones: the largest overestimate in
+the top-10 lists, whether the top 10 are the same entries, and the error of
+the distinct listener/track counts.
+
+Usage:
+    python benchmarks/bench_analytics.py [--sizes 10000 100000 1000000]
+        [--log-writes 20] [--skip-charts] [--backends sqlite duckdb]
+        [--approximate] [--no-save]
+
+Results are appended to benchmarks/results/analytics.jsonl.
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from common import result_header, save_result, use_src
+from synthetic_log import generate
+
+use_src()
+
+import matplotlib  # noqa: E402
+matplotlib.use("Agg")
+
+from analytics import Analytics, DuckDBAnalytics, SketchAnalytics, SQLiteAnalytics  # noqa: E402
+from logger import LEGACY_FILE, Logger, migrate_log  # noqa: E402
+from sketches import SketchStore  # noqa: E402
+
+GET_METHODS = [
+    ("get_most_active_hour", ()),
+    ("get_top_posters", (10,)),
+    ("get_longest_posters", (10,)),
+    ("get_top_genres", (10,)),
+    ("get_top_years", (10,)),
+    ("get_most_played_songs", (10,)),
+]
+CREATE_METHODS = [
+    "create_activity_heatmap",
+    "create_top_posters_chart",
+    "create_longest_posters_chart",
+    "create_genres_chart",
+    "create_years_chart",
+    "create_most_played_chart",
+]
+
+SAMPLE_INFO = {
+    "title": "Benchmark Artist - Benchmark Track",
+    "webpage_url": "https://www.youtube.com/watch?v=benchmark00",
+    "genre": "Breakcore",
+    "upload_date": "20240101",
+    "duration": 215,
+}
+
+
+def measure(fn, memory: bool = True) -> dict:
+    """Time fn once untraced, then once under tracemalloc for its peak heap."""
+    start = time.perf_counter()
+    fn()
+    result = {"wall_s": time.perf_counter() - start}
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            result["peak_mib"] = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+BACKENDS = {"sqlite": SQLiteAnalytics, "duckdb": DuckDBAnalytics}
+
+
+def bench_backend(backend, log_dir: str, user_id: int, last_played, memory: bool) -> dict:
+    start = time.perf_counter()
+    analytics = backend(log_dir=log_dir)
+    results = {"first_open": {"wall_s": time.perf_counter() - start}}
+    results["load_data"] = measure(lambda: backend(log_dir=log_dir), memory)
+
+    for name, args in GET_METHODS:
+        results[name] = measure(lambda: getattr(analytics, name)(*args), memory)
+    results["get_user_stats"] = measure(lambda: analytics.get_user_stats(user_id), memory)
+
+    recent = backend(log_dir=log_dir, start_date=last_played - timedelta(days=30), end_date=last_played)
+    results["get_user_stats_30d"] = measure(lambda: recent.get_user_stats(user_id), memory)
+    return results
+
+
+TOP_LISTS = [
+    ("get_top_posters", "user_id", "count"),
+    ("get_longest_posters", "user_id", "duration"),
+    ("get_top_genres", "genre", "count"),
+    ("get_most_played_songs", "title", "count"),
+]
+
+
+def bench_sketches(log_dir: str, exact: Analytics, memory: bool) -> dict:
+    store = SketchStore(log_dir)
+    start = time.perf_counter()
+    store.backfill(log_dir)
+    results = {"backfill": {"wall_s": time.perf_counter() - start}}
+
+    results["load_data"] = measure(lambda: SketchAnalytics(log_dir=log_dir), memory)
+    analytics = SketchAnalytics(log_dir=log_dir)
+    for name, args in GET_METHODS:
+        results[name] = measure(lambda: getattr(analytics, name)(*args), memory)
+
+    accuracy = {}
+    for name, key, value in TOP_LISTS:
+        truth = {entry[key]: entry[value] for entry in getattr(exact, name)(10)}
+        estimate = {entry[key]: entry[value] for entry in getattr(analytics, name)(10)}
+        over = [(estimate[k] - truth[k]) / truth[k] for k in truth if k in estimate and truth[k]]
+        accuracy[name] = {"same_top10": set(truth) == set(estimate), "max_over": max(over, default=0)}
+    for name in ("distinct_listeners", "distinct_tracks"):
+        truth, estimate = getattr(exact, name)(), getattr(analytics, name)()
+        accuracy[name] = {"exact": truth, "estimate": estimate, "error": (estimate - truth) / truth}
+    results["accuracy"] = accuracy
+
+    # last, since it changes the counts compared above
+    row = Logger(log_dir=log_dir)._normalize_info(dict(SAMPLE_INFO), requester_id=1)
+    start = time.perf_counter()
+    for _ in range(200):
+        store.add(row)
+    results["add"] = {"wall_s": (time.perf_counter() - start) / 200}
+    return results
+
+
+def bench_size(rows: int, workdir: str, log_writes: int, charts: bool, memory: bool,
+               backends: list, approximate: bool) -> dict:
+    log_dir = os.path.join(workdir, f"log_{rows}")
+    os.makedirs(log_dir, exist_ok=True)
+    generate(rows, seed=rows).to_parquet(os.path.join(log_dir, LEGACY_FILE), index=False)
+
+    start = time.perf_counter()
+    migration = migrate_log(log_dir)
+    results = {
+        "rows": rows,
+        "legacy_log_bytes": migration["legacy_bytes"],
+        "log_bytes": migration["bytes"],
+        "tracks": migration["tracks"],
+        "migrate_s": time.perf_counter() - start,
+    }
+
+    logger = Logger(log_dir=log_dir)
+    start = time.perf_counter()
+    for _ in range(log_writes):
+        logger.log_track(dict(SAMPLE_INFO), requester_id=1)
+    elapsed = time.perf_counter() - start
+    results["log_track"] = {"writes": log_writes, "wall_s": elapsed, "writes_per_s": log_writes / elapsed}
+
+    results["load_data"] = measure(lambda: Analytics(log_dir=log_dir), memory)
+    analytics = Analytics(log_dir=log_dir)
+
+    for name, args in GET_METHODS:
+        results[name] = measure(lambda: getattr(analytics, name)(*args), memory)
+    top_user = int(analytics.plays["requester_id"].value_counts().index[0])
+    results["get_user_stats"] = measure(lambda: analytics.get_user_stats(top_user), memory)
+
+    if charts:
+        out_dir = os.path.join(workdir, "visualizations")
+        for name in CREATE_METHODS:
+            path = os.path.join(out_dir, f"{name}.png")
+            results[name] = measure(lambda: getattr(analytics, name)(output_path=path), memory)
+        path = os.path.join(out_dir, "user_summary.png")
+        results["create_user_summary"] = measure(
+            lambda: analytics.create_user_summary(top_user, output_path=path), memory
+        )
+
+    if approximate:
+        results["sketches"] = bench_sketches(log_dir, analytics, memory)
+
+    last_played = analytics.plays["played_at"].max().to_pydatetime()
+    results["backends"] = {
+        name: bench_backend(BACKENDS[name], log_dir, top_user, last_played, memory) for name in backends
+    }
+    return results
+
+
+def print_results(results: dict):
+    print(f"\n== {results['rows']:,} rows, {results['tracks']:,} tracks "
+          f"({results['legacy_log_bytes'] / 2**20:.1f} MiB single-table -> "
+          f"{results['log_bytes'] / 2**20:.1f} MiB plays+tracks, "
+          f"migrated in {results['migrate_s']:.1f} s) ==")
+    log = results["log_track"]
+    print(f"  {'log_track':30s} {log['writes_per_s']:10.1f} writes/s")
+    print_timings(results)
+    for backend, timings in results.get("backends", {}).items():
+        print(f"  -- {backend} --")
+        print_timings(timings)
+    if "sketches" in results:
+        print("  -- sketches --")
+        print_timings(results["sketches"])
+        for name, value in results["sketches"]["accuracy"].items():
+            if "error" in value:
+                print(f"  {name:30s} {value['estimate']} vs {value['exact']} ({value['error']:+.2%})")
+            else:
+                print(f"  {name:30s} top 10 {'same' if value['same_top10'] else 'DIFFERENT'}, "
+                      f"max overestimate {value['max_over']:.3%}")
+
+
+def print_timings(results: dict):
+    for name, value in results.items():
+        if not isinstance(value, dict) or "wall_s" not in value or name == "log_track":
+            continue
+        peak = f"{value['peak_mib']:9.1f} MiB" if "peak_mib" in value else ""
+        print(f"  {name:30s} {value['wall_s'] * 1000:10.1f} ms {peak}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Logger and Analytics at scale.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--log-writes", type=int, default=20)
+    parser.add_argument("--skip-charts", action="store_true")
+    parser.add_argument("--backends", nargs="*", choices=list(BACKENDS), default=[])
+    parser.add_argument("--approximate", action="store_true")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.sizes:
+            results = bench_size(rows, workdir, args.log_writes, not args.skip_charts, not args.no_memory,
+                                 args.backends, args.approximate)
+            print_results(results)
+            runs.append(results)
+
+    summary = {
+        **result_header("analytics"),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "sizes": runs,
+    }
+    if not args.no_save:
+        save_result("analytics", summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark hedged search against a stubbed, heavy-tailed extractor.
+
+The stub stands in for yt-dlp: most lookups answer in a few hundred
+milliseconds, but a fraction hang for many seconds, like a stalled YouTube
+search riding out its retries. Each mode resolves the same number of unique
+queries through `music.search`:
+
+    unhedged    one attempt, no cutoff (the old behaviour)
+    retry       hedge with a second attempt of the same query
+    soundcloud  hedge with an scsearch1 query against the backup source
+
+All latencies are multiplied by --time-scale to keep runs short; the hedge
+delay and timeout are scaled with them.
+
+Usage:
+    python benchmarks/bench_search.py [--searches 300] [--concurrency 20]
+        [--hang-rate 0.1] [--time-scale 0.1] [--no-save]
+
+Results are appended to benchmarks/results/search.jsonl.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import result_header, save_result, use_src
+
+use_src()
+
+MODES = {
+    "unhedged": {"hedge_after": float("inf"), "timeout": float("inf"), "backup": ""},
+    "retry": {"backup": ""},
+    "soundcloud": {"backup": "scsearch1"},
+}
+
+
+class HeavyTailYDL:
+    """Stands in for yt_dlp.YoutubeDL with a heavy-tailed search latency."""
+
+    def __init__(self, hang_rate, scale):
+        self.hang_rate = hang_rate
+        self.scale = scale
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def extract_info(self, query, download=False):
+        source = query.split(":", 1)[0]
+        with self.lock:
+            self.calls[source] = self.calls.get(source, 0) + 1
+        if random.random() < self.hang_rate:
+            latency = random.uniform(8, 20)
+        elif source.startswith("sc"):
+            latency = random.lognormvariate(-0.4, 0.4)
+        else:
+            latency = random.lognormvariate(-0.9, 0.4)
+        time.sleep(latency * self.scale)
+        video_id = f"{random.getrandbits(48):012x}"[:11]
+        return {
+            "entries": [{
+                "title": query,
+                "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+                "duration": 200,
+            }],
+            "extractor_key": "YoutubeSearch",
+        }
+
+
+def percentiles(values: list) -> dict:
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99), "max_ms": ordered[-1] * 1000}
+
+
+async def run_mode(music, metrics, name, options, args) -> dict:
+    stub = HeavyTailYDL(args.hang_rate, args.time_scale)
+    music.search_ytdl = stub
+    options = {
+        "hedge_after": music.SEARCH_HEDGE_AFTER * args.time_scale,
+        "timeout": music.SEARCH_TIMEOUT * args.time_scale,
+        **options,
+    }
+    before = dict(metrics.SEARCH_TOTAL.values)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await music.search(f"{name} query {i}", **options)
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(args.searches)))
+    outcomes = {}
+    for key, count in metrics.SEARCH_TOTAL.values.items():
+        labels = dict(key)
+        label = labels["winner"] + ("+hedged" if labels["hedged"] == "true" else "")
+        if count - before.get(key, 0):
+            outcomes[label] = count - before.get(key, 0)
+    return {"latency": percentiles(latencies), "failures": failures,
+            "extract_calls": stub.calls, "outcomes": outcomes}
+
+
+async def run(args) -> dict:
+    import metrics
+    import music
+
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=256))
+    modes = {}
+    for name in args.modes:
+        modes[name] = await run_mode(music, metrics, name, MODES[name], args)
+    return {
+        **result_header("search"),
+        "searches": args.searches,
+        "concurrency": args.concurrency,
+        "hang_rate": args.hang_rate,
+        "time_scale": args.time_scale,
+        "modes": modes,
+    }
+
+
+def print_report(result: dict):
+    print(f"{result['searches']} searches per mode, hang rate {result['hang_rate']:.0%}, "
+          f"latencies x{result['time_scale']}")
+    print(f"{'mode':11s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s} {'failed':>7s}  outcomes")
+    for name, mode in result["modes"].items():
+        lat = mode["latency"]
+        outcomes = ", ".join(f"{key}={count}" for key, count in sorted(mode["outcomes"].items()))
+        print(f"{name:11s} {lat['p50_ms']:7.1f}ms {lat['p95_ms']:7.1f}ms {lat['p99_ms']:7.1f}ms "
+              f"{lat['max_ms']:7.1f}ms {mode['failures']:7d}  {outcomes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hedged search with a stubbed extractor.")
+    parser.add_argument("--searches", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--hang-rate", type=float, default=0.1)
+    parser.add_argument("--time-scale", type=float, default=0.1)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    # The bot modules open their state databases relative to the working directory.
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        result = asyncio.run(run(args))
+
+    print_report(result)
+    if not args.no_save:
+        save_result("search", result)
+
+
+if __name__ == "__main__":
+    main()
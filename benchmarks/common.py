@@ -0,0 +1,42 @@
+"""Shared helpers for the benchmark scripts."""
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT, "src")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def use_src():
+    """Make the bot modules in src/ importable."""
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def result_header(benchmark: str) -> dict:
+    return {
+        "benchmark": benchmark,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+    }
+
+
+def save_result(name: str, result: dict):
+    """Append a result as a JSON line to benchmarks/results/<name>.jsonl."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, f"{name}.jsonl"), "a") as f:
+        f.write(json.dumps(result, default=str) + "\n")
@@ -0,0 +1,468 @@
+"""
+Offline load test: many simulated guilds driving MusicPlayer and the command
+callbacks from `commands.setup` concurrently.
+
+Discord objects (context, guild, member, voice client, channel) are faked and
+yt-dlp/ffmpeg are stubbed, so no network, token or ffmpeg binary is needed.
+The stub extractor blocks its executor thread for a realistic latency, and fake
+voice clients "play" each track for its duration scaled by --time-scale, calling
+the `after` callback from another thread like discord.py's audio player.
+
+Every guild issues a random mix of p, pl, s, shuffle, seek and q. The report
+covers event-loop lag (overshoot of a 10 ms ticker), per-command latency
+percentiles, memory growth and what the idle reaper reclaims once the load
+stops. The loop watchdog runs alongside and reports
+where the loop was blocked; with --fail-on-block the run exits non-zero if any
+block exceeded --block-threshold-ms, so it can gate CI.
+
+Usage:
+    python benchmarks/load_test.py [--guilds 200] [--duration 30] [--no-save]
+        [--block-threshold-ms 250] [--fail-on-block]
+
+Results are appended to benchmarks/results/load_test.jsonl.
+"""
+import argparse
+import asyncio
+import collections
+import gc
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from common import result_header, save_result, use_src
+
+use_src()
+os.environ.pop("DISCORD_CHANNEL_ID", None)
+# there is no real stream to measure
+os.environ["LOUDNESS_NORMALIZE"] = "0"
+
+import discord  # noqa: E402
+from discord.ext import commands  # noqa: E402
+
+COMMAND_WEIGHTS = {"p": 40, "pl": 5, "q": 25, "s": 12, "shuffle": 8, "seek": 10}
+
+
+# ---------------------------------------
+# Stubbed yt-dlp / ffmpeg
+# ---------------------------------------
+class StubYDL:
+    """Stands in for yt_dlp.YoutubeDL; blocks like a real network lookup."""
+
+    def __init__(self, latency=(0.05, 0.25), playlist_size=25):
+        self.latency = latency
+        self.playlist_size = playlist_size
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _info(self, key: str) -> dict:
+        rnd = random.Random(key)
+        video_id = f"{rnd.getrandbits(48):012x}"[:11]
+        return {
+            "id": video_id,
+            "title": f"Stub Track {key[-24:]}",
+            "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+            "url": f"https://stream.invalid/{video_id}",
+            "duration": rnd.randint(90, 420),
+            "genre": rnd.choice(["Breakcore", "Jungle", "IDM", None]),
+            "upload_date": f"20{rnd.randint(10, 24)}0{rnd.randint(1, 9)}1{rnd.randint(0, 9)}",
+            "extractor_key": "Youtube",
+        }
+
+    def extract_info(self, query, download=False):
+        with self.lock:
+            self.calls += 1
+        time.sleep(random.uniform(*self.latency))
+        if "playlist" in query:
+            return {"entries": [self._info(f"{query}#{i}") for i in range(self.playlist_size)]}
+        if query.startswith("ytsearch"):
+            return {"entries": [self._info(query)], "extractor_key": "YoutubeSearch"}
+        return self._info(query)
+
+    def prepare_filename(self, data):
+        return data["url"]
+
+
+class StubAudio(discord.AudioSource):
+    """Replaces FFmpegPCMAudio without spawning ffmpeg."""
+
+    def __init__(self, source, *args, **kwargs):
+        self.source = source
+
+    def read(self):
+        return b"\x00" * 3840
+
+    def cleanup(self):
+        pass
+
+
+# ---------------------------------------
+# Fake Discord objects
+# ---------------------------------------
+class FakeVoiceClient:
+    def __init__(self, guild, channel, time_scale):
+        self.guild = guild
+        self.channel = channel
+        self.time_scale = time_scale
+        self.source = None
+        self._after = None
+        self._timer = None
+        self._paused = False
+
+    def is_playing(self):
+        return self._timer is not None and not self._paused
+
+    def is_paused(self):
+        return self._timer is not None and self._paused
+
+    def play(self, source, *, after=None):
+        if self._timer is not None:
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self._after = after
+        duration = (getattr(source, "data", None) or {}).get("duration") or 180
+        self._timer = threading.Timer(duration * self.time_scale, self._finish)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _finish(self):
+        after, self._after, self._timer = self._after, None, None
+        if after:
+            after(None)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            threading.Thread(target=self._finish, daemon=True).start()
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    async def disconnect(self, *, force=False):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.guild.voice_client = None
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, time_scale):
+        self.guild = guild
+        self.id = guild.id * 10 + 1
+        self.time_scale = time_scale
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(0.02)
+        self.guild.voice_client = FakeVoiceClient(self.guild, self, self.time_scale)
+        return self.guild.voice_client
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeMember:
+    def __init__(self, member_id, voice_channel):
+        self.id = member_id
+        self.name = self.display_name = f"user{member_id}"
+        self.mention = f"<@{member_id}>"
+        self.bot = False
+        self.voice = FakeVoiceState(voice_channel)
+
+
+class FakeTextChannel:
+    def __init__(self, guild, rest_latency):
+        self.guild = guild
+        self.id = guild.id * 10 + 2
+        self.rest_latency = rest_latency
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self.rest_latency)
+        self.sent += 1
+
+    def typing(self):
+        return FakeTyping()
+
+
+class FakeTyping:
+    def __await__(self):
+        return asyncio.sleep(0).__await__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeGuild:
+    def __init__(self, guild_id, time_scale, rest_latency):
+        self.id = guild_id
+        self.voice_client = None
+        self.voice_channel = FakeVoiceChannel(self, time_scale)
+        self.text_channel = FakeTextChannel(self, rest_latency)
+        self.members = [FakeMember(guild_id * 100 + i, self.voice_channel) for i in range(5)]
+
+    def get_channel(self, channel_id):
+        return self.text_channel if channel_id == self.text_channel.id else None
+
+    def get_member(self, member_id):
+        return next((m for m in self.members if m.id == member_id), None)
+
+
+class FakeMessage:
+    async def delete(self):
+        pass
+
+
+class FakeContext:
+    def __init__(self, guild, author):
+        self.guild = guild
+        self.author = author
+        self.channel = guild.text_channel
+        self.message = FakeMessage()
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+    def typing(self):
+        return FakeTyping()
+
+
+# ---------------------------------------
+# Measurement
+# ---------------------------------------
+async def loop_lag_monitor(samples: list, stop: asyncio.Event, interval=0.01):
+    """Record how late a fixed-interval ticker wakes up (event-loop lag)."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.50) * 1000,
+        "p95_ms": pick(0.95) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+    }
+
+
+def current_rss_mib() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def drive_guild(bot, guild, deadline, think_time, latencies, errors):
+    rnd = random.Random(guild.id)
+    names, weights = zip(*COMMAND_WEIGHTS.items())
+    loop = asyncio.get_running_loop()
+    counter = 0
+
+    while loop.time() < deadline:
+        await asyncio.sleep(rnd.uniform(*think_time))
+        name = rnd.choices(names, weights)[0]
+        ctx = FakeContext(guild, rnd.choice(guild.members))
+        callback = bot.get_command(name).callback
+        counter += 1
+
+        start = loop.time()
+        try:
+            if name == "p":
+                await callback(ctx, query=f"ytsearch1:guild {guild.id} song {rnd.randint(0, 400)}")
+            elif name == "pl":
+                await callback(ctx, query=f"https://www.youtube.com/playlist?list=g{guild.id}n{counter}")
+            elif name == "s":
+                await callback(ctx, rnd.choice([0, 0, 1, 2, -1]))
+            elif name == "seek":
+                await callback(ctx, position=f"0:{rnd.randint(0, 59):02d}")
+            else:
+                await callback(ctx)
+        except Exception as e:
+            errors[f"{name}: {type(e).__name__}"] = errors.get(f"{name}: {type(e).__name__}", 0) + 1
+        latencies.setdefault(name, []).append(loop.time() - start)
+
+
+async def run(args) -> dict:
+    import music
+    import commands as music_commands
+    from loop_watchdog import LoopWatchdog
+    from reaper import IdleReaper
+
+    stub = StubYDL(latency=(args.extract_min, args.extract_max))
+    music.ytdl = music.pl_ytdl = music.search_ytdl = stub
+    discord.FFmpegPCMAudio = StubAudio
+
+    intents = discord.Intents.default()
+    bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+    bot.loop = asyncio.get_running_loop()
+    presence_updates = 0
+
+    async def change_presence(**kwargs):
+        nonlocal presence_updates
+        presence_updates += 1
+
+    bot.change_presence = change_presence
+    music_commands.setup(bot)
+
+    guilds = [FakeGuild(10_000 + i, args.time_scale, args.rest_latency) for i in range(args.guilds)]
+
+    gc.collect()
+    tracemalloc.start()
+    rss_before = current_rss_mib()
+
+    lag_samples, latencies, errors = [], {}, {}
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(loop_lag_monitor(lag_samples, stop))
+    watchdog = LoopWatchdog(threshold_ms=args.block_threshold_ms, report=False, max_events=1000).start()
+    deadline = asyncio.get_running_loop().time() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        drive_guild(bot, guild, deadline, (args.think_min, args.think_max), latencies, errors)
+        for guild in guilds
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    await watchdog.stop()
+
+    # Stop playback everywhere, then let the reaper reclaim every (now idle) guild.
+    for guild in guilds:
+        if guild.voice_client:
+            guild.voice_client.pause()
+    reclaimed = await IdleReaper(bot, music.players, idle_after=0).sweep()
+    players_left = len(music.players)
+    # queued play log writes land in the scratch directory before it goes away
+    await asyncio.get_running_loop().run_in_executor(None, music.logger.flush)
+
+    gc.collect()
+    traced_current, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        **result_header("load_test"),
+        "guilds": args.guilds,
+        "duration_s": elapsed,
+        "commands": sum(len(v) for v in latencies.values()),
+        "extract_calls": stub.calls,
+        "presence_updates": presence_updates,
+        "messages_sent": sum(g.text_channel.sent for g in guilds),
+        "loop_lag": percentiles(lag_samples),
+        "command_latency": {name: percentiles(values) for name, values in sorted(latencies.items())},
+        "errors": errors,
+        "blocks": summarize_blocks(watchdog.events),
+        "reclaimed": reclaimed,
+        "players_left": players_left,
+        "memory": {
+            "rss_before_mib": rss_before,
+            "rss_after_mib": current_rss_mib(),
+            "traced_retained_mib": traced_current / 2**20,
+            "traced_peak_mib": traced_peak / 2**20,
+        },
+    }
+
+
+def summarize_blocks(events) -> list[dict]:
+    """Group watchdog block events by the innermost bot (src/) frame."""
+    sites = collections.defaultdict(list)
+    for event in events:
+        src_frames = [line for line in event.stack if os.sep + "src" + os.sep in line]
+        site = (src_frames or event.stack or ["<unknown>"])[-1].strip().splitlines()[0]
+        sites[site].append(event)
+    return sorted(
+        (
+            {
+                "site": site,
+                "count": len(group),
+                "max_ms": max(e.duration for e in group) * 1000,
+                "total_ms": sum(e.duration for e in group) * 1000,
+                "stack": "".join(group[0].stack),
+            }
+            for site, group in sites.items()
+        ),
+        key=lambda block: block["total_ms"],
+        reverse=True,
+    )
+
+
+def print_report(result: dict):
+    print(f"{result['guilds']} guilds, {result['commands']} commands in {result['duration_s']:.1f}s "
+          f"({result['extract_calls']} extractions, {result['messages_sent']} messages, "
+          f"{result['presence_updates']} presence updates)")
+    lag = result["loop_lag"]
+    print(f"event-loop lag: p50 {lag['p50_ms']:.1f} ms, p99 {lag['p99_ms']:.1f} ms, max {lag['max_ms']:.1f} ms")
+    print(f"{'command':10s} {'count':>7s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s}")
+    for name, stats in result["command_latency"].items():
+        print(f"{name:10s} {stats['count']:7d} {stats['p50_ms']:7.1f}ms {stats['p95_ms']:7.1f}ms "
+              f"{stats['p99_ms']:7.1f}ms {stats['max_ms']:7.1f}ms")
+    mem = result["memory"]
+    print(f"RSS {mem['rss_before_mib']:.1f} -> {mem['rss_after_mib']:.1f} MiB, "
+          f"retained {mem['traced_retained_mib']:.1f} MiB (peak {mem['traced_peak_mib']:.1f} MiB)")
+    reclaimed = result["reclaimed"]
+    print(f"reaper reclaimed {reclaimed['voice']} voice clients, {reclaimed['player']} players, "
+          f"{reclaimed['ffmpeg']} ffmpeg sources ({result['players_left']} players left)")
+    for error, count in sorted(result["errors"].items()):
+        print(f"error {error}: {count}")
+    for block in result["blocks"]:
+        print(f"loop blocked {block['count']}x (max {block['max_ms']:.0f} ms, total {block['total_ms']:.0f} ms) at {block['site']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline multi-guild load test.")
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--think-min", type=float, default=0.2)
+    parser.add_argument("--think-max", type=float, default=2.0)
+    parser.add_argument("--extract-min", type=float, default=0.05)
+    parser.add_argument("--extract-max", type=float, default=0.25)
+    parser.add_argument("--rest-latency", type=float, default=0.03, help="simulated message send latency")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="track playback speed-up")
+    parser.add_argument("--block-threshold-ms", type=float, default=250)
+    parser.add_argument("--fail-on-block", action="store_true",
+                        help="exit with status 1 if the event loop was blocked")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    # Logs, caches and charts written during the run land in a scratch directory.
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        result = asyncio.run(run(args))
+
+    print_report(result)
+    if not args.no_save:
+        save_result("load_test", result)
+    if args.fail_on_block and result["blocks"]:
+        print("\nFAIL: event loop blocked. First stack:\n" + result["blocks"][0]["stack"])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Startup benchmark for the bot process.
+
+Measures, in fresh interpreters, how long it takes to import the bot (`main`,
+which builds the Bot and registers all commands), the resulting peak RSS, and
+the slowest individual imports reported by `python -X importtime`. It also
+flags whether the analytics stack (pandas/matplotlib/seaborn) got imported,
+which should only happen on first use of `wrap`.
+
+Deferring pandas only shortens the import: `setup_hook` warms it in the
+background (the first logged play needs it anyway). So the probe then runs
+`setup_hook` and waits for its startup tasks, and reports the peak RSS there
+too, which is what a running bot holds before it connects.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--top 15] [--no-save]
+
+Results are appended to benchmarks/results/startup.jsonl so runs can be
+compared over time.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import SRC_DIR, result_header, save_result
+
+HEAVY_MODULES = ("pandas", "matplotlib", "seaborn")
+
+# Runs inside the child interpreter; prints one JSON line on stdout.
+PROBE = """
+import asyncio, json, resource, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+async def boot():
+    await main.setup_hook()
+    tasks = [t for t in asyncio.all_tasks() if t.get_coro().__name__ in {startup_tasks!r}]
+    await asyncio.wait(tasks, timeout=120)
+
+setup_start = time.perf_counter()
+asyncio.run(boot())
+print(json.dumps({{
+    "import_s": elapsed, "max_rss_kb": rss_kb, "heavy_modules": heavy,
+    "setup_s": time.perf_counter() - setup_start,
+    "setup_max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}}))
+"""
+
+# One-shot tasks setup_hook starts (the watchdog and reaper run forever).
+STARTUP_TASKS = ("warm_imports", "backfill_search_index", "sync_history_db", "backfill_sketches")
+
+
+def _child_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("DISCORD_TOKEN", "benchmark")
+    return env
+
+
+def measure_once(workdir: str) -> dict:
+    """Import the bot once in a fresh interpreter and return its measurements."""
+    wall_start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES, startup_tasks=STARTUP_TASKS)],
+        cwd=workdir,
+        env=_child_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - wall_start
+    return result
+
+
+def slowest_imports(workdir: str, top: int) -> list[dict]:
+    """Parse `-X importtime` output and return the slowest cumulative imports."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=workdir,
+        env=_child_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  <self us> | <cumulative us> | <module>"
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append({
+            "module": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    # Run in a scratch directory so cache/log directories created at import
+    # time don't end up in the checkout.
+    with tempfile.TemporaryDirectory() as workdir:
+        runs = [measure_once(workdir) for _ in range(args.runs)]
+        imports = slowest_imports(workdir, args.top)
+
+    summary = {
+        **result_header("startup"),
+        "runs": args.runs,
+        "import_s_median": statistics.median(r["import_s"] for r in runs),
+        "import_s_min": min(r["import_s"] for r in runs),
+        "process_s_median": statistics.median(r["process_s"] for r in runs),
+        "max_rss_kb": max(r["max_rss_kb"] for r in runs),
+        "setup_s_median": statistics.median(r["setup_s"] for r in runs),
+        "setup_max_rss_kb": max(r["setup_max_rss_kb"] for r in runs),
+        "heavy_modules": runs[-1]["heavy_modules"],
+        "slowest_imports": imports,
+    }
+
+    print(f"import main: median {summary['import_s_median'] * 1000:.0f} ms "
+          f"(min {summary['import_s_min'] * 1000:.0f} ms), "
+          f"process {summary['process_s_median'] * 1000:.0f} ms, "
+          f"peak RSS {summary['max_rss_kb'] / 1024:.1f} MiB")
+    print(f"after setup_hook (pandas warmed): {summary['setup_s_median'] * 1000:.0f} ms more, "
+          f"peak RSS {summary['setup_max_rss_kb'] / 1024:.1f} MiB")
+    if summary["heavy_modules"]:
+        print(f"WARNING: analytics stack imported at startup: {', '.join(summary['heavy_modules'])}")
+    print("Slowest imports (cumulative):")
+    for row in imports:
+        print(f"  {row['cumulative_ms']:8.1f} ms  {row['module']}")
+
+    if not args.no_save:
+        save_result("startup", summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Generate synthetic `music_log.parquet` play histories.
+
+Titles and requesters follow Zipf-like distributions (a few tracks and users
+account for most plays), genres are skewed with missing values like real
+yt-dlp metadata, and plays cluster in the evening over the past two years.
+
+Usage:
+    python benchmarks/synthetic_log.py --rows 100000 --out log/music_log.parquet
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+GENRES = [
+    "Breakcore", "Drum & Bass", "Jungle", "IDM", "Electronic", "Hardcore",
+    "Speedcore", "Dubstep", "Ambient", "Hip Hop", "Metal", "Pop", "Experimental",
+    "Gabber", "Footwork", "Trap", "Techno", "House", "Lo-fi", "Vaporwave",
+]
+SYLLABLES = [
+    "ka", "zu", "mi", "ro", "ne", "sha", "do", "vi", "lux", "ter", "bla", "xo",
+    "ren", "gal", "fi", "mor", "ta", "qui", "pel", "zar", "nox", "ly", "cru", "ex",
+]
+
+
+def _word(rng, low=1, high=4) -> str:
+    return "".join(rng.choice(SYLLABLES, size=rng.integers(low, high)))
+
+
+def _zipf_indices(rng, size: int, pool: int, a: float) -> np.ndarray:
+    """Draw `size` indices in [0, pool) with a Zipf-like skew."""
+    ranks = np.arange(1, pool + 1)
+    weights = 1.0 / ranks ** a
+    return rng.choice(pool, size=size, p=weights / weights.sum())
+
+
+def generate(rows: int, seed: int = 0, users: int = 60) -> pd.DataFrame:
+    """Build a play log DataFrame with the same schema Logger writes."""
+    rng = np.random.default_rng(seed)
+    track_pool = max(10, min(rows // 8, 200_000))
+
+    artists = [_word(rng).capitalize() for _ in range(max(5, track_pool // 6))]
+    track_titles = np.array([
+        f"{artists[rng.integers(len(artists))]} - {_word(rng, 2, 5).capitalize()} {_word(rng).capitalize()}"
+        for _ in range(track_pool)
+    ], dtype=object)
+    track_urls = np.array([
+        f"https://www.youtube.com/watch?v={rng.bytes(8).hex()[:11]}" for _ in range(track_pool)
+    ], dtype=object)
+    genre_weights = 1.0 / np.arange(1, len(GENRES) + 1) ** 1.1
+    genre_index = rng.choice(len(GENRES), size=track_pool, p=genre_weights / genre_weights.sum())
+    track_genres = np.array([GENRES[i] for i in genre_index], dtype=object)
+    track_genres[rng.random(track_pool) < 0.2] = None
+    track_durations = np.clip(rng.lognormal(np.log(200), 0.45, track_pool), 30, 3 * 3600).round()
+    upload_days = rng.integers(0, 20 * 365, track_pool)
+    track_uploads = np.array([
+        (datetime(2006, 1, 1) + timedelta(days=int(d))).strftime("%Y-%m-%d") for d in upload_days
+    ], dtype=object)
+    track_uploads[rng.random(track_pool) < 0.05] = None
+
+    track = _zipf_indices(rng, rows, track_pool, 1.05)
+    requester_ids = (10**17 + np.arange(users, dtype=np.int64) * 7919)[_zipf_indices(rng, rows, users, 1.2)]
+
+    # Evening-heavy hour of day over the last two years.
+    now = datetime.now()
+    days_ago = rng.integers(0, 730, rows)
+    hours = np.clip(rng.normal(20, 3.5, rows), 0, 23.99)
+    played_at = (
+        pd.Timestamp(now.date())
+        - pd.to_timedelta(days_ago, unit="D")
+        + pd.to_timedelta(hours, unit="h")
+    )
+
+    df = pd.DataFrame({
+        "title": track_titles[track],
+        "url": track_urls[track],
+        "requester_id": requester_ids,
+        "genre": track_genres[track],
+        "upload_date": track_uploads[track],
+        "duration": track_durations[track],
+        "played_at": played_at,
+    })
+    return df.sort_values("played_at", ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic play log.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="log/music_log.parquet")
+    args = parser.parse_args()
+
+    df = generate(args.rows, seed=args.seed)
+    df.to_parquet(args.out, index=False)
+    print(f"Wrote {len(df)} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
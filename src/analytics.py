@@ -1,4 +1,6 @@
 import os
+from abc import ABC, abstractmethod
+import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
@@ -8,6 +10,10 @@ from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 import glob
 
+from history_db import ANALYTICS_BACKEND, HistoryDB, analytics_backend, to_micros
+from logger import PLAYS_FILE, TRACKS_FILE, join_log, migrate_log, read_log
+from sketches import ANALYTICS_APPROXIMATE, SketchStore, sketches_ready
+
 # Configure matplotlib for better looking output
 sns.set_style("whitegrid")
 sns.set_context("talk")  # Larger fonts for better readability
@@ -25,38 +31,127 @@ plt.rcParams['grid.alpha'] = 0.3
 
 
 class Analytics:
+    """
+    Play history metrics and charts.
+
+    Works on the split log: `plays` (track_id, requester_id, played_at) and
+    `tracks` (metadata indexed by track_id). Track attributes are looked up
+    per distinct track, e.g. song counts are taken over track IDs and only the
+    resulting counts are mapped to titles; the wide `df` view is only built
+    if something asks for it.
+
+    Metrics and charts only use the aggregate methods (play_count,
+    total_duration, requester_ids and the underscored counts below), which is
+    what the SQL and sketch backends override.
+    """
+
+    # True when counts are estimates (SketchAnalytics)
+    approximate = False
+
     def __init__(
         self,
-        log_file: str = "log/music_log.parquet",
+        log_dir: str = "log",
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
         user_name_map: Optional[Dict[int, str]] = None,
     ):
-        self.log_file = log_file
-        self.df = None
+        self.log_dir = log_dir
+        self.plays = None
+        self.tracks = None
+        self._df = None
         self.start_date = start_date
         self.end_date = end_date
         self.user_name_map = user_name_map or {}
         self.load_data()
 
     def load_data(self):
-        """Load the parquet file into a DataFrame and apply time filters."""
-        if os.path.exists(self.log_file):
-            self.df = pd.read_parquet(self.log_file)
-            # Ensure played_at is datetime
-            self.df['played_at'] = pd.to_datetime(self.df['played_at'])
-            
-            # Apply time filters if specified
-            if self.start_date:
-                self.df = self.df[self.df['played_at'] >= self.start_date]
-            if self.end_date:
-                self.df = self.df[self.df['played_at'] <= self.end_date]
-        else:
-            self.df = pd.DataFrame()
+        """Load the play log and apply time filters."""
+        plays, tracks = read_log(self.log_dir)
+        # Apply time filters if specified
+        if self.start_date:
+            plays = plays[plays['played_at'] >= self.start_date]
+        if self.end_date:
+            plays = plays[plays['played_at'] <= self.end_date]
+        self.plays = plays
+        # durations are stored as float32; sum them in float64
+        self.tracks = tracks.set_index('track_id').astype({'duration': 'float64'})
+        self._df = None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """Plays joined with their track metadata (built on first access)."""
+        if self._df is None:
+            self._df = join_log(self.plays, self.tracks.reset_index())
+        return self._df
+
+    def close(self):
+        """Release database connections held by the backend."""
 
     def is_empty(self) -> bool:
         """Check if there's any data to analyze."""
-        return self.df.empty or len(self.df) == 0
+        return self.play_count() == 0
+
+    def _plays_of(self, user_id: Optional[int] = None) -> pd.DataFrame:
+        if user_id is None:
+            return self.plays
+        return self.plays[self.plays['requester_id'] == user_id]
+
+    def _attribute(self, column: str, plays: pd.DataFrame) -> pd.Series:
+        """A track attribute for every play, looked up by track_id."""
+        # track IDs are dense (0..n-1, assigned in order), so they double as positions
+        values = self.tracks[column].to_numpy()[plays['track_id'].to_numpy()]
+        return pd.Series(values, index=plays.index, name=column)
+
+    def play_count(self, user_id: Optional[int] = None) -> int:
+        """Number of plays (of one requester, if given)."""
+        return len(self._plays_of(user_id))
+
+    def total_duration(self, user_id: Optional[int] = None) -> float:
+        """Total seconds played (by one requester, if given)."""
+        return float(self._attribute('duration', self._plays_of(user_id)).sum() or 0)
+
+    def requester_ids(self) -> List[int]:
+        """Everyone who requested a song in the time range."""
+        return [int(uid) for uid in self.plays['requester_id'].dropna().unique().tolist()]
+
+    def distinct_listeners(self) -> int:
+        """Number of different requesters."""
+        return int(self.plays['requester_id'].nunique())
+
+    def distinct_tracks(self) -> int:
+        """Number of different tracks played."""
+        return int(self.plays['track_id'].nunique())
+
+    def _requester_counts(self, limit: Optional[int] = None) -> pd.Series:
+        """Plays per requester, most first."""
+        return self.plays['requester_id'].value_counts().head(limit)
+
+    def _user_durations(self, limit: Optional[int] = None) -> pd.Series:
+        """Seconds played per requester, longest first."""
+        durations = self._attribute('duration', self.plays).groupby(self.plays['requester_id']).sum()
+        return durations.sort_values(ascending=False).head(limit)
+
+    def _counts_by(self, column: str, user_id: Optional[int] = None, limit: Optional[int] = None) -> pd.Series:
+        """Plays per value of a track attribute, most played first (missing values dropped)."""
+        per_track = self._plays_of(user_id)['track_id'].value_counts()
+        values = self.tracks[column].reindex(per_track.index)
+        counts = per_track.groupby(values.values).sum()
+        return counts.sort_values(ascending=False, kind='stable').head(limit)
+
+    def _upload_years(self) -> pd.Series:
+        """Plays per upload year of the track."""
+        years = self.tracks['upload_date'].dt.year
+        per_track = self.plays['track_id'].value_counts()
+        return per_track.groupby(years.reindex(per_track.index).values).sum()
+
+    def _activity(self, user_id: Optional[int] = None) -> pd.Series:
+        """Plays per (day_of_week, hour), Monday = 0; only slots with plays."""
+        hours = self._plays_of(user_id)['played_at'].to_numpy().astype('datetime64[h]').astype('int64')
+        # 1970-01-01 was a Thursday (3 with Monday = 0)
+        slots = np.bincount((hours // 24 + 3) % 7 * 24 + hours % 24, minlength=7 * 24)
+        used = np.flatnonzero(slots)
+        index = pd.MultiIndex.from_arrays([used // 24, used % 24], names=['day_of_week', 'hour'])
+        return pd.Series(slots[used], index=index)
 
     def _get_user_display_name(self, user_id: int, fallback: Optional[str] = None) -> str:
         """Resolve a readable display name for a requester ID."""
@@ -85,61 +180,59 @@ class Analytics:
         """Get the hour when most songs were posted."""
         if self.is_empty():
             return (0, 0)
-        hour_counts = self.df['played_at'].dt.hour.value_counts()
+        hour_counts = self._activity().groupby(level='hour').sum()
         if hour_counts.empty:
             return (0, 0)
         top_hour = hour_counts.idxmax()
-        return (top_hour, hour_counts.max())
+        return (int(top_hour), int(hour_counts.max()))
 
     def get_top_posters(self, limit: int = 10) -> List[Dict]:
         """Get users who posted the most songs."""
         if self.is_empty():
             return []
-        top = self.df['requester_id'].value_counts().head(limit)
+        top = self._requester_counts(limit)
         return [{"user_id": uid, "count": count} for uid, count in top.items()]
 
     def get_longest_posters(self, limit: int = 10) -> List[Dict]:
         """Get users who posted the longest total duration."""
         if self.is_empty():
             return []
-        user_durations = self.df.groupby('requester_id')['duration'].sum().sort_values(ascending=False).head(limit)
+        user_durations = self._user_durations(limit)
         return [{"user_id": uid, "duration": dur} for uid, dur in user_durations.items()]
 
     def get_top_genres(self, limit: int = 10) -> List[Dict]:
         """Get the most posted genres."""
         if self.is_empty():
             return []
-        genres = self.df[self.df['genre'].notna()]['genre'].value_counts().head(limit)
+        genres = self._counts_by('genre', limit=limit)
         return [{"genre": g, "count": c} for g, c in genres.items()]
 
     def get_top_years(self, limit: int = 10) -> List[Dict]:
         """Get the years from which most songs were posted."""
         if self.is_empty():
             return []
-        self.df['upload_year'] = pd.to_datetime(self.df['upload_date'], errors='coerce').dt.year
-        years = self.df[self.df['upload_year'].notna()]['upload_year'].value_counts().head(limit).sort_index(ascending=False)
+        years = self._upload_years().sort_values(ascending=False, kind='stable').head(limit).sort_index(ascending=False)
         return [{"year": int(y), "count": c} for y, c in years.items()]
 
     def get_most_played_songs(self, limit: int = 10) -> List[Dict]:
         """Get the songs that got played the most."""
         if self.is_empty():
             return []
-        songs = self.df['title'].value_counts().head(limit)
+        songs = self._counts_by('title', limit=limit)
         return [{"title": title, "count": count} for title, count in songs.items()]
 
     def get_user_stats(self, user_id: int) -> Dict:
         """Get detailed stats for a specific user."""
-        user_df = self.df[self.df['requester_id'] == user_id]
-        if user_df.empty:
+        total_songs = self.play_count(user_id)
+        if not total_songs:
             return {}
         
-        total_duration = user_df['duration'].sum() or 0
         return {
             "user_id": user_id,
-            "total_songs": len(user_df),
-            "total_duration": total_duration,
-            "top_genres": self.df[self.df['requester_id'] == user_id]['genre'].value_counts().head(5).to_dict(),
-            "top_songs": user_df['title'].value_counts().head(5).to_dict(),
+            "total_songs": total_songs,
+            "total_duration": self.total_duration(user_id),
+            "top_genres": self._counts_by('genre', user_id, limit=5).to_dict(),
+            "top_songs": self._counts_by('title', user_id, limit=5).to_dict(),
         }
 
     # ============================================================
@@ -159,17 +252,8 @@ class Analytics:
             return output_path
 
         # Create pivot table for heatmap
-        self.df['hour'] = self.df['played_at'].dt.hour
-        self.df['day_of_week'] = self.df['played_at'].dt.dayofweek
-        
         days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        heatmap_data = self.df.pivot_table(
-            index='day_of_week',
-            columns='hour',
-            values='title',
-            aggfunc='count',
-            fill_value=0
-        )
+        heatmap_data = self._activity().unstack(fill_value=0)
         
         fig, ax = plt.subplots(figsize=(18, 8))
         sns.heatmap(
@@ -205,7 +289,7 @@ class Analytics:
             plt.close(fig)
             return output_path
 
-        top_posters = self.df['requester_id'].value_counts().head(limit)
+        top_posters = self._requester_counts(limit)
         
         fig, ax = plt.subplots(figsize=(14, 8))
         colors = plt.cm.viridis(range(len(top_posters)))
@@ -238,7 +322,7 @@ class Analytics:
             plt.close(fig)
             return output_path
 
-        user_durations = self.df.groupby('requester_id')['duration'].sum().sort_values(ascending=False).head(limit)
+        user_durations = self._user_durations(limit)
         
         # Convert to hours for better readability
         hours = user_durations / 3600
@@ -274,7 +358,7 @@ class Analytics:
             plt.close(fig)
             return output_path
 
-        genres = self.df[self.df['genre'].notna()]['genre'].value_counts().head(limit)
+        genres = self._counts_by('genre', limit=limit)
         
         if genres.empty:
             fig, ax = plt.subplots(figsize=(14, 9))
@@ -324,8 +408,7 @@ class Analytics:
             plt.close(fig)
             return output_path
 
-        self.df['upload_year'] = pd.to_datetime(self.df['upload_date'], errors='coerce').dt.year
-        years = self.df[self.df['upload_year'].notna()]['upload_year'].value_counts().sort_index(ascending=False).head(20)
+        years = self._upload_years().sort_index(ascending=False).head(20)
         
         if years.empty:
             fig, ax = plt.subplots(figsize=(16, 7))
@@ -367,7 +450,7 @@ class Analytics:
             plt.close(fig)
             return output_path
 
-        songs = self.df['title'].value_counts().head(limit)
+        songs = self._counts_by('title', limit=limit)
         
         fig, ax = plt.subplots(figsize=(16, 10))
         colors = plt.cm.Spectral(range(len(songs)))
@@ -399,8 +482,8 @@ class Analytics:
 
         display_name = self._get_user_display_name(user_id, fallback=user_name)
         
-        user_df = self.df[self.df['requester_id'] == user_id]
-        if user_df.empty:
+        total_songs = self.play_count(user_id)
+        if not total_songs:
             fig, ax = plt.subplots(figsize=(14, 8), facecolor='white')
             ax.text(0.5, 0.5, f"No data for {display_name}", ha='center', va='center', fontsize=20, color='#666')
             ax.axis('off')
@@ -408,9 +491,10 @@ class Analytics:
             plt.close(fig)
             return output_path
 
-        total_songs = len(user_df)
-        total_duration = user_df['duration'].sum() or 0
-        top_genre = user_df[user_df['genre'].notna()]['genre'].value_counts().index[0] if not user_df[user_df['genre'].notna()].empty else "Unknown"
+        total_duration = self.total_duration(user_id)
+        user_genres = self._counts_by('genre', user_id, limit=8)
+        activity = self._activity(user_id)
+        top_genre = user_genres.index[0] if not user_genres.empty else "Unknown"
         
         fig = plt.figure(figsize=(16, 11), facecolor='white')
         gs = fig.add_gridspec(3, 2, hspace=0.35, wspace=0.3)
@@ -429,7 +513,7 @@ class Analytics:
         
         # Top genres
         ax_genres = fig.add_subplot(gs[1, 0])
-        genres = user_df[user_df['genre'].notna()]['genre'].value_counts().head(8)
+        genres = user_genres
         if not genres.empty:
             colors = plt.cm.Set3(range(len(genres)))
             bars = ax_genres.barh(range(len(genres)), genres.values, color=colors, edgecolor='black', linewidth=1)
@@ -442,7 +526,7 @@ class Analytics:
         
         # Top songs
         ax_songs = fig.add_subplot(gs[1, 1])
-        songs = user_df['title'].value_counts().head(8)
+        songs = self._counts_by('title', user_id, limit=8)
         if not songs.empty:
             colors = plt.cm.Paired(range(len(songs)))
             bars = ax_songs.barh(range(len(songs)), songs.values, color=colors, edgecolor='black', linewidth=1)
@@ -456,7 +540,7 @@ class Analytics:
         
         # Activity by day of week
         ax_dow = fig.add_subplot(gs[2, 0])
-        dow = user_df['played_at'].dt.dayofweek.value_counts().sort_index()
+        dow = activity.groupby(level='day_of_week').sum().sort_index()
         days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
         colors = plt.cm.rainbow(range(len(dow)))
         bars = ax_dow.bar([days[int(d)] for d in dow.index], dow.values, color=colors, edgecolor='black', linewidth=1.2)
@@ -471,7 +555,7 @@ class Analytics:
         
         # Activity by hour
         ax_hour = fig.add_subplot(gs[2, 1])
-        hour = user_df['played_at'].dt.hour.value_counts().sort_index()
+        hour = activity.groupby(level='hour').sum().sort_index()
         ax_hour.plot(hour.index, hour.values, marker='o', linewidth=3, markersize=8, color='#E74C3C')
         ax_hour.fill_between(hour.index, hour.values, alpha=0.4, color='#E74C3C')
         ax_hour.set_xlabel('Hour of Day', fontsize=12, fontweight='bold')
@@ -485,8 +569,279 @@ class Analytics:
         return output_path
 
 
+class SqlAnalytics(Analytics, ABC):
+    """
+    Analytics answered by an embedded SQL engine instead of in-memory frames.
+
+    Nothing is loaded up front: each aggregate is one query, with the time
+    range and requester filtered in SQL, so memory stays flat as the history
+    grows. `plays`, `tracks` and `df` are not available on these backends.
+    """
+
+    # Dialect: expressions over plays p / tracks t
+    DAY_OF_WEEK = None  # Monday = 0
+    HOUR = None
+    UPLOAD_YEAR = None
+
+    @abstractmethod
+    def _query(self, sql: str, params: list) -> list:
+        """Rows of a query with `?` placeholders."""
+
+    def _time(self, value: datetime):
+        return value
+
+    def _where(self, user_id: Optional[int] = None) -> Tuple[str, list]:
+        clauses, params = ["1 = 1"], []
+        if self.start_date:
+            clauses.append("p.played_at >= ?")
+            params.append(self._time(self.start_date))
+        if self.end_date:
+            clauses.append("p.played_at <= ?")
+            params.append(self._time(self.end_date))
+        if user_id is not None:
+            clauses.append("p.requester_id = ?")
+            params.append(user_id)
+        return " AND ".join(clauses), params
+
+    def _series(self, sql: str, params: list, limit: Optional[int] = None, dtype: str = 'int64') -> pd.Series:
+        """A (key, value) query as a Series indexed by key."""
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = params + [limit]
+        rows = self._query(sql, params)
+        return pd.Series([row[1] for row in rows], index=[row[0] for row in rows], dtype=dtype)
+
+    def _per_track(self, user_id: Optional[int] = None) -> Tuple[str, list]:
+        where, params = self._where(user_id)
+        return f"(SELECT p.track_id, COUNT(*) AS n FROM plays p WHERE {where} GROUP BY p.track_id) c", params
+
+    def play_count(self, user_id: Optional[int] = None) -> int:
+        where, params = self._where(user_id)
+        return int(self._query(f"SELECT COUNT(*) FROM plays p WHERE {where}", params)[0][0])
+
+    def total_duration(self, user_id: Optional[int] = None) -> float:
+        where, params = self._where(user_id)
+        rows = self._query(
+            "SELECT COALESCE(SUM(t.duration), 0) FROM plays p "
+            f"JOIN tracks t ON t.track_id = p.track_id WHERE {where}", params)
+        return float(rows[0][0])
+
+    def requester_ids(self) -> List[int]:
+        where, params = self._where()
+        return [int(row[0]) for row in self._query(f"SELECT DISTINCT p.requester_id FROM plays p WHERE {where}", params)]
+
+    def distinct_listeners(self) -> int:
+        where, params = self._where()
+        return int(self._query(f"SELECT COUNT(DISTINCT p.requester_id) FROM plays p WHERE {where}", params)[0][0])
+
+    def distinct_tracks(self) -> int:
+        where, params = self._where()
+        return int(self._query(f"SELECT COUNT(DISTINCT p.track_id) FROM plays p WHERE {where}", params)[0][0])
+
+    def _requester_counts(self, limit: Optional[int] = None) -> pd.Series:
+        where, params = self._where()
+        return self._series(
+            f"SELECT p.requester_id, COUNT(*) AS n FROM plays p WHERE {where} "
+            "GROUP BY p.requester_id ORDER BY n DESC, p.requester_id", params, limit)
+
+    def _user_durations(self, limit: Optional[int] = None) -> pd.Series:
+        where, params = self._where()
+        return self._series(
+            "SELECT p.requester_id, COALESCE(SUM(t.duration), 0) AS seconds FROM plays p "
+            f"JOIN tracks t ON t.track_id = p.track_id WHERE {where} "
+            "GROUP BY p.requester_id ORDER BY seconds DESC, p.requester_id", params, limit, dtype='float64')
+
+    def _counts_by(self, column: str, user_id: Optional[int] = None, limit: Optional[int] = None) -> pd.Series:
+        if column not in ("title", "genre"):
+            raise ValueError(f"Cannot count plays by {column!r}")
+        per_track, params = self._per_track(user_id)
+        return self._series(
+            f"SELECT t.{column}, SUM(c.n) AS n FROM {per_track} "
+            f"JOIN tracks t ON t.track_id = c.track_id WHERE t.{column} IS NOT NULL "
+            f"GROUP BY t.{column} ORDER BY n DESC, t.{column}", params, limit)
+
+    def _upload_years(self) -> pd.Series:
+        per_track, params = self._per_track()
+        return self._series(
+            f"SELECT {self.UPLOAD_YEAR} AS year, SUM(c.n) AS n FROM {per_track} "
+            "JOIN tracks t ON t.track_id = c.track_id WHERE t.upload_date IS NOT NULL "
+            "GROUP BY year", params)
+
+    def _activity(self, user_id: Optional[int] = None) -> pd.Series:
+        where, params = self._where(user_id)
+        rows = self._query(
+            f"SELECT {self.DAY_OF_WEEK} AS day_of_week, {self.HOUR} AS hour, COUNT(*) "
+            f"FROM plays p WHERE {where} GROUP BY day_of_week, hour ORDER BY day_of_week, hour", params)
+        index = pd.MultiIndex.from_arrays(
+            [[int(row[0]) for row in rows], [int(row[1]) for row in rows]], names=['day_of_week', 'hour'])
+        return pd.Series([int(row[2]) for row in rows], index=index, dtype='int64')
+
+
+class SQLiteAnalytics(SqlAnalytics):
+    """Queries the indexed SQLite mirror of the log (history_db), synced on load."""
+
+    # played_at is integer microseconds; 1970-01-01 was a Thursday
+    DAY_OF_WEEK = "(p.played_at / 86400000000 + 3) % 7"
+    HOUR = "p.played_at / 3600000000 % 24"
+    UPLOAD_YEAR = "CAST(substr(t.upload_date, 1, 4) AS INTEGER)"
+
+    def load_data(self):
+        self.history = HistoryDB(self.log_dir)
+        self.history.sync()
+
+    def close(self):
+        self.history.close()
+
+    def _time(self, value: datetime) -> int:
+        return to_micros(value)
+
+    def _query(self, sql: str, params: list) -> list:
+        return self.history.conn.execute(sql, params).fetchall()
+
+
+class DuckDBAnalytics(SqlAnalytics):
+    """Queries plays.parquet and tracks.parquet in place with DuckDB (optional dependency)."""
+
+    DAY_OF_WEEK = "isodow(p.played_at) - 1"
+    HOUR = "hour(p.played_at)"
+    UPLOAD_YEAR = "year(t.upload_date)"
+
+    def load_data(self):
+        import duckdb
+
+        plays_file = os.path.join(self.log_dir, PLAYS_FILE)
+        if not os.path.exists(plays_file):
+            migrate_log(self.log_dir)
+        self.conn = duckdb.connect()
+        if not os.path.exists(plays_file):
+            self.conn.execute("CREATE TABLE plays (track_id INTEGER, requester_id BIGINT, played_at TIMESTAMP)")
+            self.conn.execute("CREATE TABLE tracks (track_id INTEGER, url VARCHAR, title VARCHAR, "
+                              "genre VARCHAR, upload_date TIMESTAMP, duration FLOAT)")
+            return
+        for name, filename in (("plays", PLAYS_FILE), ("tracks", TRACKS_FILE)):
+            path = os.path.join(self.log_dir, filename).replace("'", "''")
+            self.conn.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{path}')")
+
+    def _query(self, sql: str, params: list) -> list:
+        return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class SketchAnalytics(Analytics):
+    """
+    Approximate analytics from the streaming sketches kept by sketches.py.
+
+    Memory and time do not depend on the history size. Song, genre and
+    requester counts come from Space-Saving summaries and may be overestimated
+    by up to plays / SKETCH_CAPACITY (so top lists can differ from the exact
+    ones only among entries that close); distinct listeners and tracks are
+    HyperLogLog estimates (1.6% standard error); totals, years and activity
+    slots are exact. Time ranges are widened to whole calendar months.
+    Per-user statistics fall back to the exact backend.
+    """
+
+    approximate = True
+
+    def __init__(self, exact_backend=Analytics, **kwargs):
+        self.exact_backend = exact_backend
+        self._exact = None
+        super().__init__(**kwargs)
+
+    def load_data(self):
+        self.sketches = SketchStore(self.log_dir)
+        self.periods = self.sketches.periods(self.start_date, self.end_date)
+
+    def close(self):
+        self.sketches.close()
+        if self._exact is not None:
+            self._exact.close()
+
+    def exact(self) -> Analytics:
+        """The exact backend over the same range, opened on first use."""
+        if self._exact is None:
+            self._exact = self.exact_backend(
+                log_dir=self.log_dir, start_date=self.start_date, end_date=self.end_date,
+                user_name_map=self.user_name_map,
+            )
+        return self._exact
+
+    def _top(self, kind: str, limit: Optional[int] = None, key=str, dtype: str = 'int64') -> pd.Series:
+        top = self.sketches.summary(kind, self.periods).top(limit)
+        return pd.Series([count for _, count, _ in top], index=[key(k) for k, _, _ in top], dtype=dtype)
+
+    def play_count(self, user_id: Optional[int] = None) -> int:
+        if user_id is not None:
+            return self.exact().play_count(user_id)
+        return self.sketches.totals(self.periods)[0]
+
+    def total_duration(self, user_id: Optional[int] = None) -> float:
+        if user_id is not None:
+            return self.exact().total_duration(user_id)
+        return self.sketches.totals(self.periods)[1]
+
+    def requester_ids(self) -> List[int]:
+        """The requesters tracked by the sketches (all of them unless there are more than SKETCH_CAPACITY)."""
+        return [int(key) for key, _, _ in self.sketches.summary('requester', self.periods).top()]
+
+    def distinct_listeners(self) -> int:
+        return self.sketches.distinct('listeners', self.periods)
+
+    def distinct_tracks(self) -> int:
+        return self.sketches.distinct('tracks', self.periods)
+
+    def _requester_counts(self, limit: Optional[int] = None) -> pd.Series:
+        return self._top('requester', limit, key=int)
+
+    def _user_durations(self, limit: Optional[int] = None) -> pd.Series:
+        return self._top('requester_seconds', limit, key=int, dtype='float64')
+
+    def _counts_by(self, column: str, user_id: Optional[int] = None, limit: Optional[int] = None) -> pd.Series:
+        if user_id is not None:
+            return self.exact()._counts_by(column, user_id, limit)
+        return self._top(column, limit)
+
+    def _upload_years(self) -> pd.Series:
+        return self._top('year', key=int)
+
+    def _activity(self, user_id: Optional[int] = None) -> pd.Series:
+        if user_id is not None:
+            return self.exact()._activity(user_id)
+        slots = self._top('slot', key=int).sort_index()
+        index = pd.MultiIndex.from_arrays(
+            [slots.index // 24, slots.index % 24], names=['day_of_week', 'hour'])
+        return pd.Series(slots.to_numpy(), index=index)
+
+
+def exact_backend() -> type:
+    """The Analytics class chosen by ANALYTICS_BACKEND."""
+    backend = analytics_backend()
+    if backend != ANALYTICS_BACKEND:
+        print(f"ANALYTICS_BACKEND={ANALYTICS_BACKEND} but duckdb is not installed, using {backend}")
+    if backend == "sqlite":
+        return SQLiteAnalytics
+    if backend == "duckdb":
+        return DuckDBAnalytics
+    return Analytics
+
+
+def open_analytics(exact: bool = False, **kwargs) -> Analytics:
+    """
+    Analytics on the backend chosen by ANALYTICS_BACKEND, or from the
+    sketches with ANALYTICS_APPROXIMATE once they have been built (unless
+    exact, e.g. for per-user statistics, which the sketches do not answer).
+
+    Loading may sync or read the whole log: call it from an executor.
+    """
+    backend = exact_backend()
+    if ANALYTICS_APPROXIMATE and not exact and sketches_ready(kwargs.get("log_dir", "log")):
+        return SketchAnalytics(backend, **kwargs)
+    return backend(**kwargs)
+
+
 if __name__ == "__main__":
-    analytics = Analytics()
+    analytics = open_analytics()
     print(f"Top posters: {analytics.get_top_posters(5)}")
     print(f"Top genres: {analytics.get_top_genres(5)}")
     print(f"Most played songs: {analytics.get_most_played_songs(5)}")
@@ -0,0 +1,191 @@
+import json
+import time
+
+import store
+
+
+class TrackCache:
+    """
+    Durable Spotify -> YouTube mapping, keyed by Spotify track ID and ISRC.
+    Used through store.run/submit, off the event loop.
+    """
+
+    # Core metadata kept per mapping; enough to queue, display and log a track
+    # without another search. Playback re-resolves the stream from webpage_url.
+    FIELDS = (
+        "title",
+        "webpage_url",
+        "duration",
+        "thumbnail",
+        "uploader",
+        "genre",
+        "tags",
+        "upload_date",
+        "release_date",
+        "extractor_key",
+    )
+
+    def __init__(self, cache_dir=None, filename="track_cache.sqlite3"):
+        self.conn = store.connect(filename, cache_dir, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS track_map ("
+            "key TEXT PRIMARY KEY, info TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def _keys(track) -> list[str]:
+        keys = []
+        if track.id:
+            keys.append(f"spotify:{track.id}")
+        if track.isrc:
+            keys.append(f"isrc:{track.isrc.upper()}")
+        return keys
+
+    def get(self, track) -> dict | None:
+        """Return a fresh copy of the cached info for a SpotifyTrack, if any."""
+        for key in self._keys(track):
+            row = self.conn.execute(
+                "SELECT info FROM track_map WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                return json.loads(row[0])
+        return None
+
+    def put(self, track, info: dict):
+        """Remember the resolved yt-dlp info for a SpotifyTrack."""
+        keys = self._keys(track)
+        if not keys or not info.get("webpage_url"):
+            return
+        payload = json.dumps({field: info.get(field) for field in self.FIELDS})
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO track_map (key, info, updated_at) VALUES (?, ?, ?)",
+            [(key, payload, now) for key in keys],
+        )
+        self.conn.commit()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for Spotify API responses.
+
+    A TTL-bounded memory tier (least recently used entries evicted past
+    max_entries) answers repeat lookups without any request; the disk tier
+    keeps the validators (ETag, Last-Modified, snapshot_id) so stale entries
+    can be revalidated with a conditional request. Disk entries not stored or
+    revalidated for max_age seconds are pruned, and at most max_disk_entries
+    are kept; pruning runs at startup and every PRUNE_EVERY writes.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(
+        self,
+        cache_dir=None,
+        filename="spotify_cache.sqlite3",
+        ttl=300,
+        max_entries=256,
+        max_age=30 * 86400,
+        max_disk_entries=10000,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_disk_entries = max_disk_entries
+        self.memory = {}
+        self.writes = 0
+        self.conn = store.connect(filename, cache_dir)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body TEXT NOT NULL, etag TEXT, last_modified TEXT, "
+            "snapshot_id TEXT, stored_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)"
+        )
+        self.conn.commit()
+        self.prune()
+
+    @staticmethod
+    def make_key(path: str, params: dict | None = None) -> str:
+        if not params:
+            return path
+        query = "&".join(f"{k}={params[k]}" for k in sorted(params))
+        return f"{path}?{query}"
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["stored_at"] < self.ttl
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached entry for key from memory, falling back to disk."""
+        entry = self.memory.pop(key, None)
+        if entry:
+            # re-insert: the memory tier evicts the least recently used first
+            self.memory[key] = entry
+            return entry
+
+        row = self.conn.execute(
+            "SELECT body, etag, last_modified, snapshot_id, stored_at FROM responses WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if not row:
+            return None
+        entry = {
+            "body": json.loads(row[0]),
+            "etag": row[1],
+            "last_modified": row[2],
+            "snapshot_id": row[3],
+            "stored_at": row[4],
+        }
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, body, etag=None, last_modified=None, snapshot_id=None) -> dict:
+        entry = {
+            "body": body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "snapshot_id": snapshot_id,
+            "stored_at": time.time(),
+        }
+        self._remember(key, entry)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses "
+            "(key, body, etag, last_modified, snapshot_id, stored_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, json.dumps(body), etag, last_modified, snapshot_id, entry["stored_at"]),
+        )
+        self.conn.commit()
+        self.writes += 1
+        if self.writes % self.PRUNE_EVERY == 0:
+            self.prune()
+        return entry
+
+    def prune(self):
+        """Drop disk entries older than max_age, then all but the max_disk_entries newest."""
+        self.conn.execute(
+            "DELETE FROM responses WHERE stored_at < ?", (time.time() - self.max_age,)
+        )
+        self.conn.execute(
+            "DELETE FROM responses WHERE key NOT IN ("
+            "SELECT key FROM responses ORDER BY stored_at DESC LIMIT ?)",
+            (self.max_disk_entries,),
+        )
+        self.conn.commit()
+
+    def touch(self, key: str, entry: dict) -> dict:
+        """Mark an entry as revalidated (e.g. after a 304) without rewriting the body."""
+        entry["stored_at"] = time.time()
+        self._remember(key, entry)
+        self.conn.execute(
+            "UPDATE responses SET stored_at = ? WHERE key = ?", (entry["stored_at"], key)
+        )
+        self.conn.commit()
+        return entry
+
+    def _remember(self, key: str, entry: dict):
+        self.memory.pop(key, None)
+        self.memory[key] = entry
+        # dicts keep insertion order, so the first keys are the least recently used
+        while len(self.memory) > self.max_entries:
+            self.memory.pop(next(iter(self.memory)))
@@ -1,20 +1,27 @@
 import re
-import random
+import contextvars
+import functools
+import importlib
 import asyncio
 import discord
 from discord.ext import commands
 import time
 from datetime import datetime, timedelta
-from music import get_player, FFMPEG_OPTIONS, YTDLSource
-from analytics import Analytics
+import store
+from music import get_player, save_all, search_index
 from spotify import SpotifyResolver
+from cache import TrackCache
+from metrics import CHART_RENDER_SECONDS, ERRORS_TOTAL, EXTRACT_TOTAL
+from tracing import span, start_trace, finish_trace, trace
 from utils import (
     ensure_voice,
     make_track_embed,
     make_queue_embed,
+    QueueView,
     parse_time,
     format_duration,
     send_message,
+    send_notices,
     TARGET_CHANNEL_ID,
 )
 
@@ -23,8 +30,161 @@ _X_LINK_RE = re.compile(r'(https?://(?:www\.)?)(x\.com)', re.IGNORECASE)
 _X_REPLACEMENT = r'\1fixvx.com'
 
 
+async def load_analytics():
+    """
+    Import the analytics module on first use.
+
+    It pulls in pandas, matplotlib and seaborn, which dominate startup time and
+    baseline memory, so the import runs in an executor the first time `wrap` is
+    used instead of at bot startup.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, importlib.import_module, "analytics")
+
+
+def build_wrap(analytics_module, user, start_date, end_date, timeframe_display, resolve_user_name):
+    """
+    Load the play history, query it and render the wrap charts (blocks).
+
+    Runs on one executor thread from start to finish, so the analytics
+    connection is opened, used and closed there. Returns {"message": text}
+    when there is nothing to show, else {"embed": Embed, "images": [(title,
+    filename, path), ...]}.
+    """
+    # Clean up old images before generating new ones
+    analytics_module.Analytics.cleanup_old_images()
+
+    # Create analytics instance with time filters; loading may sync the
+    # SQLite mirror or read the log
+    with span("analytics.load"):
+        analytics = analytics_module.open_analytics(
+            exact=user is not None, start_date=start_date, end_date=end_date,
+        )
+    try:
+        if analytics.is_empty():
+            return {"message": f"No music data available for {timeframe_display.lower()}. Start queuing songs!"}
+
+        # If user specified, show user-specific wrap
+        if user:
+            user_stats = analytics.get_user_stats(user.id)
+            if not user_stats:
+                return {"message": f"No data available for {user.mention}"}
+
+            # Generate user summary image
+            with CHART_RENDER_SECONDS.time(chart="user_summary"), span("chart.render", chart="user_summary"):
+                summary_path = analytics.create_user_summary(user.id, user_name=user.name)
+
+            # Create embed with user stats
+            embed = discord.Embed(
+                title=f"Music Wrap - {user.name} ({timeframe_display})",
+                color=discord.Color.purple(),
+                description="Here's your personalized music wrap!"
+            )
+
+            total_hours = user_stats['total_duration'] / 3600
+            embed.add_field(name="Total Songs", value=f"{user_stats['total_songs']}", inline=True)
+            embed.add_field(name="Total Duration", value=f"{total_hours:.1f} hours", inline=True)
+            embed.add_field(name="Top Genre",
+                          value=next(iter(user_stats['top_genres'].keys())) if user_stats['top_genres'] else "Unknown",
+                          inline=True)
+
+            if user_stats['top_genres']:
+                genres_str = "\n".join([f"{g}: {c}" for g, c in list(user_stats['top_genres'].items())[:5]])
+                embed.add_field(name="Top Genres", value=genres_str, inline=False)
+
+            if user_stats['top_songs']:
+                songs_str = "\n".join([f"{s}: {c}" for s, c in list(user_stats['top_songs'].items())[:5]])
+                embed.add_field(name="Top Songs", value=songs_str, inline=False)
+
+            return {"embed": embed, "images": [("User Wrap", "user_wrap.png", summary_path)]}
+
+        # Server-wide wrap
+        analytics.user_name_map = {
+            requester_id: resolve_user_name(requester_id)
+            for requester_id in analytics.requester_ids()
+        }
+
+        # Generate all visualization images
+        images = []
+        charts = [
+            ("Activity Heatmap", "heatmap", analytics.create_activity_heatmap),
+            ("Top Requesters", "top_posters", analytics.create_top_posters_chart),
+            ("Longest Duration", "longest_posters", analytics.create_longest_posters_chart),
+            ("Top Genres", "genres", analytics.create_genres_chart),
+            ("Songs by Year", "years", analytics.create_years_chart),
+            ("Most Played Songs", "most_played", analytics.create_most_played_chart),
+        ]
+        for title, chart, create_chart in charts:
+            try:
+                with CHART_RENDER_SECONDS.time(chart=chart), span("chart.render", chart=chart):
+                    path = create_chart()
+                images.append((title, f"{title.lower().replace(' ', '_')}.png", path))
+            except Exception as e:
+                ERRORS_TOTAL.inc(where="wrap")
+                print(f"Error creating {chart} chart: {e}")
+
+        # Create main summary embed
+        embed = discord.Embed(
+            title=f"Server Music Wrap ({timeframe_display})",
+            color=discord.Color.gold(),
+            description="Here's your server's music wrap!"
+        )
+
+        total_songs = analytics.play_count()
+        total_duration = analytics.total_duration()
+        total_hours = total_duration / 3600
+
+        embed.add_field(name="Total Songs Queued", value=f"{total_songs}", inline=True)
+        embed.add_field(name="Total Duration", value=f"{total_hours:.1f} hours", inline=True)
+        embed.add_field(name="Requesters", value=f"{analytics.distinct_listeners()}", inline=True)
+        embed.add_field(name="Different Songs", value=f"{analytics.distinct_tracks()}", inline=True)
+        if analytics.approximate:
+            embed.set_footer(text="Approximate counts; time ranges rounded to whole months")
+
+        top_posters = analytics.get_top_posters(5)
+        if top_posters:
+            posters_str = "\n".join([f"<@{p['user_id']}>: {p['count']} songs" for p in top_posters])
+            embed.add_field(name="Top Requesters", value=posters_str, inline=False)
+
+        top_genres = analytics.get_top_genres(5)
+        if top_genres:
+            genres_str = "\n".join([f"{g['genre']}: {g['count']}" for g in top_genres])
+            embed.add_field(name="Top Genres", value=genres_str, inline=False)
+
+        top_songs = analytics.get_most_played_songs(5)
+        if top_songs:
+            songs_str = "\n".join([f"{s['title']}: {s['count']} times" for s in top_songs[:5]])
+            embed.add_field(name="Most Played", value=songs_str, inline=False)
+
+        top_years = analytics.get_top_years(3)
+        if top_years:
+            years_str = "\n".join([f"{y['year']}: {y['count']} songs" for y in top_years])
+            embed.add_field(name="Top Years", value=years_str, inline=False)
+
+        return {"embed": embed, "images": images}
+    finally:
+        analytics.close()
+
+
 def setup(bot):
     spotify = SpotifyResolver()
+    track_cache = TrackCache()
+
+    async def add_spotify_track(player, track, requester, prio=False):
+        """Queue a SpotifyTrack, skipping the YouTube search on a cache hit."""
+        with span("track_cache.get"):
+            cached = await store.run(track_cache.get, track)
+        if cached:
+            EXTRACT_TOTAL.inc(extractor=cached.get("extractor_key") or "unknown", cached="true")
+            infos, skipped = player.enqueue([cached], requester, prio=prio)
+            return infos, skipped, True
+
+        infos, skipped = await player.add_track(
+            track.to_ytmusic_query(), requester, playlist=False, prio=prio
+        )
+        if infos:
+            store.submit(track_cache.put, track, infos[0], where="track_cache")
+        return infos, skipped, False
 
     @bot.command(name="tits")
     async def join(ctx):
@@ -35,7 +195,7 @@ def setup(bot):
     async def leave(ctx):
         """Leave voice channel and clear the queue."""
         if ctx.voice_client:
-            get_player(ctx.guild).clear()
+            (await get_player(ctx.guild)).clear()
             await ctx.voice_client.disconnect()
         else:
             await send_message(ctx, "I'm not in a voice channel.")
@@ -44,6 +204,7 @@ def setup(bot):
     async def play(ctx, *, query):
         """Add a track to the queue. Usage: p <query>"""
         query = query.strip()
+        spotify_track = None
 
         if spotify.is_spotify_url(query):
             url_type = spotify.get_url_type(query)
@@ -53,7 +214,8 @@ def setup(bot):
                     "Spotify albums/playlists should be queued with `pl`.",
                 )
             try:
-                query = await spotify.to_youtube_music_query(query)
+                with span("spotify.resolve"):
+                    spotify_track = await spotify.get_track(query)
             except ValueError as e:
                 return await send_message(ctx, str(e))
             except Exception as e:
@@ -62,22 +224,34 @@ def setup(bot):
         vc = await ensure_voice(ctx)
         if not vc:
             return
-        player = get_player(ctx.guild)
+        player = await get_player(ctx.guild)
 
-        infos, skipped = await player.add_track(
-            query, ctx.author, playlist=False
-        )
+        if spotify_track:
+            infos, skipped, _ = await add_spotify_track(player, spotify_track, ctx.author)
+        else:
+            # Titles the bot has played before (in any server; the index is
+            # shared) resolve from the local index instead of a remote search.
+            with span("search_index.resolve"):
+                known = await store.run(search_index.resolve, query)
+            if known:
+                EXTRACT_TOTAL.inc(extractor=known.get("extractor_key") or "unknown", cached="true")
+                infos, skipped = player.enqueue([known], ctx.author)
+            else:
+                infos, skipped = await player.add_track(
+                    query, ctx.author, playlist=False
+                )
 
         embed = make_track_embed(infos[0], ctx.author, title="Add to Queue")
         # If the VC is paused, don't resume or start playback — just add to queue.
         if vc.is_paused():
             embed.add_field(name="Note", value="Playback is currently paused.")
-        elif not vc.is_playing():
-            await player.play_next(interactor=ctx.author, bot=bot)
+        else:
+            await player.start_if_idle(interactor=ctx.author, bot=bot)
 
         await send_message(ctx, embed=embed)
-        for track in skipped:
-            await send_message(ctx, f"**{track['title']}** is already in the queue!")
+        await send_notices(
+            ctx, [f"**{track['title']}**" for track in skipped], title="Already in the queue"
+        )
 
     @bot.command(name="pl")
     async def playlist(ctx, *, query):
@@ -86,7 +260,7 @@ def setup(bot):
         if not vc:
             return
 
-        player = get_player(ctx.guild)
+        player = await get_player(ctx.guild)
 
         if spotify.is_spotify_url(query):
             url_type = spotify.get_url_type(query)
@@ -99,7 +273,8 @@ def setup(bot):
             async with ctx.typing():
                 await send_message(ctx, "Processing Spotify album/playlist... This may take a moment.")
                 try:
-                    yt_queries = await spotify.to_youtube_music_queries(query)
+                    with span("spotify.resolve"):
+                        tracks = await spotify.get_tracks(query)
                 except ValueError as e:
                     return await send_message(ctx, str(e))
                 except Exception as e:
@@ -107,24 +282,26 @@ def setup(bot):
 
                 infos = []
                 skipped = []
-                for yt_query in yt_queries:
-                    added_infos, skipped_infos = await player.add_track(
-                        yt_query,
-                        ctx.author,
-                        playlist=False,
+                cache_hits = 0
+                for track in tracks:
+                    added_infos, skipped_infos, cached = await add_spotify_track(
+                        player, track, ctx.author
                     )
                     infos.extend(added_infos)
                     skipped.extend(skipped_infos)
+                    cache_hits += cached
 
             added_count = max(0, len(infos) - len(skipped))
-            message = f"Added {added_count} tracks from Spotify {url_type}."
+            message = f"Added {added_count} tracks from Spotify {url_type}"
+            if tracks:
+                message += f" ({cache_hits}/{len(tracks)} resolved from cache)"
             if vc.is_paused():
                 message += " (playback is paused)."
             else:
                 message += "."
 
-            if not vc.is_paused() and not vc.is_playing() and added_count > 0:
-                await player.play_next(interactor=ctx.author, bot=bot)
+            if not vc.is_paused() and added_count > 0:
+                await player.start_if_idle(interactor=ctx.author, bot=bot)
 
             await send_message(ctx, message)
             if skipped:
@@ -152,16 +329,13 @@ def setup(bot):
             message += "."
 
         # If paused, don't resume — just add playlist to queue.
-        if vc.is_paused():
-            await send_message(ctx, message)
-        elif not vc.is_playing():
-            await player.play_next(interactor=ctx.author, bot=bot)
-            await send_message(ctx, message)
-        else:
-            await send_message(ctx, message)
+        if not vc.is_paused():
+            await player.start_if_idle(interactor=ctx.author, bot=bot)
+        await send_message(ctx, message)
 
-        for track in skipped:
-            await send_message(ctx, f"**{track['title']}** is already in the queue!")
+        await send_notices(
+            ctx, [f"**{track['title']}**" for track in skipped], title="Already in the queue"
+        )
 
     @bot.command(name="n")
     async def now(ctx, *, query):
@@ -169,7 +343,7 @@ def setup(bot):
         vc = await ensure_voice(ctx)
         if not vc:
             return
-        player = get_player(ctx.guild)
+        player = await get_player(ctx.guild)
         infos, skipped = await player.add_track(
             query, ctx.author, playlist=False, prio=True
         )
@@ -178,33 +352,33 @@ def setup(bot):
         # If VC is paused, don't resume — just add to priority queue.
         if vc.is_paused():
             embed.add_field(name="Note", value="Playback is currently paused.")
-        elif not vc.is_playing():
-            await player.play_next(interactor=ctx.author, bot=bot)
-            await send_message(ctx, embed=embed)
         else:
+            await player.start_if_idle(interactor=ctx.author, bot=bot)
             await send_message(ctx, embed=embed)
 
-        for track in skipped:
-            await send_message(ctx, f"**{track['title']}** is already in the queue!")
+        await send_notices(
+            ctx, [f"**{track['title']}**" for track in skipped], title="Already in the queue"
+        )
 
     @bot.command(name="q")
-    async def queue(ctx):
-        """Show the current queue."""
+    async def queue(ctx, page: int = 1):
+        """Show the current queue. Usage: q [page]"""
         vc = await ensure_voice(ctx)
-        player = get_player(ctx.guild)
-        if not player.queue and not (
+        player = await get_player(ctx.guild)
+        if not (player.queue or player.now_queue) and not (
             ctx.voice_client and ctx.voice_client.is_playing()
         ):
             return await send_message(ctx, "Queue is empty.")
-        embed = make_queue_embed(player)
-        if vc.is_paused():
+        view = QueueView(player, page=page - 1)
+        embed = make_queue_embed(player.snapshot(), view.page)
+        if vc and vc.is_paused():
             embed.add_field(name="Note", value="Playback is currently paused.")
-        await send_message(ctx, embed=embed)
+        await send_message(ctx, embed=embed, view=view if view.pages > 1 else None)
 
     @bot.command(name="s")
     async def skip(ctx, index: int = 0):
         """Skip current track or remove queued track by index. Usage: s [index]"""
-        player = get_player(ctx.guild)
+        player = await get_player(ctx.guild)
         vc = ctx.voice_client
 
         if index == 0:
@@ -224,10 +398,7 @@ def setup(bot):
         if index < 1 or index > total:
             return await send_message(ctx, f"Invalid index. Queue has {total} track(s).")
 
-        if index <= len(player.now_queue):
-            track = player.now_queue.pop(index - 1)
-        else:
-            track = player.queue.pop(index - 1 - len(player.now_queue))
+        track = player.remove_at(index)
 
         await send_message(ctx, f"Removed **{track['title']}** from the queue.")
 
@@ -235,14 +406,14 @@ def setup(bot):
     async def stop(ctx):
         """Stop playback and clear the queue."""
         if ctx.voice_client:
-            get_player(ctx.guild).clear()
+            (await get_player(ctx.guild)).clear()
             ctx.voice_client.stop()
             await send_message(ctx, "Stopped and cleared the queue.")
             
     @bot.command(name="pause")
     async def toggle_pause(ctx):
         """Toggle pause/resume for the current track."""
-        player = get_player(ctx.guild)
+        player = await get_player(ctx.guild)
         vc = ctx.voice_client
         if not vc:
             return await send_message(ctx, "I'm not connected to a voice channel.")
@@ -254,6 +425,7 @@ def setup(bot):
             else:
                 player.paused_offset = None
             vc.pause()
+            player.changed()
             await send_message(ctx, f"Paused **{player.current['title']}**.")
         elif vc.is_paused():
             # restore start_time so elapsed = now - start_time resumes correctly
@@ -266,6 +438,7 @@ def setup(bot):
                 except Exception:
                     pass
             vc.resume()
+            player.changed()
             await send_message(ctx, f"Resumed **{player.current['title']}**.")
         else:
             await send_message(ctx, "Nothing is currently playing.")
@@ -273,14 +446,14 @@ def setup(bot):
     @bot.command(name="clear")
     async def clear(ctx):
         """Clear the queue."""
-        get_player(ctx.guild).clear()
+        (await get_player(ctx.guild)).clear()
         await send_message(ctx, "Cleared the queue.")
 
     @bot.command(name="shuffle")
     async def shuffle(ctx):
         """Shuffle the queue."""
-        player = get_player(ctx.guild)
-        random.shuffle(player.queue)
+        player = await get_player(ctx.guild)
+        player.shuffle()
         await send_message(ctx, "Queue shuffled.")
 
     @bot.command(name="seek")
@@ -295,41 +468,14 @@ def setup(bot):
         except ValueError:
             return await send_message(ctx, "Invalid time format. Use ss, mm:ss or hh:mm:ss.")
 
-        player = get_player(ctx.guild)
+        player = await get_player(ctx.guild)
         info = player.current
         duration = info.get("duration")
         if duration and seconds >= duration:
             return await send_message(ctx, "Seek position is beyond track length.")
 
-        volume = vc.source.volume if hasattr(vc.source, "volume") else 0.5
-
-        # Fetch fresh stream URL before stopping to minimize silence gap
-        fresh_source = await YTDLSource.from_url(info["webpage_url"], loop=bot.loop, stream=True)
-        real_url = fresh_source.data["url"]
-
-        new_ffmpeg = discord.FFmpegPCMAudio(real_url, **{
-            "before_options": f"-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -ss {seconds}",
-            "options": "-vn",
-        })
-        wrapped = discord.PCMVolumeTransformer(new_ffmpeg, volume=volume)
-        wrapped.data = fresh_source.data
-
-        # Set flag so after_play skips play_next when vc.stop() fires
-        player.seeking = True
-        vc.stop()
-
-        player.start_time = time.time() - seconds
-        player.paused_offset = None
-
-        def after_seek(err):
-            if err:
-                print(f"Seek playback error: {err}")
-            player.seeking = False
-            asyncio.run_coroutine_threadsafe(
-                player.play_next(ctx.author, bot=bot), bot.loop
-            )
-
-        vc.play(wrapped, after=after_seek)
+        if not await player.seek(seconds, interactor=ctx.author, bot=bot):
+            return await send_message(ctx, "The track changed before the seek finished.")
 
         await send_message(ctx, f"Seeked to {format_duration(seconds)} in **{info['title']}**")
 
@@ -408,16 +554,17 @@ def setup(bot):
                     timeframe = "all"
                     timeframe_display = "All Time"
             
-            # Clean up old images before generating new ones
-            Analytics.cleanup_old_images()
-            
-            # Create analytics instance with time filters
-            analytics = Analytics(start_date=start_date, end_date=end_date)
-            
-            if analytics.is_empty():
-                return await send_message(ctx, f"No music data available for {timeframe_display.lower()}. Start queuing songs!")
+            with span("analytics.import"):
+                analytics_module = await load_analytics()
+
+            if user:
+                await send_message(ctx, f"Generating wrap for {user.mention}...")
+            else:
+                await send_message(ctx, "Generating server-wide wrap... This may take a moment.")
+
+            loop = asyncio.get_event_loop()
 
-            async def resolve_user_name(user_id: int) -> str:
+            def resolve_user_name(user_id: int) -> str:
                 member = ctx.guild.get_member(user_id) if ctx.guild else None
                 if member:
                     return member.display_name
@@ -427,151 +574,43 @@ def setup(bot):
                     return cached_user.name
 
                 try:
-                    fetched_user = await bot.fetch_user(user_id)
+                    # called on the wrap thread: let the loop fetch the user
+                    fetched_user = asyncio.run_coroutine_threadsafe(bot.fetch_user(user_id), loop).result(10)
                     return fetched_user.name
                 except Exception:
                     return f"User {user_id}"
-            
-            # If user specified, show user-specific wrap
-            if user:
-                user_stats = analytics.get_user_stats(user.id)
-                if not user_stats:
-                    return await send_message(ctx, f"No data available for {user.mention}")
-                
-                # Generate user summary image
-                await send_message(ctx, f"Generating wrap for {user.mention}...")
-                summary_path = analytics.create_user_summary(user.id, user_name=user.name)
-                
-                # Create embed with user stats
-                embed = discord.Embed(
-                    title=f"Music Wrap - {user.name} ({timeframe_display})",
-                    color=discord.Color.purple(),
-                    description="Here's your personalized music wrap!"
-                )
-                
-                total_hours = user_stats['total_duration'] / 3600
-                embed.add_field(name="Total Songs", value=f"{user_stats['total_songs']}", inline=True)
-                embed.add_field(name="Total Duration", value=f"{total_hours:.1f} hours", inline=True)
-                embed.add_field(name="Top Genre", 
-                              value=next(iter(user_stats['top_genres'].keys())) if user_stats['top_genres'] else "Unknown", 
-                              inline=True)
-                
-                if user_stats['top_genres']:
-                    genres_str = "\n".join([f"{g}: {c}" for g, c in list(user_stats['top_genres'].items())[:5]])
-                    embed.add_field(name="Top Genres", value=genres_str, inline=False)
-                
-                if user_stats['top_songs']:
-                    songs_str = "\n".join([f"{s}: {c}" for s, c in list(user_stats['top_songs'].items())[:5]])
-                    embed.add_field(name="Top Songs", value=songs_str, inline=False)
-                
-                # Send summary image
-                await send_message(ctx, embed=embed)
-                try:
-                    with open(summary_path, 'rb') as f:
-                        await ctx.channel.send(file=discord.File(f, filename="user_wrap.png"))
-                except Exception as e:
-                    print(f"Error sending user wrap image: {e}")
-                    
-            else:
-                # Server-wide wrap
-                await send_message(ctx, "Generating server-wide wrap... This may take a moment.")
 
-                requester_ids = [int(uid) for uid in analytics.df['requester_id'].dropna().unique().tolist()]
-                user_name_map = {}
-                for requester_id in requester_ids:
-                    user_name_map[requester_id] = await resolve_user_name(requester_id)
-                analytics.user_name_map = user_name_map
-                
-                # Generate all visualization images
-                images_to_send = []
-                
-                # Activity heatmap
-                try:
-                    heatmap_path = analytics.create_activity_heatmap()
-                    images_to_send.append(("Activity Heatmap", heatmap_path))
-                except Exception as e:
-                    print(f"Error creating heatmap: {e}")
-                
-                # Top posters
-                try:
-                    posters_path = analytics.create_top_posters_chart()
-                    images_to_send.append(("Top Requesters", posters_path))
-                except Exception as e:
-                    print(f"Error creating top posters chart: {e}")
-                
-                # Longest posters
-                try:
-                    longest_path = analytics.create_longest_posters_chart()
-                    images_to_send.append(("Longest Duration", longest_path))
-                except Exception as e:
-                    print(f"Error creating longest posters chart: {e}")
-                
-                # Genres
-                try:
-                    genres_path = analytics.create_genres_chart()
-                    images_to_send.append(("Top Genres", genres_path))
-                except Exception as e:
-                    print(f"Error creating genres chart: {e}")
-                
-                # Years
-                try:
-                    years_path = analytics.create_years_chart()
-                    images_to_send.append(("Songs by Year", years_path))
-                except Exception as e:
-                    print(f"Error creating years chart: {e}")
-                
-                # Most played songs
-                try:
-                    played_path = analytics.create_most_played_chart()
-                    images_to_send.append(("Most Played Songs", played_path))
-                except Exception as e:
-                    print(f"Error creating most played chart: {e}")
-                
-                # Create main summary embed
-                embed = discord.Embed(
-                    title=f"Server Music Wrap ({timeframe_display})",
-                    color=discord.Color.gold(),
-                    description="Here's your server's music wrap!"
-                )
-                
-                total_songs = len(analytics.df)
-                total_duration = analytics.df['duration'].sum() or 0
-                total_hours = total_duration / 3600
-                
-                embed.add_field(name="Total Songs Queued", value=f"{total_songs}", inline=True)
-                embed.add_field(name="Total Duration", value=f"{total_hours:.1f} hours", inline=True)
-                
-                top_posters = analytics.get_top_posters(5)
-                if top_posters:
-                    posters_str = "\n".join([f"<@{p['user_id']}>: {p['count']} songs" for p in top_posters])
-                    embed.add_field(name="Top Requesters", value=posters_str, inline=False)
-                
-                top_genres = analytics.get_top_genres(5)
-                if top_genres:
-                    genres_str = "\n".join([f"{g['genre']}: {g['count']}" for g in top_genres])
-                    embed.add_field(name="Top Genres", value=genres_str, inline=False)
-                
-                top_songs = analytics.get_most_played_songs(5)
-                if top_songs:
-                    songs_str = "\n".join([f"{s['title']}: {s['count']} times" for s in top_songs[:5]])
-                    embed.add_field(name="Most Played", value=songs_str, inline=False)
-                
-                top_years = analytics.get_top_years(3)
-                if top_years:
-                    years_str = "\n".join([f"{y['year']}: {y['count']} songs" for y in top_years])
-                    embed.add_field(name="Top Years", value=years_str, inline=False)
-                
-                await send_message(ctx, embed=embed)
-                
-                # Send all generated images
-                for title, path in images_to_send:
-                    try:
-                        with open(path, 'rb') as f:
-                            await ctx.channel.send(f"**{title}**", file=discord.File(f, filename=f"{title.lower().replace(' ', '_')}.png"))
-                    except Exception as e:
-                        print(f"Error sending {title} image: {e}")
-                        
+            # Loading, querying and rendering all block (SQLite, pandas,
+            # matplotlib), so the whole wrap is built in one executor call and
+            # the analytics connection never leaves that thread.
+            with span("analytics.wrap"):
+                wrap = await loop.run_in_executor(None, functools.partial(
+                    contextvars.copy_context().run, build_wrap, analytics_module,
+                    user, start_date, end_date, timeframe_display, resolve_user_name,
+                ))
+
+            if "message" in wrap:
+                return await send_message(ctx, wrap["message"])
+            await send_message(ctx, embed=wrap["embed"])
+
+            # Send all generated images as attachments of a single message
+            try:
+                files = [
+                    discord.File(path, filename=filename)
+                    for _, filename, path in wrap["images"]
+                ]
+                if files:
+                    if user:
+                        await send_message(ctx, files=files)
+                    else:
+                        titles = ", ".join(f"**{title}**" for title, _, _ in wrap["images"])
+                        await send_message(ctx, titles, files=files)
+            except Exception as e:
+                ERRORS_TOTAL.inc(where="wrap")
+                print(f"Error sending wrap images: {e}")
+
         except Exception as e:
+            ERRORS_TOTAL.inc(where="wrap")
             print(f"Error generating wrap: {e}")
             await send_message(ctx, f"Error generating wrap: {e}")
 
@@ -580,25 +619,35 @@ def setup(bot):
     async def restart(ctx):
         """A command to restart the bot. Usage: ifuckedup"""
         import sys
-        await send_message(ctx, "Yes, you definitely fucked up.")
+        await send_message(ctx, "Yes, you definitely fucked up.", wait=True)
+        await save_all()
         sys.exit(0)
 
     @bot.event
     async def on_command_error(ctx, error):
+        ERRORS_TOTAL.inc(where="command")
         print(f"Error in command {ctx.command}: {error}")
-        try:
-            await send_message(ctx, f"An error occurred: ```{error}```")
-        except discord.Forbidden:
-            pass
+        # queued; a failed send is counted and logged by the dispatcher
+        await send_message(ctx, f"An error occurred: ```{error}```")
 
     @bot.before_invoke
     async def cleanup(ctx):
+        ctx.trace = start_trace(f"command.{ctx.command}", guild=ctx.guild.id if ctx.guild else None)
         try:
-            await ctx.message.delete()
+            with span("message.delete"):
+                await ctx.message.delete()
         except discord.Forbidden:
-            await ctx.send("I don't have permission to delete command messages.")
+            await send_message(ctx, "I don't have permission to delete command messages.")
         except discord.HTTPException as e:
-            await ctx.send(f"Failed to delete the command message: {e}")
+            await send_message(ctx, f"Failed to delete the command message: {e}")
+
+    @bot.after_invoke
+    async def finish_command_trace(ctx):
+        root = getattr(ctx, "trace", None)
+        if root:
+            if ctx.command_failed:
+                root.error = "command failed"
+            finish_trace(root)
 
     @bot.event
     async def on_message(message: discord.Message):
@@ -632,9 +681,11 @@ def setup(bot):
             except Exception:
                 pass
             # call the play command callback directly, passing the message content as the query
-            await bot.get_command("p").callback(ctx, query=message.content)
+            with trace("command.autoplay", guild=message.guild.id if message.guild else None):
+                await bot.get_command("p").callback(ctx, query=message.content)
 
         except Exception as e:
+            ERRORS_TOTAL.inc(where="autoplay")
             print(f"Error handling autoplay message: {e}")
 
         # Also allow the normal command processing in case the message contained a command.
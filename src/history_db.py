@@ -0,0 +1,136 @@
+"""
+SQLite mirror of the play log for the `sqlite` analytics backend.
+
+plays.parquet and tracks.parquet are append-only (Logger rewrites them with
+the new rows at the end and hands out dense track IDs), so the mirror only
+imports what was added since the last sync: the tail of plays past the
+highest imported position and tracks past the highest imported track_id.
+Plays are read batch by batch, so syncing never holds the whole log in memory.
+
+played_at is stored as integer microseconds of the logged (naive, local)
+time, which keeps the `played_at` and `requester_id` indexes compact and lets
+hour/weekday be computed arithmetically.
+"""
+import importlib.util
+import os
+from datetime import datetime, timedelta
+
+import store
+from logger import PLAYS_FILE, TRACKS_FILE, migrate_log
+
+# pandas (default), sqlite (this mirror) or duckdb (queries over the Parquet files).
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "pandas").lower()
+
+
+def analytics_backend() -> str:
+    """The backend actually used: duckdb falls back to sqlite when it is not installed."""
+    if ANALYTICS_BACKEND == "duckdb" and importlib.util.find_spec("duckdb") is None:
+        return "sqlite"
+    return ANALYTICS_BACKEND
+
+EPOCH = datetime(1970, 1, 1)
+SYNC_BATCH_ROWS = 65536
+
+
+def to_micros(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+class HistoryDB:
+    def __init__(self, log_dir="log", filename="history.sqlite3"):
+        self.log_dir = log_dir
+        self.conn = store.connect(filename, log_dir)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS plays ("
+            " pos INTEGER PRIMARY KEY, track_id INTEGER NOT NULL,"
+            " requester_id INTEGER NOT NULL, played_at INTEGER NOT NULL);"
+            # covering: time-range and per-requester queries never touch the table
+            "CREATE INDEX IF NOT EXISTS plays_played_at ON plays (played_at, requester_id, track_id);"
+            "CREATE INDEX IF NOT EXISTS plays_requester ON plays (requester_id, played_at, track_id);"
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " track_id INTEGER PRIMARY KEY, url TEXT, title TEXT, genre TEXT,"
+            " upload_date TEXT, duration REAL);"
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def sync(self) -> int:
+        """Import plays and tracks logged since the last sync; returns the number of new plays."""
+        plays_file = os.path.join(self.log_dir, PLAYS_FILE)
+        if not os.path.exists(plays_file):
+            # an unmigrated log is converted here rather than read in one piece
+            if migrate_log(self.log_dir) is None:
+                return 0
+
+        import pyarrow.parquet as pq
+
+        # One writer at a time across shard processes; readers keep going (WAL).
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._sync_tracks(pq)
+            added = self._sync_plays(pq, plays_file)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return added
+
+    def _sync_tracks(self, pq):
+        last_id = self.conn.execute("SELECT COALESCE(MAX(track_id), -1) FROM tracks").fetchone()[0]
+        table = pq.read_table(
+            os.path.join(self.log_dir, TRACKS_FILE), filters=[("track_id", ">", last_id)]
+        )
+        upload_dates = [
+            None if value is None else value.strftime("%Y-%m-%d")
+            for value in table.column("upload_date").to_pylist()
+        ]
+        self.conn.executemany(
+            "INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?)",
+            zip(*(table.column(name).to_pylist() for name in ("track_id", "url", "title", "genre")),
+                upload_dates, table.column("duration").to_pylist()),
+        )
+
+    def _sync_plays(self, pq, plays_file) -> int:
+        import pyarrow as pa
+
+        parquet = pq.ParquetFile(plays_file)
+        total = parquet.metadata.num_rows
+        start = self.conn.execute("SELECT COALESCE(MAX(pos), -1) FROM plays").fetchone()[0] + 1
+        if total < start:
+            # the log was replaced by a shorter one: rebuild from scratch
+            self.conn.execute("DELETE FROM plays")
+            start = 0
+        if total == start:
+            return 0
+
+        # skip whole row groups that were already imported
+        first, offset = 0, 0
+        while first < parquet.num_row_groups:
+            rows = parquet.metadata.row_group(first).num_rows
+            if offset + rows > start:
+                break
+            offset += rows
+            first += 1
+
+        pos = offset
+        for batch in parquet.iter_batches(
+            batch_size=SYNC_BATCH_ROWS, row_groups=range(first, parquet.num_row_groups),
+            columns=["track_id", "requester_id", "played_at"],
+        ):
+            batch_start, pos = pos, pos + batch.num_rows
+            if pos <= start:
+                continue
+            new = batch.slice(max(0, start - batch_start))
+            played_at = new.column("played_at").cast(pa.timestamp("us"), safe=False).cast(pa.int64())
+            self.conn.executemany(
+                "INSERT INTO plays VALUES (?, ?, ?, ?)",
+                zip(
+                    range(pos - new.num_rows, pos),
+                    new.column("track_id").to_pylist(),
+                    new.column("requester_id").to_pylist(),
+                    played_at.to_pylist(),
+                ),
+            )
+        return total - start
@@ -1,25 +1,157 @@
 import os
-import pandas as pd
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 
+import store
+from metrics import LOG_WRITE_SECONDS
+from store import file_lock
+
+# The play log is split into a fact table with one compact row per play
+# (track_id, requester_id, played_at) and a dimension table with one row per
+# distinct track. music_log.parquet is the older single-table log, which
+# repeated every track's metadata on every play. Parquet files cannot be
+# appended to, so logging rewrites plays.parquet: a write costs O(plays
+# logged so far), which is why Logger batches plays and writes them on a
+# worker thread.
+#
+# Track IDs are dense (0..n-1, in order of first play) and readers use them as
+# row positions, so tracks.parquet is always written before the plays that
+# reference it. If the plays write then fails, the new tracks stay behind as
+# orphans with no plays: every reader goes from plays to tracks, so they are
+# never counted, and the next play of the same URL reuses the orphan's ID.
+PLAYS_FILE = "plays.parquet"
+TRACKS_FILE = "tracks.parquet"
+LEGACY_FILE = "music_log.parquet"
+
+PLAY_COLUMNS = ["track_id", "requester_id", "played_at"]
+TRACK_COLUMNS = ["track_id", "url", "title", "genre", "upload_date", "duration"]
+
+
+def _typed_plays(df):
+    import pandas as pd
+
+    return pd.DataFrame({
+        "track_id": df["track_id"].astype("int32"),
+        "requester_id": df["requester_id"].astype("int64"),
+        "played_at": pd.to_datetime(df["played_at"]),
+    })
+
+
+def _typed_tracks(df):
+    import pandas as pd
+
+    return pd.DataFrame({
+        "track_id": df["track_id"].astype("int32"),
+        "url": df["url"].astype("string"),
+        "title": df["title"].astype("string"),
+        "genre": df["genre"].astype("string"),
+        "upload_date": pd.to_datetime(df["upload_date"], errors="coerce"),
+        "duration": pd.to_numeric(df["duration"], errors="coerce").astype("float32"),
+    })
+
+
+def _write_atomic(df, path: str):
+    # swap the new file in atomically so readers never see a partial one
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_file, index=False)
+    os.replace(tmp_file, path)
+
+
+def split_log(df):
+    """Split a single-table play log into (plays, tracks), one track per URL."""
+    import pandas as pd
+
+    codes, _ = pd.factorize(df["url"])
+    latest = df.assign(track_id=codes).drop_duplicates("track_id", keep="last")
+    tracks = _typed_tracks(latest.sort_values("track_id")).reset_index(drop=True)
+    plays = _typed_plays(df.assign(track_id=codes)).reset_index(drop=True)
+    return plays, tracks
+
+
+def read_log(log_dir: str = "log"):
+    """
+    Load the play log as (plays, tracks) DataFrames.
+
+    A log not yet migrated is split in memory, so readers work either way.
+    """
+    # lazy, like every pandas import in this module (see Logger.log_track)
+    import pandas as pd
+
+    plays_file = os.path.join(log_dir, PLAYS_FILE)
+    if os.path.exists(plays_file):
+        return pd.read_parquet(plays_file), pd.read_parquet(os.path.join(log_dir, TRACKS_FILE))
+    legacy_file = os.path.join(log_dir, LEGACY_FILE)
+    if os.path.exists(legacy_file):
+        return split_log(pd.read_parquet(legacy_file))
+    empty = pd.DataFrame({"track_id": [], "requester_id": [], "played_at": [], "url": [],
+                          "title": [], "genre": [], "upload_date": [], "duration": []})
+    return _typed_plays(empty), _typed_tracks(empty)
+
+
+def join_log(plays, tracks):
+    """Single-table view of the log (the old music_log.parquet columns)."""
+    return plays.merge(tracks, on="track_id", how="left")[
+        ["title", "url", "requester_id", "genre", "upload_date", "duration", "played_at"]
+    ]
+
+
+def _migrate(log_dir: str) -> dict | None:
+    # caller holds the plays file lock
+    plays_file = os.path.join(log_dir, PLAYS_FILE)
+    legacy_file = os.path.join(log_dir, LEGACY_FILE)
+    if os.path.exists(plays_file) or not os.path.exists(legacy_file):
+        return None
+
+    import pandas as pd
+
+    plays, tracks = split_log(pd.read_parquet(legacy_file))
+    tracks_file = os.path.join(log_dir, TRACKS_FILE)
+    _write_atomic(tracks, tracks_file)
+    _write_atomic(plays, plays_file)
+    stats = {
+        "plays": len(plays),
+        "tracks": len(tracks),
+        "legacy_bytes": os.path.getsize(legacy_file),
+        "bytes": os.path.getsize(plays_file) + os.path.getsize(tracks_file),
+    }
+    os.replace(legacy_file, f"{legacy_file}.migrated")
+    return stats
+
+
+def migrate_log(log_dir: str = "log") -> dict | None:
+    """
+    Convert music_log.parquet into plays.parquet + tracks.parquet.
+
+    The old file is kept as music_log.parquet.migrated. Returns row and size
+    counts, or None if there was nothing to migrate.
+    """
+    with file_lock(os.path.join(log_dir, PLAYS_FILE)):
+        return _migrate(log_dir)
+
 
 class Logger:
-    def __init__(self, log_dir="log", filename="music_log.parquet"):
+    """
+    Appends plays to the log.
+
+    log_tracks() queues a batch of plays on a single writer thread, which
+    keeps them in order and keeps the file lock and the rewrite of
+    plays.parquet (O(history) per batch) off the event loop.
+    """
+
+    def __init__(self, log_dir="log", index=None, sketches=None):
         self.log_dir = log_dir
-        self.log_file = os.path.join(self.log_dir, filename)
+        self.plays_file = os.path.join(self.log_dir, PLAYS_FILE)
+        self.tracks_file = os.path.join(self.log_dir, TRACKS_FILE)
+        # Optional SearchIndex kept up to date with every logged track.
+        self.index = index
+        # Optional SketchStore counting every play (approximate analytics);
+        # used from the writer thread only.
+        self.sketches = sketches
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="play-log")
         os.makedirs(self.log_dir, exist_ok=True)
-        self.columns = [
-            "title",
-            "url",
-            "requester_id",
-            "genre",
-            "upload_date",
-            "duration",
-            "played_at",
-        ]
-        if not os.path.exists(self.log_file):
-            pd.DataFrame(columns=self.columns).to_parquet(
-                self.log_file, index=False)
+        self._tracks = None
+        self._track_ids = {}
+        self._tracks_mtime = None
 
     def _normalize_info(self, info_dict: dict, requester_id: int) -> dict:
         """
@@ -56,22 +188,80 @@ class Logger:
             "played_at": datetime.now(),
         }
 
-    def log_track(self, info_dict: dict, requester_id: int):
+    def _load_tracks(self):
+        """Track dimension and its URL -> track_id map, re-read only when the file changed."""
+        import pandas as pd
+
+        mtime = os.stat(self.tracks_file).st_mtime_ns if os.path.exists(self.tracks_file) else None
+        if self._tracks is None or mtime != self._tracks_mtime:
+            if mtime is None:
+                self._tracks = _typed_tracks(pd.DataFrame(columns=TRACK_COLUMNS))
+            else:
+                self._tracks = pd.read_parquet(self.tracks_file)
+            self._track_ids = dict(zip(self._tracks["url"], self._tracks["track_id"]))
+            self._tracks_mtime = mtime
+        return self._tracks
+
+    def log_tracks(self, info_dicts: list, requester_id: int) -> Future:
         """
-        Append a track to the Parquet log.
+        Queue plays for the writer thread; returns the Future of their write.
+
+        Play times are taken now; the search index is updated on the store
+        thread, without waiting on the (slower) log write.
         """
-        row = self._normalize_info(info_dict, requester_id)
-        df = pd.read_parquet(self.log_file)
-        df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-        df.to_parquet(self.log_file, index=False)
+        rows = [self._normalize_info(info, requester_id) for info in info_dicts]
+        if self.index is not None:
+            store.submit(self.index.add, list(info_dicts), where="search_index")
+        return self._writer.submit(self._write, rows)
 
+    def flush(self):
+        """Wait until every queued play is written (blocks)."""
+        self._writer.submit(lambda: None).result()
 
-if __name__ == "__main__":
-    # Path to your log file
-    log_file = "log/music_log.parquet"
+    def log_track(self, info_dict: dict, requester_id: int):
+        """Append a play to the log and wait for the write (blocks; see log_tracks)."""
+        self.log_tracks([info_dict], requester_id).result()
 
-    # Load the Parquet file into a DataFrame
-    df = pd.read_parquet(log_file)
+    def _write(self, rows: list):
+        """Append plays, adding new tracks to the dimension table; one rewrite per batch."""
+        # pandas is imported on first use rather than at module load, so
+        # importing the bot (music -> logger) does not pay for it; main warms
+        # the import in an executor at startup so the first play does not either.
+        import pandas as pd
 
-    # Display the last few rows
-    print(df.tail())
+        # Shard processes share the log files: serialize the read-modify-write.
+        with LOG_WRITE_SECONDS.time(), file_lock(self.plays_file):
+            _migrate(self.log_dir)
+
+            tracks = self._load_tracks()
+            track_ids, new_ids, new_tracks = [], {}, []
+            for row in rows:
+                track_id = self._track_ids.get(row["url"], new_ids.get(row["url"]))
+                if track_id is None:
+                    track_id = new_ids[row["url"]] = len(tracks) + len(new_ids)
+                    new_tracks.append({**row, "track_id": track_id})
+                track_ids.append(track_id)
+            if new_tracks:
+                new_tracks = _typed_tracks(pd.DataFrame(new_tracks))
+                tracks = pd.concat([tracks, new_tracks], ignore_index=True) if len(tracks) else new_tracks
+                _write_atomic(tracks, self.tracks_file)
+                self._tracks = tracks
+                self._track_ids.update(new_ids)
+                self._tracks_mtime = os.stat(self.tracks_file).st_mtime_ns
+
+            plays = _typed_plays(pd.DataFrame(
+                [{**row, "track_id": track_id} for row, track_id in zip(rows, track_ids)]))
+            if os.path.exists(self.plays_file):
+                plays = pd.concat([pd.read_parquet(self.plays_file), plays], ignore_index=True)
+            # a failure here leaves orphan tracks behind (see the module comment)
+            _write_atomic(plays, self.plays_file)
+            # under the lock, so a concurrent sketch backfill sees each play exactly once
+            if self.sketches is not None:
+                for row in rows:
+                    self.sketches.add(row)
+
+
+if __name__ == "__main__":
+    # Display the last few plays
+    plays, tracks = read_log("log")
+    print(join_log(plays, tracks).tail())
@@ -0,0 +1,124 @@
+"""
+Event-loop blocking detector.
+
+A ticker task on the loop measures how late it wakes up (event-loop lag) and
+publishes it as a histogram. A separate watcher thread checks the ticker's
+heartbeat; when the loop has not ticked for longer than the threshold, the
+loop is blocked in synchronous code, so the watcher captures the loop thread's
+current stack, which shows the coroutine (and the call inside it) holding the
+loop.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+
+from metrics import Counter, Histogram
+
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "How late the event loop ticker woke up.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_BLOCKS_TOTAL = Counter(
+    "event_loop_blocks_total", "Times the event loop was blocked longer than the watchdog threshold.")
+
+BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250"))
+
+
+@dataclass
+class BlockEvent:
+    started_at: float
+    duration: float
+    stack: list[str] = field(default_factory=list)
+
+    def format(self) -> str:
+        return f"Event loop blocked for {self.duration * 1000:.0f}ms:\n" + "".join(self.stack)
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms: float = BLOCK_THRESHOLD_MS, interval: float = 0.05,
+                 report=True, max_events=100):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.report = report
+        self.max_events = max_events
+        self.events: list[BlockEvent] = []
+        self.max_lag = 0.0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start watching the running event loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            self._thread.join()
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            self._last_beat = time.monotonic()
+
+    def _watch(self):
+        current = None
+        while not self._stopped.wait(self.interval / 2):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat - self.interval
+
+            if current is not None and beat > current.started_at:
+                # the loop ticked again: the block is over
+                self._finish(current)
+                current = None
+
+            if current is None and stalled > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                stack = self._format_stack(frame) if frame else []
+                current = BlockEvent(started_at=beat, duration=stalled, stack=stack)
+            elif current is not None:
+                current.duration = stalled
+
+        if current is not None:
+            self._finish(current)
+
+    @staticmethod
+    def _format_stack(frame) -> list[str]:
+        """Format a stack, dropping the event loop's own frames above the callback."""
+        summary = traceback.extract_stack(frame)
+        for i, entry in enumerate(summary):
+            # asyncio.events.Handle._run invokes the callback/task step that blocks
+            if entry.name == "_run" and entry.filename == asyncio.events.__file__:
+                summary = summary[i + 1:] or summary
+                break
+        return traceback.format_list(summary)
+
+    def _finish(self, event: BlockEvent):
+        LOOP_BLOCKS_TOTAL.inc()
+        if len(self.events) < self.max_events:
+            self.events.append(event)
+        if self.report:
+            print(event.format())
@@ -0,0 +1,124 @@
+"""
+Per-track loudness normalization without per-stream filtering.
+
+The first time a track plays, a background ffmpeg pass measures the EBU R128
+integrated loudness of its opening LOUDNESS_SAMPLE_SECONDS and stores it by
+URL. Every later play turns the stored value into a static volume factor on
+the PCMVolumeTransformer, so playback itself never runs a loudness filter.
+"""
+import asyncio
+import os
+import re
+import shlex
+import time
+
+import store
+from metrics import Counter
+
+LOUDNESS_ANALYSES = Counter(
+    "loudness_analyses_total", "Background loudness measurements by result.")
+
+LOUDNESS_NORMALIZE = os.getenv("LOUDNESS_NORMALIZE", "1") != "0"
+LOUDNESS_TARGET = float(os.getenv("LOUDNESS_TARGET", "-14"))
+LOUDNESS_SAMPLE_SECONDS = float(os.getenv("LOUDNESS_SAMPLE_SECONDS", "60"))
+LOUDNESS_CONCURRENCY = int(os.getenv("LOUDNESS_CONCURRENCY", "1"))
+
+# Gain is kept within this range; PCMVolumeTransformer caps volume at 2.0.
+MAX_GAIN_DB = 12.0
+MIN_GAIN_DB = -20.0
+
+_INPUT_I_RE = re.compile(r'"input_i"\s*:\s*"(-?\d+(?:\.\d+)?)"')
+
+
+def parse_loudnorm(stderr: str) -> float | None:
+    """Integrated loudness (LUFS) from loudnorm's JSON summary, if measurable."""
+    matches = _INPUT_I_RE.findall(stderr)
+    if not matches:
+        return None
+    lufs = float(matches[-1])
+    # silence (or a failed decode) reports -70 LUFS or below
+    return lufs if lufs > -70 else None
+
+
+class LoudnessStore:
+    """Measured loudness by URL; used through store.run, off the event loop."""
+
+    def __init__(self, state_dir=None, filename="loudness.sqlite3"):
+        self.conn = store.connect(filename, state_dir, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS loudness ("
+            "url TEXT PRIMARY KEY, lufs REAL NOT NULL, measured_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, url: str) -> float | None:
+        row = self.conn.execute("SELECT lufs FROM loudness WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, url: str, lufs: float):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO loudness (url, lufs, measured_at) VALUES (?, ?, ?)",
+            (url, lufs, time.time()),
+        )
+        self.conn.commit()
+
+
+class LoudnessAnalyzer:
+    def __init__(self, loudness_store=None, target=LOUDNESS_TARGET,
+                 sample_seconds=LOUDNESS_SAMPLE_SECONDS, concurrency=LOUDNESS_CONCURRENCY):
+        self.store = loudness_store or LoudnessStore()
+        self.target = target
+        self.sample_seconds = sample_seconds
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.pending = set()
+
+    async def gain(self, url: str) -> float | None:
+        """Volume factor bringing url to the target loudness, or None if not measured yet."""
+        lufs = await store.run(self.store.get, url)
+        if lufs is None:
+            return None
+        gain_db = min(MAX_GAIN_DB, max(MIN_GAIN_DB, self.target - lufs))
+        return 10 ** (gain_db / 20)
+
+    def schedule(self, url: str, stream_url: str, before_options: str = ""):
+        """Measure url in the background unless already queued (call when gain() is None)."""
+        if not url or not stream_url or url in self.pending:
+            return
+        self.pending.add(url)
+        asyncio.ensure_future(self._analyze(url, stream_url, before_options))
+
+    async def _analyze(self, url, stream_url, before_options):
+        try:
+            async with self.semaphore:
+                lufs = await self.measure(stream_url, before_options)
+        except Exception as e:
+            LOUDNESS_ANALYSES.inc(result="error")
+            print(f"Error measuring loudness: {e}")
+            return
+        finally:
+            self.pending.discard(url)
+        if lufs is None:
+            LOUDNESS_ANALYSES.inc(result="unmeasurable")
+            return
+        await store.run(self.store.put, url, lufs)
+        LOUDNESS_ANALYSES.inc(result="measured")
+
+    async def measure(self, stream_url: str, before_options: str = "") -> float | None:
+        """Run ffmpeg's loudnorm in analysis mode over the opening of a stream."""
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-nostats", *shlex.split(before_options),
+            "-t", f"{self.sample_seconds:g}", "-i", stream_url,
+            "-vn", "-af", "loudnorm=print_format=json", "-f", "null", "-",
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(
+                process.communicate(), timeout=self.sample_seconds + 60
+            )
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            process.kill()
+            await process.wait()
+            raise
+        return parse_loudnorm(stderr.decode(errors="replace"))
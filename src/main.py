@@ -1,26 +1,151 @@
+import importlib
 import os
+import signal
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
-import commands as music_commands
 
+# Before the bot modules: they read their settings from the environment at import.
 load_dotenv()
 
+import asyncio
+import commands as music_commands
+import history_db
+import metrics
+import music
+from loop_watchdog import LoopWatchdog
+from reaper import IdleReaper
+
 TOKEN = os.getenv("DISCORD_TOKEN")
 DEBUG = os.getenv("DISCORD_DEBUG")
+# Sharding: DISCORD_SHARD_COUNT enables AutoShardedBot ("auto" lets Discord pick
+# the count); DISCORD_SHARD_IDS restricts this process to a subset of shards,
+# which is how shards.py spreads them over several processes.
+SHARD_COUNT = os.getenv("DISCORD_SHARD_COUNT")
+SHARD_IDS = os.getenv("DISCORD_SHARD_IDS")
+# Serve Prometheus metrics on 127.0.0.1:METRICS_PORT/metrics when set.
+METRICS_PORT = os.getenv("METRICS_PORT")
 
 
 intents = discord.Intents.default()
 intents.message_content = True
 PREFIX = "~" if DEBUG else "!"
 
-bot = commands.Bot(command_prefix=PREFIX, intents=intents, help_command=None)
+
+def create_bot():
+    options = dict(command_prefix=PREFIX, intents=intents, help_command=None)
+    if not SHARD_COUNT:
+        return commands.Bot(**options)
+
+    if SHARD_COUNT.lower() != "auto":
+        options["shard_count"] = int(SHARD_COUNT)
+        if SHARD_IDS:
+            options["shard_ids"] = [int(shard_id) for shard_id in SHARD_IDS.split(",")]
+    return commands.AutoShardedBot(**options)
+
+
+bot = create_bot()
 
 music_commands.setup(bot)
 
+
+async def warm_imports():
+    # Logger imports pandas lazily; load it off the loop before the first `p` needs it.
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, importlib.import_module, "pandas")
+    except Exception as e:
+        metrics.ERRORS_TOTAL.inc(where="warm_imports")
+        print(f"Error importing pandas: {e}")
+
+
+async def backfill_search_index():
+    loop = asyncio.get_running_loop()
+    try:
+        added = await loop.run_in_executor(
+            None, music.search_index.backfill, music.logger.log_dir
+        )
+    except Exception as e:
+        metrics.ERRORS_TOTAL.inc(where="search_index_backfill")
+        print(f"Error backfilling search index: {e}")
+        return
+    if added:
+        print(f"Indexed {added} tracks from the play log")
+
+
+async def backfill_sketches():
+    loop = asyncio.get_running_loop()
+    try:
+        added = await loop.run_in_executor(
+            None, music.sketches.backfill, music.logger.log_dir
+        )
+    except Exception as e:
+        metrics.ERRORS_TOTAL.inc(where="sketch_backfill")
+        print(f"Error building analytics sketches: {e}")
+        return
+    if added:
+        print(f"Built analytics sketches from {added} logged plays")
+
+
+def _sync_history_db() -> int:
+    db = history_db.HistoryDB(music.logger.log_dir)
+    try:
+        return db.sync()
+    finally:
+        db.close()
+
+
+async def sync_history_db():
+    # The first sync imports the whole log; do it now rather than in `wrap`.
+    loop = asyncio.get_running_loop()
+    try:
+        added = await loop.run_in_executor(None, _sync_history_db)
+    except Exception as e:
+        metrics.ERRORS_TOTAL.inc(where="history_db_sync")
+        print(f"Error syncing analytics database: {e}")
+        return
+    if added:
+        print(f"Synced {added} plays into the analytics database")
+
+
+async def setup_hook():
+    try:
+        # docker stop / systemd send SIGTERM: shut down through bot.close()
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.create_task(bot.close())
+        )
+    except NotImplementedError:
+        pass  # no loop signal handlers on Windows
+    LoopWatchdog().start()
+    IdleReaper(bot, music.players).start()
+    asyncio.create_task(warm_imports())
+    asyncio.create_task(backfill_search_index())
+    if history_db.analytics_backend() == "sqlite":
+        asyncio.create_task(sync_history_db())
+    if music.sketches is not None:
+        asyncio.create_task(backfill_sketches())
+    if METRICS_PORT:
+        await metrics.start_server(int(METRICS_PORT))
+        print(f"Serving metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+
+bot.setup_hook = setup_hook
+
+_close = bot.close
+
+
+async def close():
+    # Snapshot queues and playback positions while still connected to voice.
+    await music.save_all()
+    await _close()
+    # plays still queued for the log writer
+    await asyncio.get_running_loop().run_in_executor(None, music.logger.flush)
+
+bot.close = close
+
 @bot.event
 async def on_ready():
-    print(f"Bot is online as {bot.user}")
+    shards = f" (shards {sorted(bot.shards)})" if getattr(bot, "shards", None) else ""
+    print(f"Bot is online as {bot.user}{shards}")
 
 if __name__ == "__main__":
     bot.run(TOKEN)
@@ -0,0 +1,198 @@
+"""
+Minimal Prometheus-style metrics: counters, gauges and latency histograms,
+exported as text exposition format over a local HTTP endpoint.
+
+Metrics may be updated from executor and voice threads, so every update takes
+the metric's lock.
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY = []
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.function = None
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, function):
+        """Compute the gauge at scrape time; function returns [(labels, value), ...]."""
+        self.function = function
+
+    def samples(self):
+        if self.function:
+            return [(self.name, _label_key(labels), value) for labels, value in self.function()]
+        return super().samples()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self.values.get(_label_key(labels))
+        return state[-2] if state else 0
+
+    def samples(self):
+        out = []
+        with self.lock:
+            for key, state in self.values.items():
+                for bound, count in zip(self.buckets, state):
+                    out.append((f"{self.name}_bucket", key + (("le", str(bound)),), count))
+                out.append((f"{self.name}_bucket", key + (("le", "+Inf"),), state[-2]))
+                out.append((f"{self.name}_count", key, state[-2]))
+                out.append((f"{self.name}_sum", key, state[-1]))
+        return out
+
+
+def render() -> str:
+    """Render all registered metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in metric.samples():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        # drain headers
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split(b" ")[1] if request_line.count(b" ") >= 2 else b""
+        if path.split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode("utf-8") + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_server(port: int, host: str = "127.0.0.1"):
+    """Serve /metrics on host:port from the running event loop."""
+    return await asyncio.start_server(_handle, host, port)
+
+
+# ---------------------------------------
+# Bot metrics
+# ---------------------------------------
+EXTRACT_SECONDS = Histogram(
+    "ytdl_extract_seconds", "Latency of yt-dlp extract_info calls.")
+EXTRACT_TOTAL = Counter(
+    "ytdl_extract_total", "Track resolutions by extractor and whether a cache answered them.")
+FFMPEG_SPAWN_SECONDS = Histogram(
+    "ffmpeg_spawn_seconds", "Time to spawn an ffmpeg audio source.")
+TRACK_GAP_SECONDS = Histogram(
+    "track_gap_seconds", "Silence between a track ending and the next one starting.")
+LOG_WRITE_SECONDS = Histogram(
+    "play_log_write_seconds", "Time to append a track to the Parquet play log.")
+SPOTIFY_API_SECONDS = Histogram(
+    "spotify_api_seconds", "Latency of Spotify Web API requests.")
+CHART_RENDER_SECONDS = Histogram(
+    "chart_render_seconds", "Time to render a wrap chart.")
+QUEUE_DEPTH = Gauge(
+    "queue_depth", "Queued tracks (priority + normal) per guild.")
+SEARCH_INDEX_LOOKUPS = Counter(
+    "search_index_lookups_total", "Free-text lookups against the play-history index, by result.")
+SINGLEFLIGHT_SHARED = Counter(
+    "singleflight_shared_total", "Duplicate concurrent requests absorbed by an in-flight identical one.")
+SEARCH_TOTAL = Counter(
+    "search_total", "Searches by the attempt that answered them and whether a backup was started.")
+STREAM_RECOVERIES = Counter(
+    "stream_recoveries_total", "Streams re-resolved and resumed after a stall or early end, by reason.")
+STREAM_SECONDS = Counter(
+    "stream_seconds_total", "Seconds of audio streamed, by format profile and codec.")
+STREAM_BYTES = Counter(
+    "stream_bytes_total", "Estimated bytes fetched by streams (format bitrate x seconds streamed).")
+STREAM_CPU_SECONDS = Counter(
+    "stream_cpu_seconds_total", "CPU time spent by ffmpeg decoding streams.")
+ERRORS_TOTAL = Counter(
+    "errors_total", "Errors caught and reported, by location.")
@@ -0,0 +1,32 @@
+"""
+Convert a single-table play log into the split plays/tracks layout.
+
+The bot migrates `log/music_log.parquet` on its first write anyway; run this
+to do it ahead of time (e.g. before starting several shard processes) and to
+see how much space the split saves.
+
+Usage:
+    python src/migrate_log.py [--log-dir log]
+"""
+import argparse
+
+from logger import LEGACY_FILE, migrate_log
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split music_log.parquet into plays and tracks.")
+    parser.add_argument("--log-dir", default="log")
+    args = parser.parse_args()
+
+    stats = migrate_log(args.log_dir)
+    if stats is None:
+        print(f"Nothing to migrate: no {LEGACY_FILE} in {args.log_dir}, or already migrated")
+        return
+    print(
+        f"Migrated {stats['plays']} plays of {stats['tracks']} tracks: "
+        f"{stats['legacy_bytes'] / 2**20:.1f} MiB -> {stats['bytes'] / 2**20:.1f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,73 @@
+import os
+import re
 import time
+import random
 import asyncio
+from dataclasses import dataclass
+
 import discord
 import yt_dlp as youtube_dl
 
 from logger import Logger
+from loudness import LOUDNESS_NORMALIZE, LoudnessAnalyzer
+from metrics import (
+    ERRORS_TOTAL,
+    EXTRACT_SECONDS,
+    EXTRACT_TOTAL,
+    FFMPEG_SPAWN_SECONDS,
+    QUEUE_DEPTH,
+    SEARCH_TOTAL,
+    STREAM_BYTES,
+    STREAM_CPU_SECONDS,
+    STREAM_RECOVERIES,
+    STREAM_SECONDS,
+    TRACK_GAP_SECONDS,
+)
+from player_state import PlayerStateStore, compact_track, restore_track
+from presence import PresenceManager
+from search_index import SearchIndex, is_free_text
+from sketches import ANALYTICS_APPROXIMATE, SketchStore
+from singleflight import SingleFlight
+import store
+from tracing import span
 from utils import is_duplicate
 
 
-logger = Logger()
+search_index = SearchIndex()
+sketches = SketchStore() if ANALYTICS_APPROXIMATE else None
+logger = Logger(index=search_index, sketches=sketches)
+state_store = PlayerStateStore()
+loudness = LoudnessAnalyzer()
+
+# Playback volume of a track at the loudness target (or not yet measured).
+DEFAULT_VOLUME = 0.5
+
+# Queue changes are snapshotted at most once per this many seconds.
+STATE_SAVE_DELAY = 1.0
+# While a track plays, its position is re-snapshotted this often, so a restart
+# resumes it close to where it was.
+STATE_SNAPSHOT_INTERVAL = 15.0
 
 
 # ---------------------------------------
 # YT-DLP OPTIONS (SoundCloud-safe)
 # ---------------------------------------
+# Format selection profiles. Discord voice is Opus at up to 128 kbps, so
+# "voice" takes the Opus (else any audio-only) format closest to 128 kbps that
+# is not below 96 kbps; "low" takes the smallest audio-only format; "best" is
+# the old highest-bitrate choice, which may fall back to a video stream.
+FORMAT_PROFILES = {
+    "voice": {"format": "bestaudio[abr>=96]/bestaudio", "format_sort": ["acodec:opus", "abr~128"]},
+    "low": {"format": "bestaudio", "format_sort": ["acodec:opus", "+abr"]},
+    "best": {"format": "bestaudio/best"},
+}
+AUDIO_PROFILE = os.getenv("AUDIO_PROFILE", "voice").lower()
+if AUDIO_PROFILE not in FORMAT_PROFILES:
+    print(f"Unknown AUDIO_PROFILE {AUDIO_PROFILE!r} (expected one of {', '.join(FORMAT_PROFILES)}), using 'voice'")
+    AUDIO_PROFILE = "voice"
+
 ytdl_format_options = {
-    "format": "bestaudio/best",
+    **FORMAT_PROFILES[AUDIO_PROFILE],
     "noplaylist": True,
     "quiet": True,
     "default_search": "auto",
@@ -39,28 +92,223 @@ playlist_ytdl_options = {
 }
 
 
+# Searches are hedged (see search()), so each attempt fails fast instead of
+# retrying: a stuck socket gives up after a few seconds, which also returns
+# the executor thread of an abandoned attempt.
+search_ytdl_options = {
+    **ytdl_format_options,
+    "socket_timeout": 5,
+    "retries": 1,
+    "extractor_retries": 1,
+}
+
+
 ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
 pl_ytdl = youtube_dl.YoutubeDL(playlist_ytdl_options)
+search_ytdl = youtube_dl.YoutubeDL(search_ytdl_options)
+
+# Hedged search: start a backup attempt when the primary search has not
+# answered after SEARCH_HEDGE_AFTER seconds, and give up after SEARCH_TIMEOUT.
+# SEARCH_BACKUP is the yt-dlp search prefix of the backup source ("scsearch1"
+# for SoundCloud); leave it empty to retry the primary search instead.
+SEARCH_HEDGE_AFTER = float(os.getenv("SEARCH_HEDGE_AFTER", "2.5"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "15"))
+SEARCH_BACKUP = os.getenv("SEARCH_BACKUP", "scsearch1")
+
+_SEARCH_PREFIX_RE = re.compile(r"^\w+search\d*:")
+
+# Stream supervision: a playing source that delivers no audio for
+# STREAM_STALL_SECONDS, or hits end-of-stream more than STREAM_EOF_TOLERANCE
+# seconds before its known duration, is re-resolved and resumed where it left
+# off, at most STREAM_MAX_RECOVERIES times per track.
+STREAM_STALL_SECONDS = float(os.getenv("STREAM_STALL_SECONDS", "10"))
+STREAM_EOF_TOLERANCE = float(os.getenv("STREAM_EOF_TOLERANCE", "5"))
+STREAM_MAX_RECOVERIES = int(os.getenv("STREAM_MAX_RECOVERIES", "3"))
+STREAM_CHECK_INTERVAL = 2.0
 
 FFMPEG_OPTIONS = {
     "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
     "options": "-vn -bufsize 512k",
 }
+
+
+extract_flight = SingleFlight("ytdl")
+
+
+def _copy_info(data):
+    """Copy an info dict deep enough that callers can annotate their own entries."""
+    data = dict(data)
+    if data.get("entries") is not None:
+        data["entries"] = [dict(entry) if entry else entry for entry in data["entries"]]
+    return data
+
+
+async def extract_info(extractor, query, *, loop=None, download=False):
+    """
+    Resolve query with yt-dlp, coalescing identical concurrent lookups.
+
+    Several users pasting the same link, or playback and a queue request for
+    the same track, share one extraction; each caller gets its own copy of the
+    result since queue entries are annotated in place.
+    """
+    key = (id(extractor), query.strip(), download)
+    data = await extract_flight.do(
+        key, lambda: _extract_info(extractor, query, loop=loop, download=download)
+    )
+    return _copy_info(data)
+
+
+def is_search(query):
+    """True for free text and yt-dlp search queries, False for URLs."""
+    return bool(_SEARCH_PREFIX_RE.match(query)) or is_free_text(query)
+
+
+def _has_result(data):
+    if "entries" in data:
+        return any(data["entries"])
+    return bool(data.get("webpage_url") or data.get("url"))
+
+
+async def search(query, *, loop=None, hedge_after=None, timeout=None, backup=None):
+    """
+    Resolve a search query, hedging against a slow primary lookup.
+
+    The primary search starts at once. If it has not produced a result after
+    hedge_after seconds, or fails earlier, a backup attempt starts and the
+    first non-empty result wins; the other attempt is abandoned.
+    """
+    loop = loop or asyncio.get_event_loop()
+    hedge_after = SEARCH_HEDGE_AFTER if hedge_after is None else hedge_after
+    timeout = SEARCH_TIMEOUT if timeout is None else timeout
+    backup = SEARCH_BACKUP if backup is None else backup
+
+    terms = _SEARCH_PREFIX_RE.sub("", query, count=1).strip()
+    primary_query = query if _SEARCH_PREFIX_RE.match(query) else f"ytsearch1:{terms}"
+    # A retry of the same query bypasses the in-flight coalescing, which would
+    # otherwise hand it the very lookup it is meant to race.
+    backup_attempt = (
+        (lambda: extract_info(search_ytdl, f"{backup}:{terms}", loop=loop))
+        if backup
+        else (lambda: _extract_info(search_ytdl, primary_query, loop=loop))
+    )
+
+    attempts = {asyncio.ensure_future(extract_info(search_ytdl, primary_query, loop=loop)): "primary"}
+    deadline = loop.time() + timeout
+    hedged = False
+    error = None
+    try:
+        while attempts:
+            wait = deadline - loop.time()
+            if not hedged:
+                wait = min(wait, hedge_after)
+            done, _ = await asyncio.wait(
+                attempts, timeout=max(0, wait), return_when=asyncio.FIRST_COMPLETED
+            )
+            for attempt in done:
+                name = attempts.pop(attempt)
+                if attempt.exception() is None and _has_result(attempt.result()):
+                    SEARCH_TOTAL.inc(winner=name, hedged=str(hedged).lower())
+                    return attempt.result()
+                error = attempt.exception() or error
+            if loop.time() >= deadline:
+                break
+            if not hedged and (not done or not attempts):
+                attempts[asyncio.ensure_future(backup_attempt())] = "backup"
+                hedged = True
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+
+    SEARCH_TOTAL.inc(winner="none", hedged=str(hedged).lower())
+    if attempts or loop.time() >= deadline:
+        raise TimeoutError(f"Search for '{terms}' timed out after {timeout:g}s")
+    if error:
+        raise error
+    raise ValueError(f"No results for '{terms}'")
+
+
+async def _extract_info(extractor, query, *, loop=None, download=False):
+    """Run a blocking yt-dlp extract_info in an executor, recording its latency."""
+    loop = loop or asyncio.get_event_loop()
+    start = time.perf_counter()
+    try:
+        with span("ytdl.extract", query=query):
+            data = await loop.run_in_executor(
+                None, lambda: extractor.extract_info(query, download=download)
+            )
+    except Exception:
+        EXTRACT_SECONDS.observe(time.perf_counter() - start, extractor="error")
+        raise
+    name = data.get("extractor_key") or "unknown"
+    EXTRACT_SECONDS.observe(time.perf_counter() - start, extractor=name)
+    EXTRACT_TOTAL.inc(extractor=name, cached="false")
+    return data
+
+
 class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
+    # discord.py reads one 20 ms frame at a time
+    FRAME_SECONDS = 0.02
+
+    def __init__(self, source, *, data, volume=DEFAULT_VOLUME, start_at=None):
         super().__init__(source, volume)
         self.data = data
         self.title = data.get("title")
         self.url = data.get("webpage_url")
+        self.start_at = start_at or 0
+        self.frames = 0
+        self.eof = False
+        self.recoveries = 0
+        self.usage_recorded = False
+        self.last_read_at = time.monotonic()
+
+    def read(self):
+        # runs on the voice thread; the supervisor only reads these fields
+        data = super().read()
+        if data:
+            self.frames += 1
+            self.last_read_at = time.monotonic()
+        else:
+            self.eof = True
+        return data
+
+    @property
+    def position(self):
+        """Seconds into the track of the last frame delivered."""
+        return self.start_at + self.frames * self.FRAME_SECONDS
+
+    def ended_early(self):
+        """True if the stream ran out well before the track's known duration."""
+        duration = self.data.get("duration")
+        return self.eof and bool(duration) and self.position < duration - STREAM_EOF_TOLERANCE
+
+    def stalled_for(self):
+        return time.monotonic() - self.last_read_at
+
+    def cleanup(self):
+        # cleanup can run more than once; account the stream only the first time
+        if not self.usage_recorded:
+            self.usage_recorded = True
+            self._record_usage()
+        super().cleanup()
+
+    def _record_usage(self):
+        """Account the stream's seconds, estimated bytes and ffmpeg CPU to its format."""
+        labels = {"profile": AUDIO_PROFILE, "acodec": self.data.get("acodec") or "unknown"}
+        seconds = self.frames * self.FRAME_SECONDS
+        STREAM_SECONDS.inc(seconds, **labels)
+        kbps = self.data.get("abr") or self.data.get("tbr")
+        if kbps:
+            STREAM_BYTES.inc(kbps * 1000 / 8 * seconds, **labels)
+        cpu = _process_cpu_seconds(getattr(self.original, "_process", None))
+        if cpu is not None:
+            STREAM_CPU_SECONDS.inc(cpu, **labels)
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=True):
+    async def from_url(cls, url, *, loop=None, stream=True, start_at=None):
         loop = loop or asyncio.get_event_loop()
 
         # yt-dlp runs blocking, so offload to executor:
-        data = await loop.run_in_executor(
-            None, lambda: ytdl.extract_info(url, download=not stream)
-        )
+        data = await extract_info(ytdl, url, loop=loop, download=not stream)
 
         if "entries" in data:
             data = data["entries"][0]
@@ -68,31 +316,171 @@ class YTDLSource(discord.PCMVolumeTransformer):
         # streaming URL (SoundCloud-safe)
         filename = data["url"] if stream else ytdl.prepare_filename(data)
 
-        source = discord.FFmpegPCMAudio(filename, **FFMPEG_OPTIONS)
-        return cls(source, data=data)
+        options = dict(FFMPEG_OPTIONS)
+        if start_at:
+            options["before_options"] = f"{options['before_options']} -ss {start_at}"
+
+        with FFMPEG_SPAWN_SECONDS.time(), span("ffmpeg.spawn"):
+            source = discord.FFmpegPCMAudio(filename, **options)
+
+        volume = DEFAULT_VOLUME
+        if LOUDNESS_NORMALIZE:
+            gain = await loudness.gain(url)
+            if gain is None:
+                # measured in the background; applies from the next play on
+                loudness.schedule(url, filename, FFMPEG_OPTIONS["before_options"])
+            else:
+                volume = min(2.0, DEFAULT_VOLUME * gain)
+        return cls(source, data=data, volume=volume, start_at=start_at)
+
+
+def _process_cpu_seconds(process):
+    """
+    User + system CPU time of a child process, where /proc is available.
+
+    Works until the process is reaped: an ffmpeg that already exited is a
+    zombie whose stat still holds its final times, so this must run before
+    anything polls or waits on it (poll() would reap it and free the PID).
+    """
+    if process is None or process.returncode is not None:
+        return None
+    try:
+        with open(f"/proc/{process.pid}/stat") as f:
+            # fields after the parenthesised command name; utime and stime are 14th/15th
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+@dataclass(frozen=True)
+class QueueSnapshot:
+    """Immutable view of a player's queue for read-only commands."""
+    version: int
+    now_queue: tuple
+    queue: tuple
+    current: dict | None
+    start_time: float | None
+    queued_duration: float
+    page_cache: dict
 
 
 class MusicPlayer:
+    """
+    Per-guild queue and playback state.
+
+    Mutations that span an await (starting, advancing and seeking playback) run
+    under `lock`, an asyncio.Lock whose FIFO waiters serialize them per guild.
+    Purely synchronous mutations are atomic on the event loop, and read-only
+    commands render from `snapshot()` without waiting for the lock.
+    """
+
     def __init__(self, guild):
         self.guild = guild
         self.queue = []
         self.now_queue = []
         self.current = None
+        self.source = None
         self.start_time = None
         self.paused_offset = None
-        self.seeking = False
+        self.ended_at = None
+        self.version = 0
+        self.queued_duration = 0
+        self.page_cache = {}
+        self.lock = asyncio.Lock()
+        # Commands resolving tracks outside the lock (add_track), and when a
+        # command last used this player; the idle reaper spares both.
+        self.active = 0
+        self.last_used = time.monotonic()
+        self._play_token = None
+        self._snapshot = None
+        self._save_handle = None
+
+    def changed(self):
+        """Record a queue/playback change and schedule a state snapshot."""
+        self.version += 1
+        if self._save_handle is None:
+            loop = asyncio.get_event_loop()
+            self._save_handle = loop.call_later(STATE_SAVE_DELAY, self.save_state)
+
+    def snapshot(self) -> QueueSnapshot:
+        """Immutable copy of the queue, reused until the next change."""
+        if self._snapshot is None or self._snapshot.version != self.version:
+            self._snapshot = QueueSnapshot(
+                version=self.version,
+                now_queue=tuple(self.now_queue),
+                queue=tuple(self.queue),
+                current=self.current,
+                start_time=self.start_time,
+                queued_duration=self.queued_duration,
+                page_cache=self.page_cache,
+            )
+        return self._snapshot
+
+    def snapshot_state(self) -> dict | None:
+        """Compact, JSON-serializable state of the queues and current track."""
+        state = {
+            "now_queue": [compact_track(info) for info in self.now_queue],
+            "queue": [compact_track(info) for info in self.queue],
+        }
+        vc = self.guild.voice_client
+        if self.current and vc and (vc.is_playing() or vc.is_paused()):
+            current = compact_track(self.current)
+            if self.paused_offset is not None:
+                current["position"] = self.paused_offset
+            elif self.start_time:
+                current["position"] = time.time() - self.start_time
+            state["current"] = current
+        if not (state["now_queue"] or state["queue"] or "current" in state):
+            return None
+        return state
+
+    def save_state(self):
+        """Snapshot the state now; it is written on the store thread (returns that Future)."""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        return store.submit(state_store.save, self.guild.id, self.snapshot_state(), where="player_state")
+
+    def restore_state(self, state: dict | None):
+        """
+        Apply this guild's last snapshot (loaded by get_player). Tracks are
+        only re-resolved when they reach the head of the queue; the
+        interrupted track resumes first, at its saved position.
+        """
+        if not state:
+            return
+        self.now_queue = [restore_track(r, self.guild) for r in state.get("now_queue", [])]
+        self.queue = [restore_track(r, self.guild) for r in state.get("queue", [])]
+        current = state.get("current")
+        if current:
+            info = restore_track(current, self.guild)
+            info["resume_at"] = int(current.get("position") or 0)
+            self.now_queue.insert(0, info)
+        self.queued_duration = sum(
+            track.get("duration") or 0 for track in self.now_queue + self.queue
+        )
 
     async def add_track(self, query, requester, playlist=False, index=None, prio=False):
-        skipped_tracks = []
-
-        extractor = pl_ytdl if playlist else ytdl
-        loop = asyncio.get_event_loop()
-
-        data = await loop.run_in_executor(
-            None, lambda: extractor.extract_info(query, download=False)
-        )
+        self.active += 1
+        try:
+            if playlist:
+                data = await extract_info(pl_ytdl, query)
+            elif is_search(query):
+                data = await search(query)
+            else:
+                data = await extract_info(ytdl, query)
+        finally:
+            self.active -= 1
+            self.last_used = time.monotonic()
 
         infos = data["entries"] if "entries" in data else [data]
+        return self.enqueue(infos, requester, index=index, prio=prio)
+
+    def enqueue(self, infos, requester, index=None, prio=False):
+        """Queue already-resolved track infos, skipping duplicates."""
+        skipped_tracks = []
+        added_tracks = []
 
         for info in infos:
             if is_duplicate(info, [self.queue, self.now_queue]):
@@ -100,6 +488,7 @@ class MusicPlayer:
                 continue
 
             info["requester"] = requester
+            self.queued_duration += info.get("duration") or 0
 
             if prio:
                 self.now_queue.append(info)
@@ -107,14 +496,34 @@ class MusicPlayer:
                 self.queue.append(info)
             else:
                 self.queue.insert(index, info)
+            added_tracks.append(info)
 
-            logger.log_track(info, requester_id=requester.id)
-
+        if added_tracks:
+            # written on the logger's thread, one rewrite for the whole batch
+            with span("log.write"):
+                logger.log_tracks(added_tracks, requester_id=requester.id).add_done_callback(_log_written)
+            self.changed()
         return infos, skipped_tracks
 
     async def play_next(self, interactor=None, bot=None):
+        """Advance to the next track."""
+        async with self.lock:
+            await self._play_next(interactor, bot)
+
+    async def start_if_idle(self, interactor=None, bot=None):
+        """Start playback unless something is already playing or paused."""
+        async with self.lock:
+            vc = self.guild.voice_client
+            if vc and (vc.is_playing() or vc.is_paused()):
+                return False
+            await self._play_next(interactor, bot)
+            return True
+
+    async def _play_next(self, interactor, bot):
+        # caller holds self.lock
         if not (self.queue or self.now_queue):
-            await bot.change_presence(status=discord.Status.idle)
+            self.changed()
+            update_presence(bot)
             return
 
         vc = self.guild.voice_client
@@ -122,54 +531,218 @@ class MusicPlayer:
         # Auto-connect if not in VC
         if not vc:
             if interactor and interactor.voice:
-                vc = await interactor.voice.channel.connect()
+                with span("voice.connect"):
+                    vc = await interactor.voice.channel.connect()
             else:
                 return
 
-        # priority first
-        if self.now_queue:
-            self.current = self.now_queue.pop(0)
-        else:
-            self.current = self.queue.pop(0)
+        self.current = self.pop_next()
 
-        self.start_time = time.time()
+        start_at = self.current.pop("resume_at", None)
+        self.start_time = time.time() - (start_at or 0)
         self.paused_offset = None
 
         try:
             # SoundCloud-safe playback (refetch URL)
             source = await YTDLSource.from_url(
-                self.current["webpage_url"], loop=bot.loop, stream=True
+                self.current["webpage_url"], loop=bot.loop, stream=True, start_at=start_at
             )
         except Exception as e:
+            ERRORS_TOTAL.inc(where="prepare_audio")
             print(f"Error preparing audio: {e}")
-            return await self.play_next(interactor, bot)
+            return await self._play_next(interactor, bot)
+
+        self._start(vc, source, interactor, bot)
+        if self.ended_at is not None:
+            TRACK_GAP_SECONDS.observe(time.perf_counter() - self.ended_at)
+            self.ended_at = None
+        self.changed()
+        update_presence(bot)
+
+    def _start(self, vc, source, interactor, bot):
+        # Each started source gets a token; its after-callback only advances
+        # the queue if the source is still the current one (not replaced by a
+        # seek or a recovery).
+        token = self._play_token = object()
 
         def after_play(err):
+            # runs on the voice thread: only hand over to the event loop here
+            self.ended_at = time.perf_counter()
             if err:
+                ERRORS_TOTAL.inc(where="playback")
                 print(f"Playback error: {err}")
-            if not self.seeking:
-                asyncio.run_coroutine_threadsafe(
-                    self.play_next(interactor, bot), bot.loop
-                )
+            asyncio.run_coroutine_threadsafe(
+                self._on_track_end(token, source, interactor, bot), bot.loop
+            )
 
         vc.play(source, after=after_play)
         vc.source = source
+        self.source = source
+        asyncio.ensure_future(self._supervise(token, vc, source, interactor, bot))
 
-        await bot.change_presence(
-            activity=discord.Activity(
-                type=discord.ActivityType.listening,
-                name=source.title
-            )
+    async def _on_track_end(self, token, source, interactor, bot):
+        async with self.lock:
+            if token is not self._play_token:
+                return
+            self._play_token = None
+            if source.ended_early() and await self._recover(source, "early_eof", interactor, bot):
+                return
+            await self._play_next(interactor, bot)
+
+    async def _supervise(self, token, vc, source, interactor, bot):
+        """
+        Watch a playing source's read cadence and recover it if it stalls;
+        also snapshots the playback position every STATE_SNAPSHOT_INTERVAL.
+        """
+        saved_at = time.monotonic()
+        while token is self._play_token and self.guild.voice_client is vc:
+            await asyncio.sleep(STREAM_CHECK_INTERVAL)
+            if time.monotonic() - saved_at >= STATE_SNAPSHOT_INTERVAL:
+                saved_at = time.monotonic()
+                self.save_state()
+            if vc.is_paused():
+                # no reads while paused; don't count the pause as a stall
+                source.last_read_at = time.monotonic()
+                continue
+            if not vc.is_playing() or source.stalled_for() < STREAM_STALL_SECONDS:
+                continue
+            async with self.lock:
+                if token is not self._play_token:
+                    return
+                # the stopped source's after-callback becomes stale
+                self._play_token = None
+                vc.stop()
+                if not await self._recover(source, "stall", interactor, bot):
+                    await self._play_next(interactor, bot)
+            return
+
+    async def _recover(self, source, reason, interactor, bot):
+        """
+        Re-resolve the current track and resume it at the position reached.
+
+        The stream URL is fetched again, since an expired or throttled URL is
+        the usual cause. Caller holds self.lock. Returns False when the track
+        should be given up on instead.
+        """
+        vc = self.guild.voice_client
+        if not vc or not self.current or source.recoveries >= STREAM_MAX_RECOVERIES:
+            return False
+        position = int(source.position)
+        try:
+            with span("stream.recover", reason=reason):
+                new_source = await YTDLSource.from_url(
+                    self.current["webpage_url"], loop=bot.loop, stream=True, start_at=position
+                )
+        except Exception as e:
+            ERRORS_TOTAL.inc(where="stream_recover")
+            print(f"Error recovering stream: {e}")
+            return False
+        new_source.volume = source.volume
+        new_source.recoveries = source.recoveries + 1
+        STREAM_RECOVERIES.inc(reason=reason)
+        print(f"Resumed {self.current.get('title')} at {position}s after {reason}")
+
+        self.start_time = time.time() - position
+        self.paused_offset = None
+        self._start(vc, new_source, interactor, bot)
+        self.changed()
+        return True
+
+    async def seek(self, seconds, interactor=None, bot=None):
+        """Restart the current track at seconds. Returns False if the track changed meanwhile."""
+        info = self.current
+        vc = self.guild.voice_client
+        volume = vc.source.volume if vc and hasattr(vc.source, "volume") else DEFAULT_VOLUME
+
+        # Fetch a fresh stream before stopping to minimize the silence gap
+        source = await YTDLSource.from_url(
+            info["webpage_url"], loop=bot.loop, stream=True, start_at=seconds
         )
+        source.volume = volume
+
+        async with self.lock:
+            vc = self.guild.voice_client
+            if self.current is not info or not vc or not (vc.is_playing() or vc.is_paused()):
+                source.cleanup()
+                return False
+            # the stopped source's after-callback becomes stale
+            self._play_token = None
+            vc.stop()
+            self.start_time = time.time() - seconds
+            self.paused_offset = None
+            self._start(vc, source, interactor, bot)
+            self.changed()
+        return True
+
+    def pop_next(self):
+        """Take the next track, priority queue first."""
+        track = self.now_queue.pop(0) if self.now_queue else self.queue.pop(0)
+        self.queued_duration -= track.get("duration") or 0
+        self.changed()
+        return track
+
+    def remove_at(self, index):
+        """Remove and return the track at 1-based position index across both queues."""
+        if index <= len(self.now_queue):
+            track = self.now_queue.pop(index - 1)
+        else:
+            track = self.queue.pop(index - 1 - len(self.now_queue))
+        self.queued_duration -= track.get("duration") or 0
+        self.changed()
+        return track
+
+    def shuffle(self):
+        random.shuffle(self.queue)
+        self.changed()
 
     def clear(self):
         self.now_queue.clear()
         self.queue.clear()
+        self.queued_duration = 0
+        self.changed()
+
+def _log_written(future):
+    # runs on the logger's writer thread
+    error = future.exception()
+    if error is not None:
+        ERRORS_TOTAL.inc(where="log_write")
+        print(f"Error logging plays: {error}")
+
 
 players = {}
 
 
-def get_player(guild):
-    if guild.id not in players:
-        players[guild.id] = MusicPlayer(guild)
-    return players[guild.id]
+async def get_player(guild):
+    """The guild's player, created with its saved queue on first use."""
+    player = players.get(guild.id)
+    if player is None:
+        state = await store.run(state_store.load, guild.id)
+        # another command may have created it while the state loaded
+        player = players.get(guild.id)
+        if player is None:
+            player = players[guild.id] = MusicPlayer(guild)
+            player.restore_state(state)
+    player.last_used = time.monotonic()
+    return player
+
+
+def update_presence(bot):
+    """Request a (coalesced, rate-limited) presence refresh for the bot."""
+    manager = getattr(bot, "presence_manager", None)
+    if manager is None:
+        manager = bot.presence_manager = PresenceManager(bot, players)
+    manager.request_update()
+
+
+async def save_all():
+    """Flush every player's pending state snapshot (e.g. before exiting)."""
+    await asyncio.gather(
+        *(asyncio.wrap_future(player.save_state()) for player in list(players.values())),
+        return_exceptions=True,
+    )
+
+
+QUEUE_DEPTH.set_function(lambda: [
+    ({"guild": guild_id}, len(player.queue) + len(player.now_queue))
+    for guild_id, player in list(players.items())
+])
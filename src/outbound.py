@@ -0,0 +1,136 @@
+"""
+Outbound message dispatcher.
+
+Messages are queued per channel and sent by one worker per channel, paced to
+Discord's per-channel rate limit, so commands don't wait on REST round trips.
+Consecutive plain-text messages still waiting in a channel's queue are merged
+into a single message.
+"""
+import asyncio
+import time
+
+from metrics import ERRORS_TOTAL, Counter, Histogram
+
+MESSAGES_SENT = Counter(
+    "messages_sent_total", "Outbound Discord messages by outcome (sent, merged, error).")
+MESSAGE_SEND_SECONDS = Histogram(
+    "message_send_seconds", "Latency of Discord message send requests.")
+
+MAX_CONTENT_LENGTH = 2000
+
+
+class _Outgoing:
+    __slots__ = ("kwargs", "future")
+
+    def __init__(self, kwargs, future):
+        self.kwargs = kwargs
+        self.future = future
+
+    @property
+    def text_only(self) -> bool:
+        return all(
+            value in (None, False)
+            for key, value in self.kwargs.items()
+            if key != "content"
+        ) and bool(self.kwargs.get("content"))
+
+
+class OutboundDispatcher:
+    def __init__(self, rate=5, per=5.0, idle_timeout=30.0):
+        # token bucket per channel: `rate` messages every `per` seconds
+        self.rate = rate
+        self.per = per
+        self.idle_timeout = idle_timeout
+        self.queues = {}
+        self.workers = {}
+
+    def submit(self, channel, **kwargs) -> asyncio.Future:
+        """Queue a message for channel; the future resolves to the sent Message."""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        # send errors are counted and logged by the worker; don't also warn
+        # about an unretrieved exception when nobody awaits the future
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = self.queues[channel.id] = asyncio.Queue()
+        queue.put_nowait(_Outgoing(kwargs, future))
+
+        worker = self.workers.get(channel.id)
+        if worker is None or worker.done():
+            self.workers[channel.id] = loop.create_task(self._worker(channel, queue))
+        return future
+
+    def _take_batch(self, first: _Outgoing, queue: asyncio.Queue):
+        """
+        Merge queued plain-text messages following `first` while they fit.
+
+        Returns the batch and the first dequeued message that could not be
+        merged (or None); the worker sends that one next.
+        """
+        batch = [first]
+        if not first.text_only:
+            return batch, None
+        length = len(first.kwargs["content"])
+        while not queue.empty():
+            entry = queue.get_nowait()
+            extra = len(entry.kwargs["content"]) + 1 if entry.text_only else None
+            if extra is None or length + extra > MAX_CONTENT_LENGTH:
+                return batch, entry
+            length += extra
+            batch.append(entry)
+        return batch, None
+
+    async def _worker(self, channel, queue: asyncio.Queue):
+        tokens = self.rate
+        refilled_at = time.monotonic()
+        carried = None
+
+        while True:
+            if carried is not None:
+                item, carried = carried, None
+            else:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if queue.empty():
+                        self.queues.pop(channel.id, None)
+                        self.workers.pop(channel.id, None)
+                        return
+                    continue
+
+            batch, carried = self._take_batch(item, queue)
+
+            now = time.monotonic()
+            tokens = min(self.rate, tokens + (now - refilled_at) * self.rate / self.per)
+            refilled_at = now
+            if tokens < 1:
+                await asyncio.sleep((1 - tokens) * self.per / self.rate)
+                tokens, refilled_at = 1, time.monotonic()
+            tokens -= 1
+
+            kwargs = dict(batch[0].kwargs)
+            if len(batch) > 1:
+                kwargs["content"] = "\n".join(entry.kwargs["content"] for entry in batch)
+                MESSAGES_SENT.inc(len(batch) - 1, result="merged")
+
+            try:
+                with MESSAGE_SEND_SECONDS.time():
+                    message = await channel.send(**kwargs)
+            except Exception as e:
+                MESSAGES_SENT.inc(result="error")
+                ERRORS_TOTAL.inc(where="message_send")
+                print(f"Error sending message to channel {channel.id}: {type(e).__name__}: {e}")
+                for entry in batch:
+                    if not entry.future.done():
+                        entry.future.set_exception(e)
+                continue
+
+            MESSAGES_SENT.inc(result="sent")
+            for entry in batch:
+                if not entry.future.done():
+                    entry.future.set_result(message)
+
+
+dispatcher = OutboundDispatcher()
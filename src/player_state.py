@@ -0,0 +1,68 @@
+import json
+import time
+from dataclasses import dataclass
+
+import store
+
+
+@dataclass(frozen=True)
+class StoredRequester:
+    """Stand-in for a requester restored from a snapshot when the member isn't cached."""
+    id: int
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+
+def compact_track(info: dict) -> dict:
+    """Reduce a yt-dlp info dict to what is needed to show and re-resolve it."""
+    requester = info.get("requester")
+    return {
+        "webpage_url": info.get("webpage_url"),
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "thumbnail": info.get("thumbnail"),
+        "requester_id": requester.id if requester else None,
+    }
+
+
+def restore_track(record: dict, guild) -> dict:
+    """Turn a compact record back into a queue entry."""
+    info = {k: v for k, v in record.items() if k != "requester_id"}
+    requester_id = record.get("requester_id")
+    if requester_id is not None:
+        info["requester"] = guild.get_member(requester_id) or StoredRequester(requester_id)
+    return info
+
+
+class PlayerStateStore:
+    """
+    Per-guild queue snapshots in the shared store, so queues survive restarts.
+    Used through store.run/submit, off the event loop.
+    """
+
+    def __init__(self, state_dir=None, filename="player_state.sqlite3"):
+        self.conn = store.connect(filename, state_dir, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS player_state ("
+            "guild_id INTEGER PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def save(self, guild_id: int, state: dict | None):
+        """Store a guild's snapshot; an empty state removes it."""
+        if not state:
+            self.conn.execute("DELETE FROM player_state WHERE guild_id = ?", (guild_id,))
+        else:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO player_state (guild_id, state, updated_at) VALUES (?, ?, ?)",
+                (guild_id, json.dumps(state), time.time()),
+            )
+        self.conn.commit()
+
+    def load(self, guild_id: int) -> dict | None:
+        row = self.conn.execute(
+            "SELECT state FROM player_state WHERE guild_id = ?", (guild_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
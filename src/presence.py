@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+
+import discord
+
+from metrics import Counter
+
+PRESENCE_UPDATES = Counter(
+    "presence_updates_total", "Presence update requests by outcome (sent, coalesced, unchanged).")
+
+# Gateway presence updates are rate limited; changes inside the window are
+# merged and at most one update is sent per interval.
+PRESENCE_WINDOW = float(os.getenv("PRESENCE_WINDOW", "2"))
+PRESENCE_MIN_INTERVAL = float(os.getenv("PRESENCE_MIN_INTERVAL", "15"))
+
+
+class PresenceManager:
+    """
+    Coalesces presence changes from all guilds into one aggregate bot status.
+
+    Presence is global to the bot, so instead of every player pushing its own
+    track title, players only request an update; the manager waits for the
+    coalescing window (and the rate limit), then derives a single status from
+    all players: idle when nothing plays, the track title when one guild is
+    listening, and the number of active servers otherwise.
+    """
+
+    def __init__(self, bot, players, window=PRESENCE_WINDOW, min_interval=PRESENCE_MIN_INTERVAL):
+        self.bot = bot
+        self.players = players
+        self.window = window
+        self.min_interval = min_interval
+        self._task = None
+        self._last_sent_at = float("-inf")
+        self._last_presence = None
+
+    def request_update(self):
+        """Ask for the presence to be refreshed soon; cheap to call often."""
+        if self._task is not None and not self._task.done():
+            PRESENCE_UPDATES.inc(result="coalesced")
+            return
+        self._task = asyncio.get_event_loop().create_task(self._flush_later())
+
+    def _active_players(self):
+        active = []
+        for player in list(self.players.values()):
+            vc = player.guild.voice_client
+            if player.current and vc and (vc.is_playing() or vc.is_paused()):
+                active.append(player)
+        return active
+
+    def aggregate(self) -> tuple[discord.Status, str | None]:
+        active = self._active_players()
+        if not active:
+            return discord.Status.idle, None
+        if len(active) == 1:
+            return discord.Status.online, active[0].current.get("title")
+        return discord.Status.online, f"music in {len(active)} servers"
+
+    async def _flush_later(self):
+        delay = max(self.window, self._last_sent_at + self.min_interval - time.monotonic())
+        await asyncio.sleep(delay)
+        # Requests arriving while this update is sent schedule the next flush.
+        self._task = None
+
+        presence = self.aggregate()
+        if presence == self._last_presence:
+            PRESENCE_UPDATES.inc(result="unchanged")
+            return
+
+        status, name = presence
+        activity = discord.Activity(type=discord.ActivityType.listening, name=name) if name else None
+        self._last_presence = presence
+        self._last_sent_at = time.monotonic()
+        PRESENCE_UPDATES.inc(result="sent")
+        try:
+            await self.bot.change_presence(status=status, activity=activity)
+        except Exception as e:
+            self._last_presence = None
+            print(f"Error updating presence: {e}")
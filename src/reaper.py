@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+
+from metrics import Counter
+
+RECLAIMED_TOTAL = Counter(
+    "idle_reclaimed_total", "Idle resources reclaimed by the reaper (voice, player, ffmpeg).")
+
+# A guild with nothing playing for this long loses its voice connection and
+# player; its queue is snapshotted first and restored on the next command.
+GUILD_IDLE_SECONDS = float(os.getenv("GUILD_IDLE_SECONDS", "600"))
+
+
+class IdleReaper:
+    """
+    Periodically reclaims resources held for guilds that stopped listening.
+
+    A guild is busy while its voice client is playing, one of its commands
+    holds the player lock or is resolving tracks (`player.active`); anything
+    else (paused, empty queue, no voice client) counts as idle, from the later
+    of the last sweep that saw it busy and the last command that used the
+    player. Once idle for idle_after seconds, the player's state is
+    saved, its voice connection closed, any ffmpeg process it still owns
+    killed, and the player evicted from `players`.
+    """
+
+    def __init__(self, bot, players, idle_after=GUILD_IDLE_SECONDS, interval=60):
+        self.bot = bot
+        self.players = players
+        self.idle_after = idle_after
+        self.interval = interval
+        self.idle_since = {}
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Error reaping idle guilds: {e}")
+
+    def _voice_clients(self):
+        return {vc.guild.id: vc for vc in self.bot.voice_clients}
+
+    def _busy(self, player, vc):
+        if vc and vc.is_playing():
+            return True
+        return player is not None and (player.lock.locked() or player.active > 0)
+
+    async def sweep(self) -> dict:
+        """Reclaim every guild idle for longer than idle_after; returns counts by kind."""
+        now = time.monotonic()
+        voice_clients = self._voice_clients()
+        guild_ids = set(self.players) | set(voice_clients)
+        reclaimed = {"voice": 0, "player": 0, "ffmpeg": 0}
+
+        for guild_id in guild_ids:
+            player = self.players.get(guild_id)
+            vc = voice_clients.get(guild_id)
+            if self._busy(player, vc):
+                self.idle_since.pop(guild_id, None)
+                continue
+            since = self.idle_since.setdefault(guild_id, now)
+            if player is not None:
+                since = max(since, player.last_used)
+            if now - since >= self.idle_after:
+                for kind, count in (await self.reap(guild_id, player, vc)).items():
+                    reclaimed[kind] += count
+                self.idle_since.pop(guild_id, None)
+
+        for guild_id in set(self.idle_since) - guild_ids:
+            del self.idle_since[guild_id]
+
+        for kind, count in reclaimed.items():
+            if count:
+                RECLAIMED_TOTAL.inc(count, kind=kind)
+        if any(reclaimed.values()):
+            print(
+                f"Reclaimed {reclaimed['voice']} voice connections, {reclaimed['player']} players "
+                f"and {reclaimed['ffmpeg']} ffmpeg processes from idle guilds"
+            )
+        return reclaimed
+
+    async def reap(self, guild_id, player, vc) -> dict:
+        reclaimed = {"voice": 0, "player": 0, "ffmpeg": 0}
+        if player is None:
+            if vc:
+                await vc.disconnect(force=True)
+                reclaimed["voice"] += 1
+            return reclaimed
+
+        used = player.last_used
+        async with player.lock:
+            vc = player.guild.voice_client
+            # a command may have started while we waited for the lock
+            if (vc and vc.is_playing()) or player.active > 0 or player.last_used != used:
+                return reclaimed
+            # snapshot while the voice client still reports the paused track
+            player.save_state()
+            # disconnecting ends the current source; its after-callback must
+            # not start the next track
+            player._play_token = None
+            if vc:
+                await vc.disconnect(force=True)
+                reclaimed["voice"] += 1
+            if player.source is not None:
+                if _process_running(player.source):
+                    reclaimed["ffmpeg"] += 1
+                # idempotent, so safe even if the disconnect already cleaned up;
+                # it also accounts the stream's usage if nothing else did
+                player.source.cleanup()
+            player.source = None
+
+        if self.players.get(guild_id) is player:
+            del self.players[guild_id]
+            reclaimed["player"] += 1
+        return reclaimed
+
+
+def _process_running(source) -> bool:
+    # returncode only: poll() would reap an exited ffmpeg before cleanup()
+    # reads its CPU time (see music._process_cpu_seconds)
+    process = getattr(getattr(source, "original", None), "_process", None)
+    return getattr(process, "returncode", 0) is None
@@ -0,0 +1,174 @@
+import json
+import os
+import re
+import time
+import unicodedata
+
+import store
+from cache import TrackCache
+from logger import read_log
+from metrics import SEARCH_INDEX_LOOKUPS
+
+# A free-text query resolves locally only when its tokens make up at least this
+# share of a known title's tokens; anything vaguer goes to the remote search.
+MIN_COVERAGE = float(os.getenv("SEARCH_INDEX_MIN_COVERAGE", "0.6"))
+
+# Words that decorate upload titles without identifying the song.
+NOISE_TOKENS = {
+    "official", "video", "audio", "music", "lyrics", "lyric", "visualizer",
+    "mv", "hd", "hq", "4k", "clip", "full", "version",
+}
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+_URL_RE = re.compile(r"^(?:[a-z][a-z0-9+.-]*://|www\.|[\w-]+(?:\.[\w-]+)+/)", re.IGNORECASE)
+
+
+def fold(text: str) -> list[str]:
+    """Split text into case- and accent-folded tokens."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(stripped.casefold())
+
+
+def is_free_text(query: str) -> bool:
+    """True for plain search text, False for URLs and yt-dlp search prefixes."""
+    return not (_URL_RE.match(query) or re.match(r"^\w+search\d*:", query))
+
+
+class SearchIndex:
+    """
+    Full-text index over every track the bot has logged.
+
+    Titles live in an FTS5 table whose unicode61 tokenizer folds case and
+    diacritics the same way fold() does; the matching row in `tracks` holds the
+    metadata needed to queue the track and a play count to break ties.
+
+    The index is shared by every guild the bot is in, like the play log it is
+    built from (which does not record the guild). The main connection is used
+    through store.run/submit, off the event loop.
+    """
+
+    def __init__(self, cache_dir=None, filename="search_index.sqlite3", min_coverage=MIN_COVERAGE):
+        self.cache_dir = cache_dir
+        self.filename = filename
+        self.min_coverage = min_coverage
+        self.conn = self._connect(check_same_thread=False)
+
+    def _connect(self, check_same_thread=True):
+        conn = store.connect(self.filename, self.cache_dir, check_same_thread)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "url TEXT PRIMARY KEY, info TEXT NOT NULL, plays INTEGER NOT NULL, "
+            "last_played REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS titles "
+            "USING fts5(title, tokenize='unicode61 remove_diacritics 2')"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.commit()
+        return conn
+
+    @staticmethod
+    def _upsert(conn, info: dict, plays: int, played_at: float, replace_plays=False):
+        url = info["webpage_url"]
+        payload = json.dumps({field: info.get(field) for field in TrackCache.FIELDS})
+        row = conn.execute("SELECT rowid FROM tracks WHERE url = ?", (url,)).fetchone()
+        if row:
+            plays_sql = "?" if replace_plays else "plays + ?"
+            conn.execute(
+                f"UPDATE tracks SET info = ?, plays = {plays_sql}, "
+                "last_played = MAX(last_played, ?) WHERE rowid = ?",
+                (payload, plays, played_at, row[0]),
+            )
+            return
+        cursor = conn.execute(
+            "INSERT INTO tracks (url, info, plays, last_played) VALUES (?, ?, ?, ?)",
+            (url, payload, plays, played_at),
+        )
+        conn.execute(
+            "INSERT INTO titles (rowid, title) VALUES (?, ?)",
+            (cursor.lastrowid, info.get("title") or ""),
+        )
+
+    def add(self, infos: list):
+        """Record one play of each resolved track (blocks; use store.submit)."""
+        played_at = time.time()
+        for info in infos:
+            if str(info.get("webpage_url") or "").startswith("http"):
+                self._upsert(self.conn, info, 1, played_at)
+        self.conn.commit()
+
+    def backfill(self, log_dir: str) -> int:
+        """
+        Seed the index from an existing play log, once.
+
+        Runs on its own connection so it can be called from an executor; play
+        counts from the log replace any counted live before the backfill ran,
+        since the log already contains those plays.
+        """
+        conn = self._connect()
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone():
+                return 0
+            import pandas as pd
+
+            plays, tracks = read_log(log_dir)
+            per_track = plays.groupby("track_id")["played_at"].agg(
+                plays="size", last_played="max")
+            tracks = tracks.join(per_track, on="track_id", how="inner")
+            tracks = tracks[tracks["url"].astype(str).str.startswith("http")]
+
+            for row in tracks.itertuples(index=False):
+                info = {
+                    "webpage_url": row.url,
+                    "title": None if pd.isna(row.title) else row.title,
+                    "duration": None if pd.isna(row.duration) else float(row.duration),
+                    "genre": None if pd.isna(row.genre) else row.genre,
+                    "upload_date": None if pd.isna(row.upload_date)
+                    else row.upload_date.strftime("%Y-%m-%d"),
+                }
+                self._upsert(
+                    conn, info, int(row.plays), row.last_played.timestamp(), replace_plays=True
+                )
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('backfilled', ?)", (str(time.time()),))
+            conn.commit()
+            return len(tracks)
+        finally:
+            conn.close()
+
+    def resolve(self, query: str) -> dict | None:
+        """
+        Return the stored info of the known track a free-text query names.
+
+        Every query token must appear in the title, and the query must cover
+        at least min_coverage of the title's significant tokens; among
+        candidates the best-covered, then most played, wins. Blocks; await it
+        through store.run.
+        """
+        tokens = set(fold(query))
+        if not tokens or not is_free_text(query):
+            SEARCH_INDEX_LOOKUPS.inc(result="skipped")
+            return None
+
+        match = " ".join(f'"{token}"' for token in tokens)
+        rows = self.conn.execute(
+            "SELECT tracks.info, tracks.plays, titles.title FROM titles "
+            "JOIN tracks ON tracks.rowid = titles.rowid "
+            "WHERE titles MATCH ? ORDER BY bm25(titles), tracks.plays DESC LIMIT 50",
+            (match,),
+        ).fetchall()
+
+        best, best_key = None, None
+        for info, plays, title in rows:
+            title_tokens = set(fold(title))
+            significant = (title_tokens - NOISE_TOKENS) or title_tokens
+            coverage = len(tokens & significant) / len(significant)
+            if coverage < self.min_coverage:
+                continue
+            key = (coverage, plays)
+            if best_key is None or key > best_key:
+                best, best_key = info, key
+
+        SEARCH_INDEX_LOOKUPS.inc(result="hit" if best else "miss")
+        return json.loads(best) if best else None
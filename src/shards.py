@@ -0,0 +1,67 @@
+"""
+Run the bot as several shard processes.
+
+Each process runs `main.py` as an AutoShardedBot restricted to its share of
+the shard IDs, so gateway handling, yt-dlp and Opus encoding for different
+guilds spread over multiple interpreters (and cores). Guild state stays in the
+process owning the guild's shard; cross-process state (play log, caches) lives
+in the shared store under BOT_STATE_DIR and log/.
+
+Usage:
+    python src/shards.py --shards 4 --processes 2
+
+Exited processes are restarted, so `ifuckedup` keeps working per process.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """Distribute shard IDs round-robin over the processes."""
+    groups = [[] for _ in range(min(processes, shard_count))]
+    for shard_id in range(shard_count):
+        groups[shard_id % len(groups)].append(shard_id)
+    return groups
+
+
+def spawn(index: int, shard_ids: list[int], shard_count: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["DISCORD_SHARD_COUNT"] = str(shard_count)
+    env["DISCORD_SHARD_IDS"] = ",".join(map(str, shard_ids))
+    # Every process serves its own metrics endpoint on consecutive ports.
+    if env.get("METRICS_PORT"):
+        env["METRICS_PORT"] = str(int(env["METRICS_PORT"]) + index)
+    print(f"Starting shard process for shards {shard_ids}/{shard_count}")
+    return subprocess.Popen([sys.executable, MAIN], env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as multiple shard processes.")
+    parser.add_argument("--shards", type=int, default=int(os.getenv("DISCORD_SHARD_COUNT") or os.cpu_count() or 1))
+    parser.add_argument("--processes", type=int, default=int(os.getenv("SHARD_PROCESSES") or os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    groups = split_shards(args.shards, args.processes)
+    procs = {i: spawn(i, group, args.shards) for i, group in enumerate(groups)}
+
+    try:
+        while True:
+            time.sleep(5)
+            for i, proc in procs.items():
+                if proc.poll() is not None:
+                    print(f"Shard process {groups[i]} exited with {proc.returncode}, restarting")
+                    procs[i] = spawn(i, groups[i], args.shards)
+    except KeyboardInterrupt:
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
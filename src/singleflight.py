@@ -0,0 +1,46 @@
+import asyncio
+
+from metrics import SINGLEFLIGHT_SHARED
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it runs
+    await the same task instead of repeating it. Waiters are shielded, so one
+    caller being cancelled does not cancel the work for the others; the task is
+    only cancelled once every waiter has gone.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = {}
+
+    async def do(self, key, fn):
+        """Return the result of fn(), sharing it with concurrent calls for key."""
+        call = self.calls.get(key)
+        if call:
+            SINGLEFLIGHT_SHARED.inc(group=self.name)
+        else:
+            call = self.calls[key] = [asyncio.ensure_future(fn()), 0]
+            call[0].add_done_callback(lambda _: self._forget(key, call))
+
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and call[1] == 1:
+                # forget it now rather than when the task finishes cancelling,
+                # so a caller arriving in between starts fresh work instead of
+                # joining the cancelled task
+                self._forget(key, call)
+                task.cancel()
+            raise
+        finally:
+            call[1] -= 1
+
+    def _forget(self, key, call):
+        if self.calls.get(key) is call:
+            del self.calls[key]
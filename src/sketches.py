@@ -0,0 +1,408 @@
+"""
+Streaming sketches of the play log for approximate analytics.
+
+Every logged play updates, for the all-time bucket and for its calendar
+month, a set of fixed-size summaries:
+
+- Space-Saving heavy hitters (SKETCH_CAPACITY counters each) for plays per
+  title, genre and requester, seconds per requester, plays per upload year
+  and plays per weekday/hour slot. A reported count overestimates the true
+  one by at most its recorded error, which is at most N / SKETCH_CAPACITY
+  (N = plays, or seconds, in the bucket); anything played more often than
+  that is guaranteed to be listed. Years and weekday/hour slots never fill
+  their summaries, so they are exact.
+- HyperLogLog (2^HLL_PRECISION registers) for distinct listeners and
+  tracks: standard error 1.04 / sqrt(4096) = 1.6%.
+- Exact totals of plays and seconds.
+
+Space-Saving summaries and HyperLogLog registers merge, so a time range is
+answered from its months; merged counts keep the N / SKETCH_CAPACITY bound.
+Storage per bucket is constant, whatever the number of plays.
+"""
+import hashlib
+import math
+import os
+import sqlite3
+from datetime import datetime
+
+import store
+from logger import PLAYS_FILE, join_log, read_log
+from store import file_lock
+
+# Use the sketches for `wrap` (per-user wraps and missing sketches stay exact).
+ANALYTICS_APPROXIMATE = os.getenv("ANALYTICS_APPROXIMATE", "0") != "0"
+SKETCH_CAPACITY = int(os.getenv("SKETCH_CAPACITY", "1000"))
+HLL_PRECISION = 12
+
+# Bucket holding the whole history; the others are calendar months (YYYY-MM).
+ALL_TIME = "all"
+
+
+def hash64(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def period_of(played_at: datetime) -> str:
+    return played_at.strftime("%Y-%m")
+
+
+class SpaceSaving:
+    """
+    Space-Saving top-k summary (Metwally et al.).
+
+    `counts` maps key -> [count, error]: count is an upper bound on the key's
+    true weight and count - error a lower bound.
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY, counts=None):
+        self.capacity = capacity
+        self.counts = counts or {}
+
+    @property
+    def min_count(self) -> float:
+        # weight an unlisted key can have at most
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counts.values())
+
+    def add(self, key, weight=1):
+        if key in self.counts:
+            self.counts[key][0] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = [weight, 0]
+        else:
+            victim = min(self.counts, key=lambda k: self.counts[k][0])
+            floor = self.counts.pop(victim)[0]
+            self.counts[key] = [floor + weight, floor]
+
+    def merge(self, other: "SpaceSaving"):
+        """Combine with a summary of disjoint plays (Agarwal et al.'s mergeable summaries)."""
+        own_floor, other_floor = self.min_count, other.min_count
+        merged = {}
+        for key in self.counts.keys() | other.counts.keys():
+            count, error = self.counts.get(key, [own_floor, own_floor])
+            other_count, other_error = other.counts.get(key, [other_floor, other_floor])
+            merged[key] = [count + other_count, error + other_error]
+        if len(merged) > self.capacity:
+            kept = sorted(merged, key=lambda k: merged[k][0], reverse=True)[:self.capacity]
+            merged = {key: merged[key] for key in kept}
+        self.counts = merged
+
+    def top(self, limit=None) -> list:
+        """(key, count, error) by count, highest first."""
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(key, count, error) for key, (count, error) in ranked[:limit]]
+
+
+class HyperLogLog:
+    """Distinct-count estimate in 2^precision one-byte registers (Flajolet et al.)."""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = bytearray(registers or bytes(1 << precision))
+
+    @staticmethod
+    def rank(hashed: int, precision: int) -> tuple[int, int]:
+        """Register index and rank (position of the first 1 bit) of a 64-bit hash."""
+        rest_bits = 64 - precision
+        rest = hashed & ((1 << rest_bits) - 1)
+        return hashed >> rest_bits, rest_bits - rest.bit_length() + 1
+
+    def add(self, key: str):
+        index, rank = self.rank(hash64(key), self.precision)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small cardinalities: linear counting is more accurate
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+def _observations(row: dict) -> tuple[dict, dict]:
+    """Space-Saving (kind -> (key, weight)) and HyperLogLog (kind -> key) updates for one play."""
+    played_at = row["played_at"]
+    duration = row.get("duration") or 0
+    requester = str(row["requester_id"])
+    counted = {
+        "requester": (requester, 1),
+        "requester_seconds": (requester, duration),
+        "slot": (str(played_at.weekday() * 24 + played_at.hour), 1),
+    }
+    if row.get("title"):
+        counted["title"] = (row["title"], 1)
+    if row.get("genre"):
+        counted["genre"] = (row["genre"], 1)
+    year = str(row.get("upload_date") or "")[:4]
+    if year.isdigit():
+        counted["year"] = (year, 1)
+    return counted, {"listeners": requester, "tracks": row["url"]}
+
+
+class SketchStore:
+    """
+    Sketches of the play log in log/sketches.sqlite3, shared by shard processes.
+
+    Logger calls add() for every play while holding the play log lock; before
+    backfill() has imported the existing log plays are not counted, and the
+    backfill finishes under the same lock, so every play is counted exactly
+    once. add() runs on the
+    Logger's writer thread, so the store's connection is not tied to the
+    thread that opened it.
+    """
+
+    def __init__(self, log_dir="log", filename="sketches.sqlite3", capacity=SKETCH_CAPACITY):
+        self.log_dir = log_dir
+        self.filename = filename
+        self.capacity = capacity
+        self.conn = self._connect(check_same_thread=False)
+
+    def _connect(self, check_same_thread=True):
+        conn = store.connect(self.filename, self.log_dir, check_same_thread)
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS counters ("
+            " period TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL,"
+            " count REAL NOT NULL, error REAL NOT NULL, UNIQUE (period, kind, key));"
+            "CREATE INDEX IF NOT EXISTS counters_min ON counters (period, kind, count);"
+            "CREATE TABLE IF NOT EXISTS registers ("
+            " period TEXT NOT NULL, kind TEXT NOT NULL, registers BLOB NOT NULL,"
+            " PRIMARY KEY (period, kind));"
+            "CREATE TABLE IF NOT EXISTS totals ("
+            " period TEXT PRIMARY KEY, plays INTEGER NOT NULL, seconds REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+        )
+        conn.commit()
+        return conn
+
+    def close(self):
+        self.conn.close()
+
+    def ready(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone() is not None
+
+    def add(self, row: dict):
+        """Count one play (a normalized Logger row); the caller holds the play log lock."""
+        if not self.ready():
+            return
+        with self.conn:
+            self._count(self.conn, row)
+
+    def _count(self, conn, row: dict):
+        counted, distinct = _observations(row)
+        for period in (ALL_TIME, period_of(row["played_at"])):
+            for kind, (key, weight) in counted.items():
+                self._bump(conn, period, kind, key, weight)
+            for kind, key in distinct.items():
+                self._observe(conn, period, kind, key)
+            conn.execute(
+                "INSERT INTO totals VALUES (?, 1, ?) ON CONFLICT (period) DO UPDATE "
+                "SET plays = plays + 1, seconds = seconds + excluded.seconds",
+                (period, row.get("duration") or 0),
+            )
+
+    def _bump(self, conn, period, kind, key, weight):
+        # Space-Saving update in place: the table holds at most `capacity` keys per summary
+        if conn.execute(
+            "UPDATE counters SET count = count + ? WHERE period = ? AND kind = ? AND key = ?",
+            (weight, period, kind, key),
+        ).rowcount:
+            return
+        size = conn.execute(
+            "SELECT COUNT(*) FROM counters WHERE period = ? AND kind = ?", (period, kind)
+        ).fetchone()[0]
+        if size < self.capacity:
+            conn.execute("INSERT INTO counters VALUES (?, ?, ?, ?, 0)", (period, kind, key, weight))
+            return
+        conn.execute(
+            "UPDATE counters SET key = ?, error = count, count = count + ? WHERE rowid = ("
+            "SELECT rowid FROM counters WHERE period = ? AND kind = ? ORDER BY count LIMIT 1)",
+            (key, weight, period, kind),
+        )
+
+    def _observe(self, conn, period, kind, key):
+        row = conn.execute(
+            "SELECT registers FROM registers WHERE period = ? AND kind = ?", (period, kind)
+        ).fetchone()
+        hll = HyperLogLog(registers=row[0] if row else None)
+        before = bytes(hll.registers)
+        hll.add(key)
+        if row is None or hll.registers != before:
+            conn.execute(
+                "INSERT OR REPLACE INTO registers VALUES (?, ?, ?)", (period, kind, bytes(hll.registers))
+            )
+
+    def backfill(self, log_dir: str | None = None) -> int:
+        """
+        Build the sketches from the existing play log, once; returns the plays imported.
+
+        Runs on its own connection so it can be called from an executor. The
+        log is read and summarized without the play log lock; the lock is only
+        taken at the end, to count the plays logged meanwhile one by one and
+        mark the sketches ready. The whole import is one write transaction,
+        so shard processes backfilling at once do it once.
+        """
+        log_dir = log_dir or self.log_dir
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone():
+                    conn.rollback()
+                    return 0
+                plays, tracks = read_log(log_dir)
+                self._import(conn, plays, tracks)
+                # add() skips plays until 'backfilled' is committed: count those
+                # logged since the read here (plays.parquet only grows at the end)
+                with file_lock(os.path.join(log_dir, PLAYS_FILE)):
+                    latest, tracks = read_log(log_dir)
+                    for row in _rows(latest.iloc[len(plays):], tracks):
+                        self._count(conn, row)
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('backfilled', ?)",
+                                 (datetime.now().isoformat(),))
+                    conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return len(latest)
+        finally:
+            conn.close()
+
+    def _import(self, conn, plays, tracks):
+        import numpy as np
+        import pandas as pd
+
+        # Counted like Analytics: plays per track ID first, then per attribute
+        # of the (far fewer) tracks. Exact counts truncated to the top
+        # `capacity` keys are a valid Space-Saving state.
+        tracks = tracks.set_index("track_id")
+        attributes = {
+            "title": tracks["title"],
+            # add() skips empty genres too
+            "genre": tracks["genre"].replace("", None),
+            "year": tracks["upload_date"].dt.year,
+        }
+        track_ids = plays["track_id"].to_numpy()
+        played_at = plays["played_at"]
+        requester_codes, requesters = pd.factorize(plays["requester_id"])
+        frame = pd.DataFrame({
+            "month": (played_at.dt.year * 100 + played_at.dt.month).to_numpy(),
+            "track_id": track_ids,
+            "requester": plays["requester_id"].to_numpy(),
+            "requester_code": requester_codes,
+            "slot": (played_at.dt.dayofweek * 24 + played_at.dt.hour).to_numpy(),
+            "seconds": tracks["duration"].astype("float64").fillna(0).to_numpy()[track_ids],
+        })
+        # every distinct key is hashed once; track IDs are dense, so they index track_ranks
+        track_ranks = _ranks(tracks["url"])
+        requester_ranks = _ranks(requesters)
+
+        buckets = [(ALL_TIME, frame)]
+        buckets += [(f"{month // 100:04d}-{month % 100:02d}", part) for month, part in frame.groupby("month")]
+        for period, part in buckets:
+            per_track = part["track_id"].value_counts()
+            for kind, values in attributes.items():
+                self._insert_counts(conn, period, kind, per_track.groupby(values.reindex(per_track.index)).sum())
+            self._insert_counts(conn, period, "requester", part["requester"].value_counts())
+            self._insert_counts(conn, period, "requester_seconds", part.groupby("requester")["seconds"].sum())
+            self._insert_counts(conn, period, "slot", part["slot"].value_counts())
+
+            for kind, ranks in (("listeners", requester_ranks[part["requester_code"].unique()]),
+                                ("tracks", track_ranks[per_track.index.to_numpy()])):
+                registers = np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+                np.maximum.at(registers, ranks[:, 0], ranks[:, 1])
+                conn.execute("INSERT OR REPLACE INTO registers VALUES (?, ?, ?)",
+                             (period, kind, registers.tobytes()))
+
+            conn.execute("INSERT OR REPLACE INTO totals VALUES (?, ?, ?)",
+                         (period, len(part), float(part["seconds"].sum())))
+
+    def _insert_counts(self, conn, period, kind, counts):
+        counts = counts.sort_values(ascending=False, kind="stable").head(self.capacity)
+        conn.executemany(
+            "INSERT INTO counters VALUES (?, ?, ?, ?, 0)",
+            ((period, kind, _key(kind, key), float(count)) for key, count in counts.items()),
+        )
+
+    # --- queries -------------------------------------------------------
+
+    def periods(self, start: datetime | None = None, end: datetime | None = None) -> list[str]:
+        """Buckets covering [start, end]: all-time if unbounded, else every month touched."""
+        if start is None and end is None:
+            return [ALL_TIME]
+        rows = self.conn.execute(
+            "SELECT period FROM totals WHERE period != ? AND period >= ? AND period <= ?",
+            (ALL_TIME, period_of(start) if start else "", period_of(end) if end else "9999"),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def summary(self, kind: str, periods: list[str]) -> SpaceSaving:
+        merged = None
+        for period in periods:
+            rows = self.conn.execute(
+                "SELECT key, count, error FROM counters WHERE period = ? AND kind = ?", (period, kind)
+            ).fetchall()
+            summary = SpaceSaving(self.capacity, {key: [count, error] for key, count, error in rows})
+            if merged is None:
+                merged = summary
+            else:
+                merged.merge(summary)
+        return merged or SpaceSaving(self.capacity)
+
+    def distinct(self, kind: str, periods: list[str]) -> int:
+        merged = HyperLogLog()
+        for period in periods:
+            row = self.conn.execute(
+                "SELECT registers FROM registers WHERE period = ? AND kind = ?", (period, kind)
+            ).fetchone()
+            if row:
+                merged.merge(HyperLogLog(registers=row[0]))
+        return merged.count()
+
+    def totals(self, periods: list[str]) -> tuple[int, float]:
+        plays, seconds = 0, 0.0
+        for period in periods:
+            row = self.conn.execute("SELECT plays, seconds FROM totals WHERE period = ?", (period,)).fetchone()
+            if row:
+                plays += row[0]
+                seconds += row[1]
+        return plays, seconds
+
+
+def sketches_ready(log_dir="log", filename="sketches.sqlite3") -> bool:
+    """Whether the sketches in log_dir have been built; a read-only check that creates nothing."""
+    path = os.path.join(log_dir, filename)
+    if not os.path.exists(path):
+        return False
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone() is not None
+    except sqlite3.OperationalError:
+        return False  # created but not initialized yet
+    finally:
+        conn.close()
+
+
+def _key(kind: str, key) -> str:
+    # years come out of pandas as floats
+    return str(int(key)) if kind in ("year", "slot") else str(key)
+
+
+def _rows(plays, tracks) -> list:
+    """Plays as normalized Logger rows (missing values None), for _count."""
+    joined = join_log(plays, tracks)
+    return joined.astype(object).where(joined.notna(), None).to_dict("records")
+
+
+def _ranks(keys):
+    """(register index, rank) rows for each key, as the live path computes them."""
+    import numpy as np
+
+    pairs = [HyperLogLog.rank(hash64(str(key)), HLL_PRECISION) for key in keys]
+    return np.array(pairs, dtype=np.int64).reshape(-1, 2)
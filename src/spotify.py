@@ -6,14 +6,22 @@ import re
 import time
 from dataclasses import dataclass
 from typing import Any
+from urllib.error import HTTPError
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 
+from cache import ResponseCache
+from metrics import SPOTIFY_API_SECONDS
+from singleflight import SingleFlight
+from tracing import span
+
 
 @dataclass
 class SpotifyTrack:
     title: str
     artists: list[str]
+    id: str | None = None
+    isrc: str | None = None
 
     def to_ytmusic_query(self) -> str:
         artist_text = self.artists[0]
@@ -31,6 +39,10 @@ class SpotifyResolver:
         self.client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
         self._access_token: str | None = None
         self._token_expires_at = 0.0
+        self.max_concurrency = max(1, int(os.getenv("SPOTIFY_MAX_CONCURRENCY", "8")))
+        self.response_cache = ResponseCache(ttl=int(os.getenv("SPOTIFY_CACHE_TTL", "300")))
+        # Identical concurrent API calls (and token refreshes) share one request.
+        self.flight = SingleFlight("spotify")
 
     @staticmethod
     def _normalize_url(value: str) -> str:
@@ -54,26 +66,30 @@ class SpotifyResolver:
             raise ValueError("Not a valid Spotify track/album/playlist URL.")
         return match.group("kind").lower(), match.group("id")
 
-    async def to_youtube_music_query(self, spotify_url: str) -> str:
+    async def get_track(self, spotify_url: str) -> SpotifyTrack:
         kind, item_id = self._extract_kind_and_id(spotify_url)
         if kind != "track":
             raise ValueError("This Spotify URL is not a track. Use playlist command for albums/playlists.")
-        track = await self._get_track(item_id)
-        return track.to_ytmusic_query()
+        return await self._get_track(item_id)
 
-    async def to_youtube_music_queries(self, spotify_url: str) -> list[str]:
+    async def get_tracks(self, spotify_url: str) -> list[SpotifyTrack]:
         kind, item_id = self._extract_kind_and_id(spotify_url)
         if kind == "track":
-            track = await self._get_track(item_id)
-            return [track.to_ytmusic_query()]
+            return [await self._get_track(item_id)]
         if kind == "album":
-            tracks = await self._get_album_tracks(item_id)
-            return [track.to_ytmusic_query() for track in tracks]
+            return await self._get_album_tracks(item_id)
         if kind == "playlist":
-            tracks = await self._get_playlist_tracks(item_id)
-            return [track.to_ytmusic_query() for track in tracks]
+            return await self._get_playlist_tracks(item_id)
         raise ValueError("Unsupported Spotify URL type.")
 
+    async def to_youtube_music_query(self, spotify_url: str) -> str:
+        track = await self.get_track(spotify_url)
+        return track.to_ytmusic_query()
+
+    async def to_youtube_music_queries(self, spotify_url: str) -> list[str]:
+        tracks = await self.get_tracks(spotify_url)
+        return [track.to_ytmusic_query() for track in tracks]
+
     async def _get_access_token(self) -> str:
         if not self.client_id or not self.client_secret:
             raise ValueError(
@@ -83,7 +99,10 @@ class SpotifyResolver:
         now = time.time()
         if self._access_token and now < self._token_expires_at:
             return self._access_token
+        return await self.flight.do("token", self._refresh_access_token)
 
+    async def _refresh_access_token(self) -> str:
+        now = time.time()
         loop = asyncio.get_event_loop()
         token_data = await loop.run_in_executor(None, self._fetch_access_token_sync)
         self._access_token = token_data["access_token"]
@@ -110,67 +129,163 @@ class SpotifyResolver:
             body = response.read().decode("utf-8")
             return json.loads(body)
 
-    async def _api_get(self, path: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
+    async def _api_get(
+        self,
+        path: str,
+        params: dict[str, Any] | None = None,
+        cache: bool = True,
+    ) -> dict[str, Any]:
+        key = ResponseCache.make_key(path, params)
+        entry = self.response_cache.get(key) if cache else None
+        if entry and self.response_cache.is_fresh(entry):
+            return entry["body"]
+        return await self.flight.do(
+            (key, cache), lambda: self._api_fetch(key, path, params, entry, cache)
+        )
+
+    async def _api_fetch(
+        self,
+        key: str,
+        path: str,
+        params: dict[str, Any] | None,
+        entry: dict[str, Any] | None,
+        cache: bool,
+    ) -> dict[str, Any]:
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
         token = await self._get_access_token()
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._api_get_sync, token, path, params)
+        start = time.perf_counter()
+        with span("spotify.api", path=path):
+            status, body, etag, last_modified = await loop.run_in_executor(
+                None, self._api_get_sync, token, path, params, headers
+            )
+        SPOTIFY_API_SECONDS.observe(
+            time.perf_counter() - start, endpoint=path.split("/", 1)[0], status=status
+        )
 
-    def _api_get_sync(self, token: str, path: str, params: dict[str, Any] | None) -> dict[str, Any]:
+        if status == 304 and entry:
+            return self.response_cache.touch(key, entry)["body"]
+        if cache:
+            self.response_cache.put(key, body, etag=etag, last_modified=last_modified)
+        return body
+
+    def _api_get_sync(
+        self,
+        token: str,
+        path: str,
+        params: dict[str, Any] | None,
+        headers: dict[str, str] | None = None,
+    ) -> tuple[int, dict[str, Any] | None, str | None, str | None]:
         query = f"?{urlencode(params)}" if params else ""
         url = f"https://api.spotify.com/v1/{path}{query}"
         request = Request(
             url,
-            headers={"Authorization": f"Bearer {token}"},
+            headers={"Authorization": f"Bearer {token}", **(headers or {})},
             method="GET",
         )
-        with urlopen(request, timeout=20) as response:
-            body = response.read().decode("utf-8")
-            return json.loads(body)
+        try:
+            with urlopen(request, timeout=20) as response:
+                body = response.read().decode("utf-8")
+                return (
+                    response.status,
+                    json.loads(body),
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                )
+        except HTTPError as e:
+            if e.code == 304:
+                return 304, None, None, None
+            raise
 
     @staticmethod
     def _to_track(item: dict[str, Any]) -> SpotifyTrack:
         artists = [artist.get("name", "") for artist in item.get("artists", []) if artist.get("name")]
-        return SpotifyTrack(title=item.get("name", "Unknown Title"), artists=artists or ["Unknown Artist"])
+        return SpotifyTrack(
+            title=item.get("name", "Unknown Title"),
+            artists=artists or ["Unknown Artist"],
+            id=item.get("id"),
+            isrc=(item.get("external_ids") or {}).get("isrc"),
+        )
 
     async def _get_track(self, track_id: str) -> SpotifyTrack:
         payload = await self._api_get(f"tracks/{track_id}")
         return self._to_track(payload)
 
-    async def _get_album_tracks(self, album_id: str) -> list[SpotifyTrack]:
-        tracks: list[SpotifyTrack] = []
-        offset = 0
+    async def _get_paged_items(
+        self,
+        path: str,
+        params: dict[str, Any],
+        page_size: int,
+        cache: bool = True,
+    ) -> list[dict[str, Any]]:
+        """Fetch every page of a paged endpoint, in order.
 
-        while True:
-            payload = await self._api_get(f"albums/{album_id}/tracks", {"limit": 50, "offset": offset})
-            items = payload.get("items", [])
-            tracks.extend(self._to_track(item) for item in items)
-            if not payload.get("next"):
-                break
-            offset += len(items)
+        The first response carries ``total``, so all remaining offsets are known
+        up front and fetched concurrently, capped at ``max_concurrency``.
+        """
+        first = await self._api_get(path, {**params, "limit": page_size, "offset": 0}, cache=cache)
+        items = list(first.get("items", []))
+        total = int(first.get("total") or 0)
+        offsets = range(len(items), total, page_size) if items else range(0)
+        if not offsets:
+            return items
 
-        return tracks
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch_page(offset: int) -> list[dict[str, Any]]:
+            async with semaphore:
+                payload = await self._api_get(
+                    path, {**params, "limit": page_size, "offset": offset}, cache=cache
+                )
+            return payload.get("items", [])
+
+        pages = await asyncio.gather(*(fetch_page(offset) for offset in offsets))
+        for page in pages:
+            items.extend(page)
+        return items
+
+    async def _get_album_tracks(self, album_id: str) -> list[SpotifyTrack]:
+        # The album tracks endpoint does not support the fields filter, but its
+        # items are already simplified track objects.
+        items = await self._get_paged_items(f"albums/{album_id}/tracks", {}, page_size=50)
+        return [self._to_track(item) for item in items]
 
     async def _get_playlist_tracks(self, playlist_id: str) -> list[SpotifyTrack]:
-        tracks: list[SpotifyTrack] = []
-        offset = 0
+        # The snapshot_id changes whenever the playlist does, so one cheap
+        # (conditionally revalidated) metadata request decides whether the
+        # cached item list can be reused without paging again.
+        meta = await self._api_get(f"playlists/{playlist_id}", {"fields": "snapshot_id"})
+        snapshot_id = meta.get("snapshot_id")
+        key = f"playlists/{playlist_id}/tracks#items"
+        entry = self.response_cache.get(key)
 
-        while True:
-            payload = await self._api_get(
+        if snapshot_id and entry and entry["snapshot_id"] == snapshot_id:
+            items = entry["body"]
+        else:
+            items = await self._get_paged_items(
                 f"playlists/{playlist_id}/tracks",
-                {"limit": 100, "offset": offset, "additional_types": "track"},
+                {
+                    "additional_types": "track",
+                    "fields": "total,items(track(id,name,is_local,artists(name),external_ids(isrc)))",
+                },
+                page_size=100,
+                cache=False,
             )
-            items = payload.get("items", [])
-
-            for item in items:
-                track = item.get("track")
-                if not isinstance(track, dict):
-                    continue
-                if track.get("is_local"):
-                    continue
-                tracks.append(self._to_track(track))
-
-            if not payload.get("next"):
-                break
-            offset += len(items)
+            if snapshot_id:
+                self.response_cache.put(key, items, snapshot_id=snapshot_id)
+
+        tracks: list[SpotifyTrack] = []
+        for item in items:
+            track = item.get("track")
+            if not isinstance(track, dict):
+                continue
+            if track.get("is_local"):
+                continue
+            tracks.append(self._to_track(track))
 
         return tracks
@@ -0,0 +1,71 @@
+import asyncio
+import fcntl
+import os
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from metrics import ERRORS_TOTAL
+
+# Directory for state shared between shard processes on the same host.
+STATE_DIR = os.getenv("BOT_STATE_DIR", "cache")
+
+# Store calls made on behalf of the event loop run on this one thread, in
+# order: SQLite may wait up to its 30 s busy timeout on another shard process.
+# Stores used through it open their connection with check_same_thread=False.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+
+
+def connect(filename: str, state_dir: str | None = None, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Open a SQLite database in the shared state directory.
+
+    WAL mode lets several shard processes read while one writes, and the busy
+    timeout makes concurrent writers wait for the lock instead of failing.
+    Pass check_same_thread=False for a connection created on one thread and
+    used on another (never on two at once).
+    """
+    state_dir = state_dir or STATE_DIR
+    os.makedirs(state_dir, exist_ok=True)
+    conn = sqlite3.connect(
+        os.path.join(state_dir, filename), timeout=30, check_same_thread=check_same_thread
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+async def run(fn, *args):
+    """Await a blocking store call, made on the store thread."""
+    return await asyncio.wrap_future(_executor.submit(fn, *args))
+
+
+def submit(fn, *args, where: str = "store") -> Future:
+    """Make a blocking store call on the store thread without waiting; failures are reported."""
+    future = _executor.submit(fn, *args)
+    future.add_done_callback(lambda done: _report(done, where))
+    return future
+
+
+def _report(future: Future, where: str):
+    error = future.exception()
+    if error is not None:
+        ERRORS_TOTAL.inc(where=where)
+        print(f"Error in {where}: {error}")
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive inter-process lock tied to path (via path + '.lock').
+
+    Acquiring blocks the calling thread, with no timeout, until every other
+    holder (in any shard process) is done. Never take it on the event loop:
+    call the code that needs it through run_in_executor or a worker thread.
+    """
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
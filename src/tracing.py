@@ -0,0 +1,122 @@
+"""
+Lightweight per-command tracing.
+
+A root span is started for every command invocation (see `start_trace`) and
+subsystem calls wrap themselves in `span(...)`; spans nest through a context
+variable, so child spans attach to whatever trace the current task runs under
+and are free no-ops outside of one. When a trace exceeds TRACE_SLOW_MS its span
+tree is printed, and with TRACE_EXPORT_PATH set every finished trace is appended
+there as a JSON line.
+"""
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+
+SLOW_COMMAND_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))
+EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, parent=None, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._end = None
+        self.error = None
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self._end if self._end is not None else time.perf_counter()
+        return (end - self._start) * 1000
+
+    def finish(self, error: BaseException | None = None):
+        if self._end is None:
+            self._end = time.perf_counter()
+        if error is not None:
+            self.error = repr(error)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "attrs": {k: str(v) for k, v in self.attrs.items()},
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "error": self.error,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def format_tree(self, depth: int = 0) -> str:
+        attrs = " ".join(f"{k}={v}" for k, v in self.attrs.items())
+        line = f"{'  ' * depth}{self.name} {self.duration_ms:.1f}ms"
+        if attrs:
+            line += f" [{attrs}]"
+        if self.error:
+            line += f" error={self.error}"
+        return "\n".join([line] + [child.format_tree(depth + 1) for child in self.children])
+
+
+def start_trace(name: str, **attrs) -> Span:
+    """Start a root span and make it current for the running task."""
+    root = Span(name, **attrs)
+    _current_span.set(root)
+    return root
+
+
+def finish_trace(root: Span, error: BaseException | None = None):
+    """Finish a root span, logging it if slow and exporting it if configured."""
+    root.finish(error)
+    if _current_span.get() is root:
+        _current_span.set(None)
+
+    if root.duration_ms >= SLOW_COMMAND_MS:
+        print(f"Slow command ({root.duration_ms:.0f}ms >= {SLOW_COMMAND_MS:.0f}ms):\n{root.format_tree()}")
+
+    if EXPORT_PATH:
+        try:
+            with open(EXPORT_PATH, "a") as f:
+                f.write(json.dumps(root.to_dict()) + "\n")
+        except OSError as e:
+            print(f"Error exporting trace: {e}")
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """Run the with-block as its own root trace."""
+    root = start_trace(name, **attrs)
+    error = None
+    try:
+        yield root
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        finish_trace(root, error)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the with-block as a child of the current span, if a trace is active."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, parent, **attrs)
+    token = _current_span.set(child)
+    error = None
+    try:
+        yield child
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish(error)
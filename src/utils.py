@@ -2,6 +2,9 @@ import time
 import discord
 import os
 
+from outbound import dispatcher
+from tracing import span
+
 TARGET_CHANNEL_ID = int(os.getenv("DISCORD_CHANNEL_ID")) if os.getenv("DISCORD_CHANNEL_ID") else None
 
 def format_duration(seconds: int) -> str:
@@ -51,8 +54,54 @@ def make_track_embed(info, requester, title="Added to Queue"):
         embed.set_thumbnail(url=info["thumbnail"])
     return embed
 
-def make_queue_embed(player):
+QUEUE_PAGE_SIZE = 10
+
+def _queue_line(position, track):
+    title = track['title'] if len(track['title']) <= 80 else track['title'][:77] + "..."
+    return f"{position}. [{title}]({track.get('webpage_url','')}) ({format_duration(track.get('duration'))}) | By: {track.get('requester').mention}\n"
+
+def queue_page_count(player):
+    total = len(player.now_queue) + len(player.queue)
+    return max(1, -(-total // QUEUE_PAGE_SIZE))
+
+def render_queue_page(player, page):
+    """
+    Render the track list of one queue page.
+
+    Only the tracks on the page are formatted, and the result is cached until
+    the player's queue version changes.
+    """
+    cache = player.page_cache
+    if cache.get("version") != player.version:
+        cache.clear()
+        cache["version"] = player.version
+    if page in cache:
+        return cache[page]
+
+    start = page * QUEUE_PAGE_SIZE
+    end = start + QUEUE_PAGE_SIZE
+    prio_count = len(player.now_queue)
+    total = prio_count + len(player.queue)
+
+    desc = ""
+    if start < prio_count:
+        desc += "**Priority**\n"
+        for i in range(start, min(end, prio_count)):
+            desc += _queue_line(i + 1, player.now_queue[i])
+    if end > prio_count and start < total:
+        desc += "**Queue**\n"
+        for i in range(max(start, prio_count), min(end, total)):
+            desc += _queue_line(i + 1, player.queue[i - prio_count])
+
+    cache[page] = desc
+    return desc
+
+def make_queue_embed(player, page=0):
+    """Build the queue embed for a player (or its snapshot)."""
+    pages = queue_page_count(player)
+    page = max(0, min(page, pages - 1))
     embed = discord.Embed(title="Music Queue", color=discord.Color.dark_red())
+    embed.description = render_queue_page(player, page) or None
     if player.current:
         dur = player.current.get("duration")
         progress = format_progress(player.start_time, dur) if player.start_time else format_duration(dur)
@@ -63,50 +112,91 @@ def make_queue_embed(player):
         )
         if player.current.get("thumbnail"):
             embed.set_image(url=player.current["thumbnail"])
-    if player.now_queue:        
-        desc = ""
-        for i, track in enumerate(player.now_queue):
-            line = f"{i+1}. [{track['title']}]({track.get('webpage_url','')}) ({format_duration(track.get('duration'))}) | By: {track.get('requester').mention}\n"
-            # Stop adding if we're approaching the 1024 limit
-            if len(desc) + len(line) > 1000:
-                remaining = len(player.now_queue) - i
-                desc += f"... and {remaining} more."
-                break
-            desc += line
-        embed.add_field(name="-------------------- **Priority** --------------------", value=desc, inline=False)
-    if player.queue:
-        desc = ""
-        for i, track in enumerate(player.queue):
-            line = f"{i + len(player.now_queue) + 1}. [{track['title']}]({track.get('webpage_url','')}) ({format_duration(track.get('duration'))}) | By: {track.get('requester').mention}\n"
-            # Stop adding if we're approaching the 1024 limit
-            if len(desc) + len(line) > 1000:
-                remaining = len(player.queue) - i
-                desc += f"... and {remaining} more."
-                break
-            desc += line
-        embed.add_field(name="------------------ **Non-Priority** ------------------", value=desc, inline=False)
+    total = len(player.now_queue) + len(player.queue)
+    footer = f"Page {page + 1}/{pages} | {total} track(s)"
+    if player.queued_duration:
+        footer += f" | {format_duration(player.queued_duration)} total"
+    embed.set_footer(text=footer)
     return embed
 
+class QueueView(discord.ui.View):
+    """Previous/next buttons paging through a player's queue."""
+
+    def __init__(self, player, page=0, timeout=180):
+        super().__init__(timeout=timeout)
+        self.player = player
+        self.page = page
+        self._sync_buttons()
+
+    @property
+    def pages(self):
+        return queue_page_count(self.player)
+
+    def _sync_buttons(self):
+        self.page = max(0, min(self.page, self.pages - 1))
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.pages - 1
+
+    async def _show(self, interaction):
+        self._sync_buttons()
+        embed = make_queue_embed(self.player.snapshot(), self.page)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        self.page -= 1
+        await self._show(interaction)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        self.page += 1
+        await self._show(interaction)
+
 async def ensure_voice(ctx):
     """Ensure bot is in a voice channel with the user."""
     if not ctx.voice_client:
         if ctx.author.voice:
-            return await ctx.author.voice.channel.connect()
+            with span("voice.connect"):
+                return await ctx.author.voice.channel.connect()
         await send_message(ctx, f"{ctx.author.mention}, you need to join a voice channel first.")
         return None
     return ctx.voice_client
 
-async def send_message(ctx, content=None, embed=None, view=None, suppress_embeds=False):
-    """Send the response only in target channel."""
-    # Determine target channel
+def get_target_channel(ctx):
     channel = None
     if TARGET_CHANNEL_ID:
         channel = ctx.guild.get_channel(TARGET_CHANNEL_ID)
-    if not channel:
-        channel = ctx.channel
+    return channel or ctx.channel
+
+async def send_message(ctx, content=None, embed=None, view=None, suppress_embeds=False, files=None, wait=False):
+    """
+    Send the response only in target channel.
+
+    Messages go through the per-channel outbound queue and this returns as soon
+    as the message is queued; pass wait=True to wait until it has been sent.
+    """
+    kwargs = dict(content=content, embed=embed, view=view, suppress_embeds=suppress_embeds)
+    if files:
+        kwargs["files"] = files[:10]  # Discord allows 10 attachments per message
+    future = dispatcher.submit(get_target_channel(ctx), **kwargs)
+    if wait:
+        with span("message.send"):
+            return await future
+    return future
+
+async def send_notices(ctx, lines, title, color=None, limit=4000):
+    """Batch related one-line notices into a single embed."""
+    if not lines:
+        return None
+    description = ""
+    for i, line in enumerate(lines):
+        if len(description) + len(line) + 1 > limit:
+            description += f"... and {len(lines) - i} more."
+            break
+        description += line + "\n"
+    embed = discord.Embed(title=title, description=description, color=color or discord.Color.dark_red())
+    return await send_message(ctx, embed=embed)
 
-    await channel.send(content=content, embed=embed, view=view, suppress_embeds=suppress_embeds)
-    
 def is_duplicate(track, queues):
     track_url = track.get("webpage_url")
     if not track_url:
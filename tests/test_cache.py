@@ -0,0 +1,25 @@
+import time
+
+from cache import ResponseCache
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")  # a is now the most recently used
+    cache.put("c", 3)
+    assert set(cache.memory) == {"a", "c"}
+
+
+def test_prune_bounds_disk_tier_by_age_and_count(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_age=60, max_disk_entries=3)
+    now = time.time()
+    for i in range(5):
+        cache.put(f"k{i}", i)
+        cache.conn.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (now + i, f"k{i}"))
+    cache.conn.execute("UPDATE responses SET stored_at = ? WHERE key = 'k4'", (now - 120,))
+    cache.prune()
+    keys = {row[0] for row in cache.conn.execute("SELECT key FROM responses")}
+    # k4 expired; of the rest only the 3 newest are kept
+    assert keys == {"k1", "k2", "k3"}
@@ -0,0 +1,101 @@
+import os
+
+import pandas as pd
+import pytest
+
+import logger as logger_module
+from logger import LEGACY_FILE, Logger, join_log, migrate_log, read_log, split_log
+
+
+def track(n, title=None):
+    return {"webpage_url": f"https://example.com/{n}", "title": title or f"Track {n}", "duration": n}
+
+
+def legacy_log():
+    return pd.DataFrame({
+        "title": ["A", "B", "A (remaster)", "C"],
+        "url": ["https://a", "https://b", "https://a", "https://c"],
+        "requester_id": [1, 2, 3, 1],
+        "genre": ["x", None, "x", "y"],
+        "upload_date": ["2020-01-01", None, "2020-01-01", "2021-06-30"],
+        "duration": [60.0, 120.0, 61.0, None],
+        "played_at": pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"]),
+    })
+
+
+def test_split_log_round_trip():
+    df = legacy_log()
+    plays, tracks = split_log(df)
+    assert tracks["track_id"].tolist() == [0, 1, 2]
+    assert plays["track_id"].tolist() == [0, 1, 0, 2]
+    # one row per URL, carrying the metadata of its latest play
+    assert tracks["title"].tolist() == ["A (remaster)", "B", "C"]
+    joined = join_log(plays, tracks)
+    assert joined["url"].tolist() == df["url"].tolist()
+    assert joined["requester_id"].tolist() == df["requester_id"].tolist()
+    assert joined["played_at"].tolist() == df["played_at"].tolist()
+
+
+def test_migrate_log(tmp_path):
+    log_dir = str(tmp_path)
+    legacy_log().to_parquet(os.path.join(log_dir, LEGACY_FILE), index=False)
+
+    stats = migrate_log(log_dir)
+    assert (stats["plays"], stats["tracks"]) == (4, 3)
+    assert not os.path.exists(os.path.join(log_dir, LEGACY_FILE))
+    assert os.path.exists(os.path.join(log_dir, LEGACY_FILE + ".migrated"))
+    plays, tracks = read_log(log_dir)
+    assert join_log(plays, tracks)["url"].tolist() == legacy_log()["url"].tolist()
+    assert migrate_log(log_dir) is None
+
+
+def test_batches_assign_dense_track_ids(tmp_path):
+    log = Logger(str(tmp_path))
+    log.log_track(track(0), requester_id=1)
+    log.log_tracks([track(1), track(0), track(2)], requester_id=2).result()
+    # a second process sees the IDs through the files
+    other = Logger(str(tmp_path))
+    other.log_tracks([track(2), track(3)], requester_id=3).result()
+
+    plays, tracks = read_log(str(tmp_path))
+    assert tracks["track_id"].tolist() == [0, 1, 2, 3]
+    assert tracks["url"].tolist() == [f"https://example.com/{n}" for n in range(4)]
+    assert plays["track_id"].tolist() == [0, 1, 0, 2, 2, 3]
+    assert plays["requester_id"].tolist() == [1, 2, 2, 2, 3, 3]
+
+
+def test_write_appends_to_a_legacy_log_after_migrating(tmp_path):
+    log_dir = str(tmp_path)
+    legacy_log().to_parquet(os.path.join(log_dir, LEGACY_FILE), index=False)
+    Logger(log_dir).log_tracks([{"webpage_url": "https://c", "title": "C"}, track(9)], 5).result()
+
+    plays, tracks = read_log(log_dir)
+    assert len(tracks) == 4
+    assert plays["track_id"].tolist() == [0, 1, 0, 2, 2, 3]
+
+
+def test_failed_plays_write_leaves_orphan_tracks_that_are_reused(tmp_path, monkeypatch):
+    log = Logger(str(tmp_path))
+    log.log_track(track(0), requester_id=1)
+
+    write_atomic = logger_module._write_atomic
+
+    def fail_plays(df, path):
+        if path == log.plays_file:
+            raise OSError("disk full")
+        write_atomic(df, path)
+
+    monkeypatch.setattr(logger_module, "_write_atomic", fail_plays)
+    with pytest.raises(OSError):
+        log.log_track(track(1), requester_id=1)
+    monkeypatch.setattr(logger_module, "_write_atomic", write_atomic)
+
+    plays, tracks = read_log(str(tmp_path))
+    assert tracks["track_id"].tolist() == [0, 1]  # track 1 is an orphan
+    assert plays["track_id"].tolist() == [0]
+    assert join_log(plays, tracks)["url"].tolist() == ["https://example.com/0"]
+
+    log.log_tracks([track(1), track(2)], requester_id=1).result()
+    plays, tracks = read_log(str(tmp_path))
+    assert tracks["track_id"].tolist() == [0, 1, 2]
+    assert plays["track_id"].tolist() == [0, 1, 2]
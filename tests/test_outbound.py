@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from metrics import ERRORS_TOTAL
+from outbound import OutboundDispatcher
+
+
+class FakeChannel:
+    def __init__(self, id=1, fail=False):
+        self.id = id
+        self.fail = fail
+        self.sent = []
+
+    async def send(self, **kwargs):
+        if self.fail:
+            raise RuntimeError("boom")
+        self.sent.append(kwargs)
+        return len(self.sent)
+
+
+def test_queued_text_is_merged_and_other_messages_keep_their_order():
+    async def scenario():
+        channel = FakeChannel()
+        dispatcher = OutboundDispatcher(rate=100)
+        futures = [
+            dispatcher.submit(channel, content="a"),
+            dispatcher.submit(channel, content="b"),
+            dispatcher.submit(channel, content=None, embed="embed"),
+            dispatcher.submit(channel, content="c"),
+        ]
+        await asyncio.gather(*futures)
+        return channel.sent
+
+    sent = asyncio.run(scenario())
+    assert [(m["content"], m.get("embed")) for m in sent] == [
+        ("a\nb", None), (None, "embed"), ("c", None)]
+
+
+def test_send_failures_are_reported_by_the_worker():
+    async def scenario():
+        dispatcher = OutboundDispatcher(rate=100)
+        future = dispatcher.submit(FakeChannel(fail=True), content="a")
+        with pytest.raises(RuntimeError):
+            await future
+
+    before = ERRORS_TOTAL.value(where="message_send")
+    asyncio.run(scenario())
+    assert ERRORS_TOTAL.value(where="message_send") == before + 1
@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+from reaper import IdleReaper
+
+
+class FakeProcess:
+    def __init__(self, returncode):
+        self.returncode = returncode
+
+    def poll(self):
+        raise AssertionError("poll() would reap the process before its CPU time is read")
+
+
+class FakeSource:
+    def __init__(self, returncode):
+        self.original = SimpleNamespace(_process=FakeProcess(returncode))
+        self.cleanups = 0
+
+    def cleanup(self):
+        self.cleanups += 1
+
+
+def reap(source):
+    player = SimpleNamespace(
+        lock=asyncio.Lock(), last_used=0.0, active=0, source=source,
+        guild=SimpleNamespace(voice_client=None), save_state=lambda: None, _play_token=object(),
+    )
+    players = {1: player}
+    reaper = IdleReaper(SimpleNamespace(voice_clients=[]), players, idle_after=0)
+    reclaimed = asyncio.run(reaper.sweep())
+    return reclaimed, players, player
+
+
+def test_running_ffmpeg_is_cleaned_up_and_counted():
+    source = FakeSource(returncode=None)
+    reclaimed, players, player = reap(source)
+    assert reclaimed == {"voice": 0, "player": 1, "ffmpeg": 1}
+    assert source.cleanups == 1
+    assert players == {} and player.source is None
+
+
+def test_exited_ffmpeg_is_still_cleaned_up_without_polling():
+    source = FakeSource(returncode=0)
+    reclaimed, _, _ = reap(source)
+    assert reclaimed["ffmpeg"] == 0
+    assert source.cleanups == 1
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import pytest
+
+
+@pytest.fixture
+def music(tmp_path, monkeypatch):
+    # importing music opens its stores in the working directory
+    monkeypatch.chdir(tmp_path)
+    import music
+
+    return music
+
+
+class StubExtractor:
+    """Stands in for yt-dlp: each search prefix answers after a delay."""
+
+    def __init__(self, **answers):
+        self.answers = answers  # prefix -> (delay, result or exception)
+        self.calls = []
+
+    def extract_info(self, query, download=False):
+        prefix = query.split(":", 1)[0]
+        self.calls.append(prefix)
+        delay, answer = self.answers[prefix]
+        time.sleep(delay)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def found(name):
+    return {"entries": [{"webpage_url": f"https://example.com/{name}", "title": name}]}
+
+
+EMPTY = {"entries": []}
+
+
+def run_search(music, monkeypatch, extractor, query, **kwargs):
+    monkeypatch.setattr(music, "search_ytdl", extractor)
+    kwargs = {"hedge_after": 0.1, "timeout": 1.0, "backup": "scsearch1", **kwargs}
+
+    async def scenario():
+        started = time.perf_counter()
+        result = await music.search(query, **kwargs)
+        return result, time.perf_counter() - started
+
+    return asyncio.run(scenario())
+
+
+def test_fast_primary_does_not_hedge(music, monkeypatch):
+    extractor = StubExtractor(ytsearch1=(0, found("yt")), scsearch1=(0, found("sc")))
+    result, _ = run_search(music, monkeypatch, extractor, "fast song")
+    assert result["entries"][0]["title"] == "yt"
+    assert extractor.calls == ["ytsearch1"]
+
+
+def test_slow_primary_is_hedged_and_backup_wins(music, monkeypatch):
+    extractor = StubExtractor(ytsearch1=(0.5, found("yt")), scsearch1=(0, found("sc")))
+    result, elapsed = run_search(music, monkeypatch, extractor, "slow song")
+    assert result["entries"][0]["title"] == "sc"
+    assert extractor.calls == ["ytsearch1", "scsearch1"]
+    assert elapsed < 0.5
+
+
+def test_failed_primary_hedges_at_once(music, monkeypatch):
+    extractor = StubExtractor(ytsearch1=(0, RuntimeError("blocked")), scsearch1=(0, found("sc")))
+    result, elapsed = run_search(music, monkeypatch, extractor, "failing song", hedge_after=5)
+    assert result["entries"][0]["title"] == "sc"
+    assert elapsed < 1
+
+
+def test_first_non_empty_result_wins(music, monkeypatch):
+    # the backup answers first but with nothing; the slower primary still counts
+    extractor = StubExtractor(ytsearch1=(0.3, found("yt")), scsearch1=(0, EMPTY))
+    result, _ = run_search(music, monkeypatch, extractor, "rare song")
+    assert result["entries"][0]["title"] == "yt"
+
+
+def test_no_results_anywhere(music, monkeypatch):
+    extractor = StubExtractor(ytsearch1=(0, EMPTY), scsearch1=(0, EMPTY))
+    with pytest.raises(ValueError):
+        run_search(music, monkeypatch, extractor, "nothing")
+
+
+def test_times_out_when_every_attempt_is_slow(music, monkeypatch):
+    extractor = StubExtractor(ytsearch1=(0.6, found("yt")), scsearch1=(0.6, found("sc")))
+    with pytest.raises(TimeoutError):
+        run_search(music, monkeypatch, extractor, "stuck song", timeout=0.3)
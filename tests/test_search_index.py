@@ -0,0 +1,38 @@
+from search_index import SearchIndex
+
+
+def track(title, n):
+    return {"webpage_url": f"https://example.com/{n}", "title": title}
+
+
+def test_resolve_matches_folded_title(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    index.add([track("Beyoncé - Halo (Official Video)", 1)])
+    info = index.resolve("beyonce halo")
+    assert info["webpage_url"] == "https://example.com/1"
+
+
+def test_resolve_requires_coverage(tmp_path):
+    index = SearchIndex(str(tmp_path), min_coverage=0.6)
+    index.add([track("Daft Punk - Harder Better Faster Stronger", 1)])
+    # 2 of 6 significant title tokens
+    assert index.resolve("daft punk") is None
+    assert index.resolve("daft punk harder better faster") is not None
+
+
+def test_resolve_prefers_coverage_then_plays(tmp_path):
+    index = SearchIndex(str(tmp_path), min_coverage=0.5)
+    index.add([track("Song Remix", 1), track("Song", 2), track("Song", 3)])
+    index.add([track("Song", 3)])
+    assert index.resolve("song")["webpage_url"] == "https://example.com/3"
+
+
+def test_bm25_keeps_close_titles_within_the_candidate_limit(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    # more than the 50 candidates resolve() considers, all played more often
+    # than the exact title and all too loosely covered by the query
+    noisy = [track(f"Night Drive extended mix part {i}", i) for i in range(60)]
+    for _ in range(3):
+        index.add(noisy)
+    index.add([track("Night Drive", 100)])
+    assert index.resolve("night drive")["webpage_url"] == "https://example.com/100"
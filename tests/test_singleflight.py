@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class Work:
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.started += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            # unwinding takes a few loop iterations, like real cleanup would
+            for _ in range(3):
+                await asyncio.sleep(0)
+            raise
+        return self.started
+
+
+def test_cancelled_waiter_leaves_the_work_to_the_others():
+    async def scenario():
+        flight, work = SingleFlight("test"), Work()
+        first = asyncio.create_task(flight.do("k", work))
+        second = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        work.release.set()
+        assert await second == 1
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert (work.started, work.cancelled) == (1, 0)
+
+    asyncio.run(scenario())
+
+
+def test_last_waiter_cancelled_cancels_the_work():
+    async def scenario():
+        flight, work = SingleFlight("test"), Work()
+        waiter = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert work.cancelled == 1
+        assert flight.calls == {}
+
+    asyncio.run(scenario())
+
+
+def test_caller_after_cancel_starts_new_work():
+    async def scenario():
+        flight, work = SingleFlight("test"), Work()
+        waiter = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # the cancelled task has not finished unwinding yet
+        fresh = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        work.release.set()
+        assert await fresh == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,112 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from logger import PLAYS_FILE, TRACKS_FILE, split_log
+from sketches import HyperLogLog, SketchStore, SpaceSaving, sketches_ready
+
+
+def _zipf_stream(n, keys, seed):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, keys + 1)]
+    return [f"k{i}" for i in rng.choices(range(keys), weights=weights, k=n)]
+
+
+def _summarize(stream, capacity):
+    summary = SpaceSaving(capacity)
+    for key in stream:
+        summary.add(key)
+    return summary
+
+
+def test_space_saving_merge_bounds():
+    capacity = 50
+    first, second = _zipf_stream(4000, 500, seed=1), _zipf_stream(6000, 500, seed=2)
+    merged = _summarize(first, capacity)
+    merged.merge(_summarize(second, capacity))
+
+    true = Counter(first + second)
+    bound = (len(first) + len(second)) / capacity
+    assert len(merged.counts) <= capacity
+    for key, count, error in merged.top():
+        assert count - error <= true[key] <= count
+        assert count - true[key] <= bound
+    # anything heavier than the bound is listed
+    heavy = {key for key, count in true.items() if count > bound}
+    assert heavy and heavy <= set(merged.counts)
+
+
+@pytest.mark.parametrize("distinct", [0, 10, 1000, 5000, 50000])
+def test_hyperloglog_count_within_error(distinct):
+    hll = HyperLogLog()
+    for i in range(distinct):
+        hll.add(f"https://example.com/track/{i}")
+    # 3 standard errors of 1.04 / sqrt(4096)
+    assert abs(hll.count() - distinct) <= 0.05 * distinct
+
+
+def test_hyperloglog_merge_is_union():
+    left, right, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        key = f"key{i}"
+        (left if i < 2000 else right).add(key)
+        both.add(key)
+    left.merge(right)
+    assert left.registers == both.registers
+
+
+def _rows():
+    """Logger rows: string upload dates, missing and empty genres, repeat tracks."""
+    rng = random.Random(7)
+    tracks = [
+        {"url": f"https://example.com/{i}", "title": f"Song {i}",
+         "genre": ["breakcore", "jungle", "", None][i % 4],
+         "upload_date": None if i % 5 == 0 else f"{2010 + i % 12}-03-0{1 + i % 9}",
+         "duration": None if i % 7 == 0 else 60.0 + i}
+        for i in range(40)
+    ]
+    start = datetime(2024, 1, 30, 22)
+    return [
+        {**rng.choice(tracks), "requester_id": rng.choice([1, 2, 3, 10**17]),
+         "played_at": start + timedelta(minutes=47 * n)}
+        for n in range(300)
+    ]
+
+
+def _contents(store):
+    return {
+        table: sorted(store.conn.execute(f"SELECT * FROM {table}").fetchall())
+        for table in ("counters", "registers", "totals")
+    }
+
+
+def test_backfill_and_live_adds_agree(tmp_path):
+    rows = _rows()
+
+    backfilled = tmp_path / "backfilled"
+    backfilled.mkdir()
+    plays, tracks = split_log(pd.DataFrame(rows))
+    plays.to_parquet(backfilled / PLAYS_FILE, index=False)
+    tracks.to_parquet(backfilled / TRACKS_FILE, index=False)
+    from_log = SketchStore(str(backfilled))
+    assert from_log.backfill() == len(rows)
+
+    live = tmp_path / "live"
+    live.mkdir()
+    from_adds = SketchStore(str(live))
+    assert from_adds.backfill() == 0  # empty log: ready, nothing counted
+    for row in rows:
+        from_adds.add(row)
+
+    assert _contents(from_log) == _contents(from_adds)
+    assert sketches_ready(str(live))
+    from_log.close()
+    from_adds.close()
+
+
+def test_sketches_ready_creates_nothing(tmp_path):
+    assert not sketches_ready(str(tmp_path))
+    assert not list(tmp_path.iterdir())